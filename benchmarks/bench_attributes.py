@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import START_DATE, create_instance
+
+from test_app.models import TestDynamoModel, TestStringJoinDynamoModel
+
+from pydjamodb.attributes import lazy_deserialization
+
+
+STRING_JOIN_VALUE = ('value||with||separator', 123456, 'value\\with\\escape')
+
+
+def bench_string_join_serialize(benchmark):
+    attribute = TestStringJoinDynamoModel.key
+    benchmark(attribute.serialize, STRING_JOIN_VALUE)
+
+
+def bench_string_join_deserialize(benchmark):
+    attribute = TestStringJoinDynamoModel.key
+    serialized_value = attribute.serialize(STRING_JOIN_VALUE)
+    assert benchmark(attribute.deserialize, serialized_value) == list(STRING_JOIN_VALUE)
+
+
+@pytest.mark.parametrize('size', [100, 10000])
+def bench_compressed_json_serialize(benchmark, size):
+    benchmark(TestDynamoModel.data.serialize, {'values': list(range(size))})
+
+
+@pytest.mark.parametrize('size', [100, 10000])
+def bench_compressed_json_deserialize(benchmark, size):
+    attribute = TestDynamoModel.data
+    serialized_value = attribute.serialize({'values': list(range(size))})
+
+    def deserialize():
+        # Compressed value is decompressed on the first access
+        return attribute._decode_value(attribute._decompress(attribute.deserialize(serialized_value).data))
+
+    assert benchmark(deserialize) == {'values': list(range(size))}
+
+
+def bench_model_serialize(benchmark):
+    instance = create_instance(1)
+    benchmark(instance.serialize)
+
+
+def bench_model_deserialize(benchmark):
+    raw_item = create_instance(1).serialize()
+    benchmark(TestDynamoModel.from_raw_data, raw_item)
+
+
+def bench_model_lazy_deserialize(benchmark):
+    raw_item = create_instance(1).serialize()
+
+    def deserialize():
+        with lazy_deserialization():
+            return TestDynamoModel.from_raw_data(raw_item)
+
+    benchmark(deserialize)
+
+
+def bench_model_instantiation(benchmark):
+    benchmark(
+        TestDynamoModel, id='benchmark', date=START_DATE, string='benchmark', number=1, bool=True,
+        data={'values': [1, 2, 3]}
+    )
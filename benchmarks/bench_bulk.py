@@ -0,0 +1,58 @@
+import pytest
+
+from conftest import create_instance, write_instances
+
+from test_app.models import TestDynamoModel
+
+from pydjamodb.buffer import buffered_writes
+from pydjamodb.transaction import atomic
+
+
+@pytest.mark.parametrize('count', [25, 500])
+def bench_batch_write(benchmark, clean_tables, count):
+    instances = [create_instance(i) for i in range(count)]
+    benchmark(write_instances, instances)
+    assert TestDynamoModel.objects.set_hash_key('benchmark').count() == count
+
+
+def bench_buffered_save(benchmark, clean_tables):
+    instances = [create_instance(i) for i in range(500)]
+
+    def save_instances():
+        with buffered_writes():
+            for instance in instances:
+                instance.save()
+
+    benchmark(save_instances)
+    assert TestDynamoModel.objects.set_hash_key('benchmark').count() == len(instances)
+
+
+def bench_save(benchmark, clean_tables):
+    instances = [create_instance(i) for i in range(100)]
+
+    def save_instances():
+        for instance in instances:
+            instance.save()
+
+    benchmark(save_instances)
+
+
+def bench_atomic_save(benchmark, clean_tables):
+    instances = [create_instance(i) for i in range(100)]
+
+    def save_instances():
+        with atomic():
+            for instance in instances:
+                instance.save()
+
+    benchmark(save_instances)
+
+
+def bench_queryset_delete(benchmark, clean_tables):
+    instances = [create_instance(i) for i in range(500)]
+    benchmark.pedantic(
+        lambda: TestDynamoModel.objects.set_hash_key('benchmark').delete(),
+        setup=lambda: write_instances(instances),
+        rounds=10
+    )
+    assert TestDynamoModel.objects.set_hash_key('benchmark').count() == 0
@@ -0,0 +1,50 @@
+import pytest
+
+from test_app.models import TestDynamoModel
+
+
+@pytest.mark.parametrize('limit', [10, 100, 1000])
+def bench_queryset_iteration(benchmark, partition, limit):
+    result = benchmark(lambda: list(TestDynamoModel.objects.set_hash_key('partition').set_limit(limit)))
+    assert len(result) == limit
+
+
+def bench_queryset_lazy_iteration(benchmark, partition):
+    result = benchmark(lambda: list(TestDynamoModel.objects.set_hash_key('partition').lazy()))
+    assert len(result) == len(partition)
+
+
+def bench_queryset_raw_iteration(benchmark, partition):
+    result = benchmark(lambda: list(TestDynamoModel.objects.set_hash_key('partition').raw()))
+    assert len(result) == len(partition)
+
+
+def bench_queryset_columnar_raw_iteration(benchmark, partition):
+    result = benchmark(lambda: list(TestDynamoModel.objects.set_hash_key('partition').raw(columnar=True)))
+    assert sum(len(columns['number']) for columns in result) == len(partition)
+
+
+def bench_index_queryset_iteration(benchmark, partition):
+    result = benchmark(lambda: list(TestDynamoModel.objects_string_number.set_hash_key('benchmark 1')))
+    assert len(result) == 1
+
+
+def bench_queryset_count(benchmark, partition):
+    assert benchmark(lambda: TestDynamoModel.objects.set_hash_key('partition').count()) == len(partition)
+
+
+def bench_queryset_filtered_count(benchmark, partition):
+    assert benchmark(
+        lambda: TestDynamoModel.objects.set_hash_key('partition').filter(date__gte=partition[500].date).count()
+    ) == 500
+
+
+def bench_queryset_exists(benchmark, partition):
+    assert benchmark(lambda: TestDynamoModel.objects.set_hash_key('partition').exists())
+
+
+def bench_queryset_get(benchmark, partition):
+    instance = partition[500]
+    assert benchmark(
+        lambda: TestDynamoModel.objects.set_hash_key('partition').get(date=instance.date)
+    ) == instance
@@ -0,0 +1,36 @@
+from test_app.models import TestDynamoModel, TestStringJoinDynamoModel
+
+from pydjamodb.test_runner import (
+    get_test_connection, recreate_pynamodb_tables, remove_pynamodb_tables, setup_kept_pynamodb_tables
+)
+
+
+# Benchmarks use the fixed list of models, results are not changed with new models of the test application
+MODEL_CLASSES = (TestDynamoModel, TestStringJoinDynamoModel)
+
+
+def get_model_connections(workers=4):
+    return [
+        (model_class, get_test_connection(model_class, 'benchmark_runner_{}'.format(worker)))
+        for worker in range(workers) for model_class in MODEL_CLASSES
+    ]
+
+
+def bench_recreate_and_remove_tables(benchmark):
+    model_connections = get_model_connections()
+
+    def recreate_and_remove_tables():
+        recreate_pynamodb_tables(model_connections)
+        remove_pynamodb_tables(model_connections)
+
+    benchmark(recreate_and_remove_tables)
+
+
+def bench_setup_kept_tables(benchmark):
+    model_connections = get_model_connections()
+    recreate_pynamodb_tables(model_connections)
+    try:
+        reused_model_connections, _ = benchmark(setup_kept_pynamodb_tables, model_connections)
+        assert len(reused_model_connections) == len(model_connections)
+    finally:
+        remove_pynamodb_tables(model_connections)
@@ -0,0 +1,73 @@
+import os
+import sys
+
+from datetime import datetime, timedelta, timezone
+
+import django
+import pytest
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+
+# Benchmarks are run against the in-memory backend by default, empty value selects the DynamoDB endpoint from
+# the test project settings (e.g. DynamoDB local)
+os.environ.setdefault('PYDJAMODB_BACKEND', 'pydjamodb.memory.MemoryConnection')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_project.settings')
+django.setup()
+
+
+from test_app.models import TestDynamoModel  # noqa: E402
+
+from pydjamodb.models import dynamodb_model_classes  # noqa: E402
+from pydjamodb.test_runner import (  # noqa: E402
+    get_test_connection, init_pynamodb_test_prefix, recreate_pynamodb_tables, remove_pynamodb_tables
+)
+from pydjamodb.utils import batch_write_items  # noqa: E402
+
+
+START_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def create_instance(i, id='benchmark', **kwargs):
+    data = dict(
+        id=id,
+        date=START_DATE + timedelta(seconds=i),
+        string='benchmark {}'.format(i),
+        number=i,
+        bool=bool(i % 2),
+        data={'index': i, 'values': list(range(10))}
+    )
+    data.update(kwargs)
+    return TestDynamoModel(**data)
+
+
+def write_instances(instances):
+    batch_write_items(TestDynamoModel._get_connection(), put_items=[instance.serialize() for instance in instances])
+
+
+@pytest.fixture(scope='session')
+def dynamodb_tables():
+    model_connections = [
+        (model_class, get_test_connection(model_class, 'benchmark')) for model_class in dynamodb_model_classes
+    ]
+    recreate_pynamodb_tables(model_connections)
+    init_pynamodb_test_prefix('benchmark')
+    yield
+    remove_pynamodb_tables(model_connections)
+
+
+@pytest.fixture(scope='session')
+def partition(dynamodb_tables):
+    """
+    Partition with 1000 items shared by the read benchmarks.
+    """
+    instances = [create_instance(i, id='partition') for i in range(1000)]
+    write_instances(instances)
+    return instances
+
+
+@pytest.fixture
+def clean_tables(dynamodb_tables):
+    yield
+    for model_class in dynamodb_model_classes:
+        model_class._get_connection().post_test_clean(model_class)
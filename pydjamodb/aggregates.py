@@ -0,0 +1,460 @@
+import logging
+
+from collections import defaultdict
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+
+from pynamodb.attributes import NumberAttribute, UnicodeAttribute
+from pynamodb.constants import BINARY, BOOLEAN, ITEM, NULL, NUMBER, STRING
+from pynamodb.exceptions import UpdateError
+from pynamodb.expressions.operand import Path, Value
+
+from .attributes import StringJoinAttribute
+from .utils import batch_write_items
+
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_KEY_SEPARATOR = '||'
+
+CONDITIONAL_CHECK_FAILED_EXCEPTION = 'ConditionalCheckFailedException'
+
+# Stored min/max value is replaced with NULL if the item with this value is changed or removed, the value is
+# recomputed from the items with the next read
+STALE_VALUE = {NULL: True}
+
+# Suffix of the min/max version attribute, version is increased with every change of the aggregated values and
+# recomputed value is stored only if the version was not changed during the recomputation
+VERSION_SUFFIX = '__version'
+
+# Attribute of the aggregate item which marks all its aggregates as stale (aggregates were not updated after the
+# item was written), aggregates are computed from the items until they are rebuilt
+STALE_ATTRIBUTE = '__stale'
+
+
+class DynamoDBAggregateError(Exception):
+    pass
+
+
+class Aggregate:
+    """
+    Aggregate of the items with the same hash key. Aggregates of the model Meta.aggregates are precomputed
+    for every hash key, if range_key_prefix is set, they are precomputed for every group of items with the same
+    first range_key_prefix values of the StringJoinAttribute range key. Items removed by DynamoDB TTL are not
+    subtracted from the precomputed aggregates.
+    """
+
+    function = None
+    additive = False
+    empty_value = None
+
+    def __init__(self, attr_name=None, range_key_prefix=0):
+        self.attr_name = attr_name
+        self.range_key_prefix = range_key_prefix
+
+    @property
+    def name(self):
+        return self.function if self.attr_name is None else '{}__{}'.format(self.attr_name, self.function)
+
+    def matches(self, aggregate, range_key_prefix):
+        return (
+            type(self) is type(aggregate) and self.attr_name == aggregate.attr_name
+            and self.range_key_prefix == range_key_prefix
+        )
+
+    def get_attribute(self, model_class):
+        return model_class.get_attributes()[self.attr_name]
+
+    def validate(self, model_class):
+        if self.attr_name is not None and self.attr_name not in model_class.get_attributes():
+            raise ImproperlyConfigured('Aggregated attribute "{}" of the model "{}" does not exist'.format(
+                self.attr_name, model_class.__name__
+            ))
+        if self.range_key_prefix and not isinstance(model_class._range_key_attribute(), StringJoinAttribute):
+            raise ImproperlyConfigured(
+                'Aggregates with range key prefix require StringJoinAttribute range key of the model "{}"'.format(
+                    model_class.__name__
+                )
+            )
+
+    def get_raw_value(self, model_class, item):
+        value = item.get(self.get_attribute(model_class).attr_name) if item else None
+        return None if value is None or NULL in value else value
+
+    def get_item_value(self, model_class, item):
+        raise NotImplementedError
+
+    def combine(self, value, item_value):
+        raise NotImplementedError
+
+    def serialize(self, model_class, value):
+        raise NotImplementedError
+
+    def deserialize(self, model_class, raw_value):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.attr_name)
+
+
+class AdditiveAggregate(Aggregate):
+    """
+    Aggregate stored as a number which is changed with the atomic ADD action.
+    """
+
+    additive = True
+    empty_value = 0
+
+    def combine(self, value, item_value):
+        return value + item_value
+
+    def serialize(self, model_class, value):
+        return {NUMBER: NumberAttribute().serialize(value)}
+
+    def deserialize(self, model_class, raw_value):
+        return NumberAttribute().deserialize(raw_value[NUMBER])
+
+
+class Count(AdditiveAggregate):
+    """
+    Number of the items or number of the items with the not null attribute.
+    """
+
+    function = 'count'
+
+    def get_item_value(self, model_class, item):
+        if not item:
+            return 0
+        return int(self.attr_name is None or self.get_raw_value(model_class, item) is not None)
+
+
+class Sum(AdditiveAggregate):
+
+    function = 'sum'
+
+    def validate(self, model_class):
+        super().validate(model_class)
+        if self.get_attribute(model_class).attr_type != NUMBER:
+            raise ImproperlyConfigured('Sum requires number attribute, "{}" is not a number'.format(self.attr_name))
+
+    def get_item_value(self, model_class, item):
+        raw_value = self.get_raw_value(model_class, item)
+        return 0 if raw_value is None else self.deserialize(model_class, raw_value)
+
+
+class ExtremeAggregate(Aggregate):
+    """
+    Aggregate stored as the serialized attribute value which is replaced with the conditional SET action.
+    """
+
+    @property
+    def version_name(self):
+        return '{}{}'.format(self.name, VERSION_SUFFIX)
+
+    def is_before(self, value, other_value):
+        raise NotImplementedError
+
+    def get_replace_condition(self, path, value):
+        raise NotImplementedError
+
+    def validate(self, model_class):
+        if self.attr_name is None:
+            raise ImproperlyConfigured('{} requires attribute name'.format(self.__class__.__name__))
+        super().validate(model_class)
+        if self.get_attribute(model_class).attr_type not in {STRING, NUMBER, BINARY}:
+            raise ImproperlyConfigured(
+                '{} requires string, number or binary attribute'.format(self.__class__.__name__)
+            )
+
+    def get_item_value(self, model_class, item):
+        raw_value = self.get_raw_value(model_class, item)
+        return None if raw_value is None else self.deserialize(model_class, raw_value)
+
+    def combine(self, value, item_value):
+        if item_value is not None and (value is None or self.is_before(item_value, value)):
+            return item_value
+        return value
+
+    def serialize(self, model_class, value):
+        attribute = self.get_attribute(model_class)
+        return None if value is None else {attribute.attr_type: attribute.serialize(value)}
+
+    def deserialize(self, model_class, raw_value):
+        attribute = self.get_attribute(model_class)
+        return attribute.deserialize(attribute.get_value(raw_value))
+
+
+class Min(ExtremeAggregate):
+
+    function = 'min'
+
+    def is_before(self, value, other_value):
+        return value < other_value
+
+    def get_replace_condition(self, path, value):
+        return path > value
+
+
+class Max(ExtremeAggregate):
+
+    function = 'max'
+
+    def is_before(self, value, other_value):
+        return value > other_value
+
+    def get_replace_condition(self, path, value):
+        return path < value
+
+
+@lru_cache(maxsize=None)
+def get_aggregate_model_class():
+    """
+    Returns model of the table with precomputed aggregates. The model is registered with the first model
+    which defines Meta.aggregates, therefore the table is not required if aggregates are not used.
+    """
+    from .models import DynamoModel
+
+    class DynamoAggregateModel(DynamoModel):
+
+        key = UnicodeAttribute(hash_key=True)
+        group = UnicodeAttribute(range_key=True)
+
+        class Meta:
+            table_name = 'pydjamodbaggregate'
+
+    return DynamoAggregateModel
+
+
+def get_model_aggregates(model_class):
+    return tuple(getattr(model_class.Meta, 'aggregates', ()))
+
+
+def validate_model_aggregates(model_class):
+    names = set()
+    for aggregate in get_model_aggregates(model_class):
+        aggregate.validate(model_class)
+        if (aggregate.range_key_prefix, aggregate.name) in names:
+            raise ImproperlyConfigured('Aggregate "{}" of the model "{}" is defined more times'.format(
+                aggregate.name, model_class.__name__
+            ))
+        names.add((aggregate.range_key_prefix, aggregate.name))
+
+
+def _get_aggregate_key(model_class, serialized_hash_key, range_key_prefix):
+    range_key_prefix = tuple(range_key_prefix)
+    return (
+        '{}{}{}'.format(model_class.Meta.table_name, AGGREGATE_KEY_SEPARATOR, serialized_hash_key),
+        '{}{}{}'.format(
+            len(range_key_prefix), AGGREGATE_KEY_SEPARATOR,
+            model_class._range_key_attribute().serialize(range_key_prefix) if range_key_prefix else ''
+        )
+    )
+
+
+def _get_item_aggregate_key(model_class, item, range_key_prefix):
+    hash_key_attribute = model_class._hash_key_attribute()
+    values = ()
+    if range_key_prefix:
+        range_key_attribute = model_class._range_key_attribute()
+        values = range_key_attribute.deserialize(
+            range_key_attribute.get_value(item[range_key_attribute.attr_name])
+        )[:range_key_prefix]
+    return _get_aggregate_key(
+        model_class, hash_key_attribute.get_value(item[hash_key_attribute.attr_name]), values
+    )
+
+
+def _group_aggregates(aggregates):
+    grouped_aggregates = defaultdict(list)
+    for aggregate in aggregates:
+        grouped_aggregates[aggregate.range_key_prefix].append(aggregate)
+    return grouped_aggregates
+
+
+def _update_aggregate_item(key, actions, condition=None):
+    try:
+        get_aggregate_model_class()._get_connection().update_item(*key, actions=actions, condition=condition)
+    except UpdateError as ex:
+        if ex.cause_response_code != CONDITIONAL_CHECK_FAILED_EXCEPTION:
+            raise
+
+
+def update_aggregates(model_class, old_item, new_item):
+    """
+    Updates precomputed aggregates with the change of the serialized item (old_item is None for the created
+    item and new_item is None for the removed item). Counts and sums are changed with the atomic ADD action.
+    Min and max are replaced only if the stored value is not before the new one, if the item with the stored
+    value is changed or removed, the value is marked as stale. Version of min/max is increased with every change
+    of the aggregated value before the value is replaced, therefore the concurrently recomputed value is not stored.
+    Item and aggregates are not written atomically, if the update fails, all aggregates of the key are marked as
+    stale until they are rebuilt.
+    """
+    item = new_item or old_item
+    if not item:
+        return
+
+    for range_key_prefix, aggregates in _group_aggregates(get_model_aggregates(model_class)).items():
+        key = _get_item_aggregate_key(model_class, item, range_key_prefix)
+        additive_actions, conditional_updates = [], []
+        for aggregate in aggregates:
+            old_value = aggregate.get_item_value(model_class, old_item)
+            new_value = aggregate.get_item_value(model_class, new_item)
+            if new_value == old_value:
+                continue
+
+            path = Path(aggregate.name)
+            if aggregate.additive:
+                additive_actions.append(path.add(new_value - old_value))
+                continue
+
+            additive_actions.append(Path(aggregate.version_name).add(1))
+            if new_value is not None and (old_value is None or aggregate.is_before(new_value, old_value)):
+                value = Value(aggregate.serialize(model_class, new_value))
+                conditional_updates.append(
+                    (path.set(value), path.does_not_exist() | aggregate.get_replace_condition(path, value))
+                )
+            elif old_value is not None and (new_value is None or aggregate.is_before(old_value, new_value)):
+                conditional_updates.append(
+                    (path.set(Value(STALE_VALUE)), path == Value(aggregate.serialize(model_class, old_value)))
+                )
+
+        try:
+            if additive_actions:
+                _update_aggregate_item(key, additive_actions)
+            for action, condition in conditional_updates:
+                _update_aggregate_item(key, [action], condition)
+        except Exception:
+            # Item is already written, aggregates are marked as stale instead of raising the error
+            logger.exception('Update of the DynamoDB aggregates failed')
+            _mark_aggregates_stale(key)
+
+
+def _mark_aggregates_stale(key):
+    try:
+        _update_aggregate_item(key, [Path(STALE_ATTRIBUTE).set(Value({BOOLEAN: True}))])
+    except Exception:
+        logger.exception('DynamoDB aggregates cannot be marked as stale, they have to be rebuilt')
+
+
+def _get_matched_aggregates(model_class, aggregates, range_key_prefix):
+    return {
+        name: model_aggregate
+        for name, aggregate in aggregates.items()
+        for model_aggregate in get_model_aggregates(model_class)
+        if model_aggregate.matches(aggregate, len(range_key_prefix))
+    }
+
+
+def get_precomputed_aggregates(model_class, serialized_hash_key, range_key_prefix, aggregates):
+    """
+    Reads values of the aggregates (dict of name and aggregate) precomputed for the hash key and range key prefix
+    with one GetItem request. Returns dict of values and dict of versions of the stale aggregates (required to
+    store the recomputed values). Aggregates which are not precomputed or are stale are missing in the values,
+    all aggregates are missing if the aggregate item does not exist (e.g. items were written without the model)
+    or it is marked as stale.
+    """
+    matched_aggregates = _get_matched_aggregates(model_class, aggregates, range_key_prefix)
+    if not matched_aggregates:
+        return {}, {}
+
+    attributes_to_get = {STALE_ATTRIBUTE}
+    for aggregate in matched_aggregates.values():
+        attributes_to_get.add(aggregate.name)
+        if not aggregate.additive:
+            attributes_to_get.add(aggregate.version_name)
+    item = get_aggregate_model_class()._get_connection().get_item(
+        *_get_aggregate_key(model_class, serialized_hash_key, range_key_prefix),
+        attributes_to_get=list(attributes_to_get)
+    ).get(ITEM)
+    if item is None or STALE_ATTRIBUTE in item:
+        return {}, {}
+
+    values, versions = {}, {}
+    for name, aggregate in matched_aggregates.items():
+        raw_value = item.get(aggregate.name)
+        if raw_value is None:
+            values[name] = aggregate.empty_value
+        elif NULL not in raw_value:
+            values[name] = aggregate.deserialize(model_class, raw_value)
+        else:
+            versions[name] = item.get(aggregate.version_name)
+    return values, versions
+
+
+def store_recomputed_aggregates(model_class, serialized_hash_key, range_key_prefix, aggregates, values, versions):
+    """
+    Stores recomputed values of the stale min/max aggregates. Value is stored only if it is still marked as stale
+    and its version was not changed after the stale value was read (versions are returned with the stale values).
+    """
+    key = _get_aggregate_key(model_class, serialized_hash_key, range_key_prefix)
+    for name, aggregate in _get_matched_aggregates(model_class, aggregates, range_key_prefix).items():
+        if name in versions:
+            path, version_path = Path(aggregate.name), Path(aggregate.version_name)
+            value = values[name]
+            version = versions[name]
+            _update_aggregate_item(
+                key,
+                [path.remove() if value is None else path.set(Value(aggregate.serialize(model_class, value)))],
+                path.is_type(NULL) & (
+                    version_path.does_not_exist() if version is None else version_path == Value(version)
+                )
+            )
+
+
+def rebuild_items_aggregates(model_class, items):
+    """
+    Rebuilds precomputed aggregates of all hash keys of the serialized items (e.g. items written with
+    BatchWriteItem requests).
+    """
+    if not get_model_aggregates(model_class):
+        return
+    hash_key_attribute = model_class._hash_key_attribute()
+    hash_keys = {
+        hash_key_attribute.get_value(item[hash_key_attribute.attr_name]) for item in items
+    }
+    for hash_key in hash_keys:
+        rebuild_aggregates(model_class, hash_key_attribute.deserialize(hash_key))
+
+
+def rebuild_aggregates(model_class, hash_key):
+    """
+    Recomputes all precomputed aggregates of the hash key from the items. It is used when aggregates are added
+    to the model with stored items, items of the hash key must not be changed during the rebuild.
+    """
+    hash_key_attribute = model_class._hash_key_attribute()
+    range_key_attribute = model_class._range_key_attribute()
+    aggregate_model_class = get_aggregate_model_class()
+    model_aggregates = get_model_aggregates(model_class)
+    attributes_to_get = {hash_key_attribute.attr_name} | {
+        aggregate.get_attribute(model_class).attr_name for aggregate in model_aggregates if aggregate.attr_name
+    }
+    if range_key_attribute:
+        attributes_to_get.add(range_key_attribute.attr_name)
+
+    grouped_aggregates = _group_aggregates(model_aggregates)
+    values = defaultdict(lambda: {aggregate: aggregate.empty_value for aggregate in model_aggregates})
+    for items in model_class.objects.set_hash_key(hash_key)._iter_raw_pages(list(attributes_to_get)):
+        for item in items:
+            for range_key_prefix, aggregates in grouped_aggregates.items():
+                key_values = values[_get_item_aggregate_key(model_class, item, range_key_prefix)]
+                for aggregate in aggregates:
+                    key_values[aggregate] = aggregate.combine(
+                        key_values[aggregate], aggregate.get_item_value(model_class, item)
+                    )
+
+    aggregate_hash_key, _ = _get_aggregate_key(model_class, hash_key_attribute.serialize(hash_key), ())
+    put_items = []
+    for (_, group), key_values in values.items():
+        put_item = {'key': {STRING: aggregate_hash_key}, 'group': {STRING: group}}
+        range_key_prefix = int(group.split(AGGREGATE_KEY_SEPARATOR, 1)[0])
+        for aggregate in grouped_aggregates[range_key_prefix]:
+            if key_values[aggregate] is not None:
+                put_item[aggregate.name] = aggregate.serialize(model_class, key_values[aggregate])
+        put_items.append(put_item)
+    delete_items = [
+        {'key': item['key'], 'group': item['group']}
+        for item in aggregate_model_class.objects.set_hash_key(aggregate_hash_key).raw()
+        if (aggregate_hash_key, item['group'][STRING]) not in values
+    ]
+    batch_write_items(aggregate_model_class._get_connection(), put_items=put_items, delete_items=delete_items)
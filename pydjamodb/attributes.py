@@ -1,31 +1,109 @@
-from pynamodb.attributes import Attribute
-from pynamodb.constants import STRING
+import json
+import re
+import threading
+import zlib
+
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+from django.core.exceptions import ImproperlyConfigured
+
+from pynamodb.attributes import Attribute, BinaryAttribute
+from pynamodb.constants import NULL, STRING
+
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+
+_local = threading.local()
+
+
+def _import_zstandard():
+    # zstandard is imported only by attributes with zstd compression
+    try:
+        import zstandard
+    except ImportError:  # pragma: no cover
+        return None
+    return zstandard
 
 
 class StringJoinAttribute(Attribute):
+    """
+    Attribute which joins values of more fields with the separator to one string. If escape_char is set,
+    separator characters inside the values are escaped. Fields order is fixed, therefore the attribute can be
+    used as a composite range key and filtered by the values prefix.
+    """
 
     attr_type = STRING
 
-    def __init__(self, fields, separator='||', *args, **kwargs):
+    def __init__(self, fields, separator='||', *args, escape_char=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self._fields = fields
+        self._fields = tuple(fields)
         self._separator = separator
+        self._escape_char = escape_char
+        # Serializers and deserializers are prepared once, plain attributes need not to be called at all
+        self._serializers = tuple(
+            None if type(f).serialize is Attribute.serialize else f.serialize for f in self._fields
+        )
+        self._deserializers = tuple(
+            None if type(f).deserialize is Attribute.deserialize else f.deserialize for f in self._fields
+        )
+        if escape_char:
+            self._escape_table = str.maketrans({c: escape_char + c for c in set(separator) | {escape_char}})
+            self._unescape_re = re.compile('{}(.)|{}'.format(re.escape(escape_char), re.escape(separator)), re.S)
+
+    def _serialize_value(self, serializer, value):
+        serialized_value = (value if serializer is None else serializer(value)) or ''
+        if self._escape_char:
+            serialized_value = serialized_value.translate(self._escape_table)
+        return serialized_value
+
+    def _split(self, value):
+        if not self._escape_char or self._escape_char not in value:
+            return value.split(self._separator)
+
+        serialized_values, current_value, position = [], [], 0
+        for match in self._unescape_re.finditer(value):
+            current_value.append(value[position:match.start()])
+            if match.group(1) is None:
+                serialized_values.append(''.join(current_value))
+                current_value = []
+            else:
+                current_value.append(match.group(1))
+            position = match.end()
+        current_value.append(value[position:])
+        serialized_values.append(''.join(current_value))
+        return serialized_values
 
     def serialize(self, value):
         if isinstance(value, str):
             return value
 
-        serialized_values = []
-        for v, f in zip(value, self._fields):
-            serialized_values.append(f.serialize(v) or '')
-        return self._separator.join(serialized_values)
+        return self._separator.join([
+            self._serialize_value(serializer, v) for v, serializer in zip(value, self._serializers)
+        ])
 
     def deserialize(self, value):
-        serialized_values = value.split(self._separator)
-        deserialized_values = []
-        for v, f in zip(serialized_values, self._fields):
-            deserialized_values.append(f.deserialize(v))
-        return deserialized_values
+        return [
+            v if deserializer is None else deserializer(v)
+            for v, deserializer in zip(self._split(value), self._deserializers)
+        ]
+
+    def prefix(self, values):
+        """
+        Returns condition for items whose first len(values) field values are equal to the values.
+        """
+        values = tuple(values)
+        if not values:
+            raise ValueError('Prefix must contain at least one value')
+        elif len(values) > len(self._fields):
+            raise ValueError('Prefix contains more values than the attribute fields ({})'.format(len(self._fields)))
+        elif len(values) == len(self._fields):
+            return self == values
+        else:
+            return self.startswith(self.serialize(values) + self._separator)
 
 
 class BooleanUnicodeAttribute(Attribute):
@@ -39,3 +117,155 @@ class BooleanUnicodeAttribute(Attribute):
 
     def deserialize(self, value):
         return value == 'True'
+
+
+class CompressedValue:
+    """
+    Compressed value loaded from DynamoDB which is decompressed on the first access.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class CompressedBinaryAttribute(BinaryAttribute):
+    """
+    Binary attribute compressed with zlib or zstd. The first byte of the stored value determines used compression.
+    Values smaller than min_compress_size are stored uncompressed.
+    """
+
+    def __init__(self, *args, compression='zlib', compression_level=None, min_compress_size=256, **kwargs):
+        super().__init__(*args, **kwargs)
+        if compression not in {'zlib', 'zstd'}:
+            raise ImproperlyConfigured('Invalid compression "{}"'.format(compression))
+        if compression == 'zstd' and _import_zstandard() is None:
+            raise ImproperlyConfigured('zstd compression requires "zstandard" library')
+        self.compression = compression
+        self.compression_level = compression_level
+        self.min_compress_size = min_compress_size
+
+    def _encode_value(self, value):
+        return value
+
+    def _decode_value(self, data):
+        return data
+
+    def _compress(self, data):
+        if len(data) >= self.min_compress_size:
+            if self.compression == 'zstd':
+                compressor = _import_zstandard().ZstdCompressor(
+                    **({} if self.compression_level is None else {'level': self.compression_level})
+                )
+                compressed_data = bytes((COMPRESSION_ZSTD,)) + compressor.compress(data)
+            else:
+                compressed_data = bytes((COMPRESSION_ZLIB,)) + zlib.compress(
+                    data, -1 if self.compression_level is None else self.compression_level
+                )
+            if len(compressed_data) <= len(data):
+                return compressed_data
+        return bytes((COMPRESSION_NONE,)) + data
+
+    def _decompress(self, data):
+        compression, data = data[0], data[1:]
+        if compression == COMPRESSION_ZLIB:
+            return zlib.decompress(data)
+        elif compression == COMPRESSION_ZSTD:
+            zstandard = _import_zstandard()
+            if zstandard is None:
+                raise ImproperlyConfigured('zstd compression requires "zstandard" library')
+            return zstandard.ZstdDecompressor().decompress(data)
+        else:
+            return data
+
+    def __get__(self, instance, owner):
+        value = super().__get__(instance, owner)
+        if isinstance(value, CompressedValue):
+            value = self._decode_value(self._decompress(value.data))
+            instance.attribute_values[instance._dynamo_to_python_attrs.get(self.attr_name, self.attr_name)] = value
+        return value
+
+    def serialize(self, value):
+        if isinstance(value, CompressedValue):
+            return super().serialize(value.data)
+        return super().serialize(self._compress(self._encode_value(value)))
+
+    def deserialize(self, value):
+        return CompressedValue(super().deserialize(value))
+
+
+class CompressedJSONAttribute(CompressedBinaryAttribute):
+    """
+    JSON attribute stored as compressed binary value.
+    """
+
+    def _encode_value(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def _decode_value(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class LazyAttributeValues(MutableMapping):
+    """
+    Attribute values of the model instance which are deserialized from the raw DynamoDB data on the first access.
+    """
+
+    def __init__(self, values, raw_values, attributes):
+        self._values = dict(values)
+        self._raw_values = {}
+        for name, attr in attributes.items():
+            raw_value = raw_values.get(attr.attr_name)
+            if raw_value and NULL not in raw_value:
+                self._values.pop(name, None)
+                self._raw_values[name] = (attr, raw_value)
+
+    def _deserialize(self, key):
+        attr, raw_value = self._raw_values.pop(key)
+        self._values[key] = attr.deserialize(attr.get_value(raw_value))
+
+    def __getitem__(self, key):
+        if key in self._raw_values:
+            self._deserialize(key)
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._raw_values.pop(key, None)
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if self._raw_values.pop(key, None) is None:
+            del self._values[key]
+        else:
+            self._values.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._raw_values or key in self._values
+
+    def __iter__(self):
+        yield from list(self._values)
+        yield from list(self._raw_values)
+
+    def __len__(self):
+        return len(self._values) + len(self._raw_values)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def is_lazy_deserialization_enabled():
+    return getattr(_local, 'lazy_deserialization', False)
+
+
+@contextmanager
+def lazy_deserialization():
+    """
+    Model instances loaded inside the block deserialize attribute values on the first access.
+    """
+    previous_value = is_lazy_deserialization_enabled()
+    _local.lazy_deserialization = True
+    try:
+        yield
+    finally:
+        _local.lazy_deserialization = previous_value
@@ -0,0 +1,228 @@
+import atexit
+import logging
+import threading
+
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_finished
+
+from pynamodb.constants import BATCH_WRITE_PAGE_LIMIT
+
+from .utils import batch_write_items
+
+
+logger = logging.getLogger(__name__)
+
+
+PUT = 'put'
+DELETE = 'delete'
+
+
+_local = threading.local()
+
+
+class WriteBufferFlushError(Exception):
+
+    def __init__(self, errors):
+        super().__init__('Flushing of the DynamoDB write buffer failed for models: {}'.format(
+            ', '.join('{} ({})'.format(model_class.__name__, ex) for model_class, ex in errors)
+        ))
+        self.errors = errors
+
+
+class WriteBuffer:
+    """
+    Collects model writes and flushes them with BatchWriteItem requests. Writes to the same item are coalesced
+    (only the last one is sent). Buffer is flushed from the background thread if the number of pending writes
+    reaches flush_size or after flush_interval seconds. Writes of the model whose batch write failed are returned
+    to the buffer and retried with the next flush, after max_retries failed flushes (or if the buffer is stopped)
+    they are moved to failed_operations.
+    """
+
+    def __init__(self, flush_size=None, flush_interval=None, max_retries=None):
+        self.flush_size = (
+            settings.PYDJAMODB_DATABASE.get('WRITE_BUFFER_SIZE', BATCH_WRITE_PAGE_LIMIT) if flush_size is None
+            else flush_size
+        )
+        self.flush_interval = (
+            settings.PYDJAMODB_DATABASE.get('WRITE_BUFFER_INTERVAL', 1.0) if flush_interval is None
+            else flush_interval
+        )
+        self.max_retries = (
+            settings.PYDJAMODB_DATABASE.get('WRITE_BUFFER_MAX_RETRIES', 3) if max_retries is None else max_retries
+        )
+        self.failed_operations = []
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _add(self, instance, action, data):
+        key = (instance.__class__,) + tuple(instance._get_serialized_keys())
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (action, data, 0)
+            pending_count = len(self._pending)
+        self._start()
+        if pending_count >= self.flush_size:
+            self._flush_event.set()
+
+    def save(self, instance):
+        self._add(instance, PUT, instance.serialize())
+
+    def delete(self, instance):
+        self._add(instance, DELETE, instance._get_keys())
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop_event.clear()
+                    self._thread = threading.Thread(target=self._run, name='pydjamodb-write-buffer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            if self._stop_event.is_set():
+                # The last flush is called by stop
+                break
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing of the DynamoDB write buffer failed')
+
+    def _return_failed_writes(self, model_class, writes, retry):
+        retried_writes = [(key, action, data, attempts + 1) for key, action, data, attempts in writes]
+        if retry:
+            with self._lock:
+                for key, action, data, attempts in retried_writes:
+                    # Newer write of the same item replaces the failed one
+                    if key not in self._pending and attempts <= self.max_retries:
+                        self._pending[key] = (action, data, attempts)
+            retried_writes = [write for write in retried_writes if write[3] > self.max_retries]
+        if retried_writes:
+            self.failed_operations.append((
+                model_class,
+                [data for _, action, data, _ in retried_writes if action == PUT],
+                [data for _, action, data, _ in retried_writes if action == DELETE],
+            ))
+
+    def flush(self, retry=True):
+        """
+        Writes pending items of every model. WriteBufferFlushError is raised after all models are processed if
+        writes of some models failed.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, OrderedDict()
+
+            model_writes = defaultdict(list)
+            for key, (action, data, attempts) in pending.items():
+                model_writes[key[0]].append((key, action, data, attempts))
+
+            errors = []
+            for model_class, writes in model_writes.items():
+                try:
+                    batch_write_items(
+                        model_class._get_connection(),
+                        put_items=[data for _, action, data, _ in writes if action == PUT],
+                        delete_items=[data for _, action, data, _ in writes if action == DELETE]
+                    )
+                except Exception as ex:
+                    self._return_failed_writes(model_class, writes, retry)
+                    errors.append((model_class, ex))
+            if errors:
+                raise WriteBufferFlushError(errors) from errors[0][1]
+
+    def stop(self):
+        self._stop_event.set()
+        self._flush_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(retry=False)
+
+
+_default_write_buffer = None
+_default_write_buffer_lock = threading.Lock()
+
+
+def get_default_write_buffer():
+    """
+    Returns process write buffer used by models with Meta.buffered_writes set to True.
+    """
+    global _default_write_buffer
+
+    if _default_write_buffer is None:
+        with _default_write_buffer_lock:
+            if _default_write_buffer is None:
+                _default_write_buffer = WriteBuffer()
+    return _default_write_buffer
+
+
+def get_current_write_buffer(model_class):
+    write_buffer = getattr(_local, 'write_buffer', None)
+    if write_buffer is None and getattr(model_class.Meta, 'buffered_writes', False):
+        write_buffer = get_default_write_buffer()
+    return write_buffer
+
+
+@contextmanager
+def buffered_writes(flush_size=None, flush_interval=None):
+    """
+    Buffers writes of all models inside the block. Pending writes are flushed when the block is left.
+    """
+    write_buffer = getattr(_local, 'write_buffer', None)
+    if write_buffer is not None:
+        yield write_buffer
+        return
+
+    write_buffer = _local.write_buffer = WriteBuffer(flush_size, flush_interval)
+    try:
+        yield write_buffer
+    finally:
+        _local.write_buffer = None
+        write_buffer.stop()
+
+
+def _log_flush_errors(write_buffer, flush):
+    # Errors are only logged, they must not be raised to the unrelated request or to the interpreter shutdown
+    failed_count = len(write_buffer.failed_operations)
+    try:
+        flush()
+    except WriteBufferFlushError:
+        logger.exception('Flushing of the DynamoDB write buffer failed')
+        for model_class, put_items, delete_items in write_buffer.failed_operations[failed_count:]:
+            logger.error(
+                'DynamoDB writes of the model %s were not written (put items: %r, delete items: %r)',
+                model_class.__name__, put_items, delete_items
+            )
+
+
+def flush_write_buffers(**kwargs):
+    """
+    Flushes the process write buffer at the end of the request. Failed writes are returned to the buffer.
+    """
+    if _default_write_buffer is not None:
+        _log_flush_errors(_default_write_buffer, _default_write_buffer.flush)
+
+
+def stop_write_buffers():
+    """
+    Stops the process write buffer on the interpreter exit, writes which cannot be written are logged.
+    """
+    if _default_write_buffer is not None:
+        _log_flush_errors(_default_write_buffer, _default_write_buffer.stop)
+
+
+request_finished.connect(flush_write_buffers, dispatch_uid='pydjamodb_flush_write_buffers')
+atexit.register(stop_write_buffers)
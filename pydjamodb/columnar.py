@@ -0,0 +1,94 @@
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+
+from pynamodb.attributes import Attribute, BooleanAttribute, NumberAttribute
+from pynamodb.constants import BOOLEAN, NULL, NUMBER
+
+from .attributes import CompressedBinaryAttribute
+
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def _import_numpy():
+    # numpy is imported on the first use, not with the library
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        return None
+    return numpy
+
+
+def _is_integral(value):
+    return not any(c in value for c in '.eE')
+
+
+def _decode_numpy_number_column(values):
+    numpy = _import_numpy()
+    if not all(_is_integral(value) for value in values if value is not None):
+        return numpy.array(['nan' if value is None else value for value in values], dtype=numpy.float64)
+
+    # Integers are not converted to float to keep their precision, integers with missing values or out of int64
+    # range are returned in the object array
+    int_values = [None if value is None else int(value) for value in values]
+    if all(value is not None and INT64_MIN <= value <= INT64_MAX for value in int_values):
+        return numpy.array(int_values, dtype=numpy.int64)
+    return numpy.array(int_values, dtype=object)
+
+
+def _decode_number_column(raw_values, use_numpy):
+    values = [raw_value.get(NUMBER) if raw_value else None for raw_value in raw_values]
+    if use_numpy:
+        return _decode_numpy_number_column(values)
+    return [None if value is None else json.loads(value) for value in values]
+
+
+def _decode_boolean_column(raw_values):
+    return [None if not raw_value or NULL in raw_value else bool(raw_value[BOOLEAN]) for raw_value in raw_values]
+
+
+def _decode_compressed_column(attr, raw_values):
+    return [
+        None if not raw_value or NULL in raw_value
+        else attr._decode_value(attr._decompress(attr.deserialize(attr.get_value(raw_value)).data))
+        for raw_value in raw_values
+    ]
+
+
+def _decode_column(attr, raw_values):
+    attr_type = attr.attr_type
+    if isinstance(attr, CompressedBinaryAttribute):
+        return _decode_compressed_column(attr, raw_values)
+    elif type(attr).deserialize is Attribute.deserialize:
+        return [None if not raw_value or NULL in raw_value else raw_value[attr_type] for raw_value in raw_values]
+    else:
+        deserialize, get_value = attr.deserialize, attr.get_value
+        return [
+            None if not raw_value or NULL in raw_value else deserialize(get_value(raw_value))
+            for raw_value in raw_values
+        ]
+
+
+def decode_columns(model_class, items, use_numpy=False):
+    """
+    Decodes list of raw DynamoDB items to the dict of columns (attribute name => list of values). Every column is
+    decoded at once with the decoder selected according to the attribute type, compressed attributes are
+    decompressed. Number columns can be returned as numpy arrays: int64 arrays for integers, float64 arrays for
+    other numbers (missing values are replaced with NaN) and object arrays for integers with missing values or out
+    of int64 range.
+    """
+    if use_numpy and _import_numpy() is None:
+        raise ImproperlyConfigured('numpy columns require "numpy" library')
+
+    columns = {}
+    for name, attr in model_class.get_attributes().items():
+        raw_values = [item.get(attr.attr_name) for item in items]
+        if isinstance(attr, NumberAttribute) and type(attr).deserialize is NumberAttribute.deserialize:
+            columns[name] = _decode_number_column(raw_values, use_numpy)
+        elif isinstance(attr, BooleanAttribute) and type(attr).deserialize is BooleanAttribute.deserialize:
+            columns[name] = _decode_boolean_column(raw_values)
+        else:
+            columns[name] = _decode_column(attr, raw_values)
+    return columns
@@ -1,11 +1,35 @@
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
+from django.utils.module_loading import import_string
 
+from pynamodb.connection.base import Connection
 from pynamodb.connection.table import TableConnection as BaseTableConnection
+from pynamodb.constants import BATCH_GET_PAGE_LIMIT, BATCH_WRITE_PAGE_LIMIT
 from pynamodb.exceptions import TableDoesNotExist
 
-from botocore.client import ClientError
+from botocore.client import ClientError, Config
+from botocore.session import get_session
+
+from .hedging import get_hedging_connection_class, is_hedging_enabled
+from .utils import batch_get_items, batch_write_items, chunks
+
+
+TEST_CLEAN_WORKERS = 8
+
+
+class CredentialsLocal(threading.local):
+    """
+    Thread local storage of the pynamodb connection which initializes botocore session of every thread with
+    the credentials (pynamodb sets credentials only to the session of the thread which created the connection).
+    """
+
+    def __init__(self, aws_access_key_id, aws_secret_access_key, aws_session_token):
+        self.session = get_session()
+        self.session.set_credentials(aws_access_key_id, aws_secret_access_key, aws_session_token)
 
 
 class TableConnection(BaseTableConnection):
@@ -53,6 +77,30 @@ class TableConnection(BaseTableConnection):
             aws_session_token=aws_session_token
         )
 
+        backend = settings.PYDJAMODB_DATABASE.get('BACKEND')
+        hedging_enabled = is_hedging_enabled()
+        if backend or hedging_enabled:
+            connection_class = import_string(backend) if backend else Connection
+            if hedging_enabled:
+                connection_class = get_hedging_connection_class(connection_class)
+            self.connection = connection_class(
+                region=region,
+                host=host,
+                connect_timeout_seconds=connect_timeout_seconds,
+                read_timeout_seconds=read_timeout_seconds,
+                max_retry_attempts=max_retry_attempts,
+                base_backoff_ms=base_backoff_ms,
+                max_pool_connections=max_pool_connections,
+                extra_headers=extra_headers
+            )
+
+        if aws_access_key_id and aws_secret_access_key:
+            if isinstance(getattr(self.connection, '_local', None), threading.local):
+                # pynamodb keeps botocore session in the private thread local storage
+                self.connection._local = CredentialsLocal(aws_access_key_id, aws_secret_access_key, aws_session_token)
+            else:
+                self.connection.session.set_credentials(aws_access_key_id, aws_secret_access_key, aws_session_token)
+
     def create_table(self,
                      attribute_definitions=None,
                      key_schema=None,
@@ -120,6 +168,24 @@ class TableConnection(BaseTableConnection):
             )
         return result
 
+    def get_streams_client(self):
+        """
+        Returns botocore client of the DynamoDB Streams service.
+        """
+        streams_client = getattr(self.connection, 'streams_client', None)
+        if streams_client is not None:
+            return streams_client
+        return self.connection.session.create_client(
+            'dynamodbstreams',
+            self.connection.region,
+            endpoint_url=settings.PYDJAMODB_DATABASE.get('STREAMS_HOST', self.connection.host),
+            config=Config(
+                connect_timeout=self.connection._connect_timeout_seconds,
+                read_timeout=self.connection._read_timeout_seconds,
+                max_pool_connections=self.connection._max_pool_connections,
+            )
+        )
+
     def exists_table(self):
         try:
             self.describe_table()
@@ -144,10 +210,15 @@ class TableConnection(BaseTableConnection):
 
 
 class TestTableConnection:
+    """
+    Connection wrapper used in tests which records keys of written items. Only written items are removed after
+    the test. Items stored in the snapshot (test fixtures) are restored to the snapshot state instead.
+    """
 
     def __init__(self, wrapped_connection, prefix=None):
         self._wrapped_connection = wrapped_connection
-        self._is_test_clean_required = False
+        self._written_keys = set()
+        self._snapshot = {}
         if prefix:
             self._wrapped_connection.table_name = 'test_{}_{}'.format(prefix, self._wrapped_connection.table_name)
         else:
@@ -156,21 +227,94 @@ class TestTableConnection:
     def __getattr__(self, attr):
         return getattr(self._wrapped_connection, attr)
 
-    def update_item(self, *args, **kwargs):
-        self._is_test_clean_required = True
-        return self._wrapped_connection.update_item(*args, **kwargs)
+    def _get_item_key(self, item):
+        meta_table = self._wrapped_connection.get_meta_table()
+        return tuple(
+            # Items can contain serialized values with the type or only raw values
+            next(iter(value.values())) if isinstance(value, dict) else value
+            for value in (item.get(meta_table.hash_keyname), item.get(meta_table.range_keyname))
+        )
 
-    def put_item(self, *args, **kwargs):
-        self._is_test_clean_required = True
-        return self._wrapped_connection.put_item(*args, **kwargs)
+    def _get_key_item(self, key):
+        meta_table = self._wrapped_connection.get_meta_table()
+        return {
+            name: value for name, value in zip((meta_table.hash_keyname, meta_table.range_keyname), key)
+            if value is not None
+        }
 
-    def batch_write_item(self, *args, **kwargs):
-        self._is_test_clean_required = True
-        return self._wrapped_connection.batch_write_item(*args, **kwargs)
+    def _add_deleted_key(self, key):
+        # Deleted items must be cleaned only if they are stored in the snapshot
+        if key in self._snapshot:
+            self._written_keys.add(key)
+
+    def update_item(self, hash_key, range_key=None, *args, **kwargs):
+        self._written_keys.add((hash_key, range_key))
+        return self._wrapped_connection.update_item(hash_key, range_key, *args, **kwargs)
+
+    def put_item(self, hash_key, range_key=None, *args, **kwargs):
+        self._written_keys.add((hash_key, range_key))
+        return self._wrapped_connection.put_item(hash_key, range_key, *args, **kwargs)
+
+    def delete_item(self, hash_key, range_key=None, *args, **kwargs):
+        self._add_deleted_key((hash_key, range_key))
+        return self._wrapped_connection.delete_item(hash_key, range_key, *args, **kwargs)
+
+    def batch_write_item(self, put_items=None, delete_items=None, *args, **kwargs):
+        for item in put_items or ():
+            self._written_keys.add(self._get_item_key(item))
+        for item in delete_items or ():
+            self._add_deleted_key(self._get_item_key(item))
+        return self._wrapped_connection.batch_write_item(put_items, delete_items, *args, **kwargs)
+
+    def get_operation_kwargs(self, hash_key, range_key=None, *args, **kwargs):
+        # Operation kwargs with attributes or actions are used for transactional puts and updates, operation kwargs
+        # without them can be transactional delete
+        if kwargs.get('attributes') is not None or kwargs.get('actions') is not None:
+            self._written_keys.add((hash_key, range_key))
+        else:
+            self._add_deleted_key((hash_key, range_key))
+        return self._wrapped_connection.get_operation_kwargs(hash_key, range_key, *args, **kwargs)
+
+    def create_snapshot(self):
+        """
+        Stores current state of the written items. These items are restored to the stored state after every test.
+        """
+        written_keys, self._written_keys = self._written_keys, set()
+        for items in self._map_chunks(
+                lambda key_chunk: batch_get_items(self._wrapped_connection, key_chunk),
+                [self._get_key_item(key) for key in written_keys],
+                BATCH_GET_PAGE_LIMIT):
+            self._snapshot.update((self._get_item_key(item), item) for item in items)
+
+    def clear_snapshot(self):
+        """
+        Removes the snapshot, its items are removed with the next post test clean.
+        """
+        self._written_keys |= set(self._snapshot)
+        self._snapshot = {}
+
+    def _map_chunks(self, func, items, size):
+        item_chunks = list(chunks(items, size))
+        if len(item_chunks) <= 1:
+            return [func(item_chunk) for item_chunk in item_chunks]
+        with ThreadPoolExecutor(max_workers=min(len(item_chunks), TEST_CLEAN_WORKERS)) as executor:
+            return list(executor.map(func, item_chunks))
 
     def post_test_clean(self, model_class):
-        if self._is_test_clean_required:
-            with model_class.batch_write() as batch:
-                for item in model_class.scan():
-                    batch.delete(item)
-        self._is_test_clean_required = False
+        written_keys, self._written_keys = self._written_keys, set()
+        if not written_keys:
+            return
+
+        requests = [
+            (self._snapshot[key], None) if key in self._snapshot else (None, self._get_key_item(key))
+            for key in written_keys
+        ]
+        self._map_chunks(
+            lambda request_chunk: batch_write_items(
+                self._wrapped_connection,
+                put_items=[put_item for put_item, _ in request_chunk if put_item is not None],
+                delete_items=[delete_item for _, delete_item in request_chunk if delete_item is not None],
+            ),
+            requests,
+            BATCH_WRITE_PAGE_LIMIT
+        )
@@ -0,0 +1,213 @@
+import threading
+import time
+
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from django.conf import settings
+
+from botocore.exceptions import ReadTimeoutError
+
+from pynamodb.constants import BATCH_GET_ITEM, GET_ITEM, QUERY, SCAN
+from pynamodb.settings import OperationSettings
+
+
+# Idempotent operations which can be sent more times concurrently
+HEDGED_OPERATIONS = {GET_ITEM, QUERY, SCAN, BATCH_GET_ITEM}
+
+# Percentiles are recalculated after this number of new latencies
+PERCENTILE_RECALCULATE_INTERVAL = 50
+
+
+def is_hedging_enabled():
+    return bool(
+        settings.PYDJAMODB_DATABASE.get('HEDGED_READS') or settings.PYDJAMODB_DATABASE.get('ADAPTIVE_TIMEOUTS')
+    )
+
+
+class LatencyTracker:
+    """
+    Thread safe rolling window of the latencies of every operation.
+    """
+
+    def __init__(self, window=1000, min_samples=100):
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(int)
+        self._percentiles = {}
+        self._lock = threading.Lock()
+
+    def add(self, operation_name, latency):
+        with self._lock:
+            self._latencies[operation_name].append(latency)
+            self._counts[operation_name] += 1
+
+    def get_percentile(self, operation_name, percentile):
+        """
+        Returns the latency percentile of the operation or None if there is not enough samples.
+        """
+        with self._lock:
+            latencies = self._latencies[operation_name]
+            if len(latencies) < self.min_samples:
+                return None
+
+            count = self._counts[operation_name]
+            calculated_count, value = self._percentiles.get((operation_name, percentile), (None, None))
+            if calculated_count is None or count - calculated_count >= PERCENTILE_RECALCULATE_INTERVAL:
+                sorted_latencies = sorted(latencies)
+                value = sorted_latencies[min(int(len(sorted_latencies) * percentile / 100), len(latencies) - 1)]
+                self._percentiles[(operation_name, percentile)] = (count, value)
+            return value
+
+
+_executor = None
+_executor_slots = None
+_executor_lock = threading.Lock()
+
+
+def get_hedging_executor():
+    global _executor, _executor_slots
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = settings.PYDJAMODB_DATABASE.get('HEDGE_WORKERS', 32)
+                _executor_slots = threading.BoundedSemaphore(max_workers)
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pydjamodb-hedging')
+    return _executor
+
+
+def submit_hedging_request(fn, *args):
+    """
+    Submits the request to the hedging thread pool only if a worker is free (requests never wait in the queue).
+    Returns the future or None if the pool is saturated.
+    """
+    executor = get_hedging_executor()
+    if not _executor_slots.acquire(blocking=False):
+        return None
+    future = executor.submit(fn, *args)
+    future.add_done_callback(lambda future: _executor_slots.release())
+    return future
+
+
+class HedgingConnectionMixin:
+    """
+    Connection mixin which sends idempotent reads from the thread pool. If the hedged reads are enabled and the
+    response is not received until the rolling latency percentile of the operation (HEDGE_PERCENTILE), the
+    duplicate request is sent and the first response is used. If the adaptive timeouts are enabled, the request
+    is repeated when the response is not received until the multiple of the higher latency percentile
+    (ADAPTIVE_TIMEOUT_PERCENTILE * ADAPTIVE_TIMEOUT_MULTIPLIER).
+
+    Only the latency of the request whose response is used is recorded, requests which are not started yet are
+    cancelled (already sent requests cannot be stopped, their responses are ignored). If all workers of the pool
+    are busy, the first request is sent from the calling thread and the hedged or repeated requests are skipped.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        database_settings = settings.PYDJAMODB_DATABASE
+        self.hedged_reads = database_settings.get('HEDGED_READS', False)
+        self.hedge_percentile = database_settings.get('HEDGE_PERCENTILE', 95)
+        self.hedge_min_delay = database_settings.get('HEDGE_MIN_DELAY', 0.005)
+        self.adaptive_timeouts = database_settings.get('ADAPTIVE_TIMEOUTS', False)
+        self.adaptive_timeout_percentile = database_settings.get('ADAPTIVE_TIMEOUT_PERCENTILE', 99)
+        self.adaptive_timeout_multiplier = database_settings.get('ADAPTIVE_TIMEOUT_MULTIPLIER', 3)
+        self.adaptive_timeout_min = database_settings.get('ADAPTIVE_TIMEOUT_MIN', 0.05)
+        self.latency_tracker = LatencyTracker(
+            window=database_settings.get('LATENCY_WINDOW', 1000),
+            min_samples=database_settings.get('LATENCY_MIN_SAMPLES', 100)
+        )
+
+    def get_hedge_delay(self, operation_name):
+        if not self.hedged_reads:
+            return None
+        latency = self.latency_tracker.get_percentile(operation_name, self.hedge_percentile)
+        return None if latency is None else max(latency, self.hedge_min_delay)
+
+    def get_adaptive_timeout(self, operation_name):
+        if not self.adaptive_timeouts:
+            return None
+        latency = self.latency_tracker.get_percentile(operation_name, self.adaptive_timeout_percentile)
+        if latency is None:
+            return None
+        timeout = max(latency * self.adaptive_timeout_multiplier, self.adaptive_timeout_min)
+        return timeout if self._read_timeout_seconds is None else min(timeout, self._read_timeout_seconds)
+
+    def _make_timed_api_call(self, operation_name, operation_kwargs, operation_settings):
+        start = time.monotonic()
+        data = super()._make_api_call(operation_name, operation_kwargs, operation_settings)
+        return data, time.monotonic() - start
+
+    def _make_measured_api_call(self, operation_name, operation_kwargs, operation_settings):
+        data, latency = self._make_timed_api_call(operation_name, operation_kwargs, operation_settings)
+        self.latency_tracker.add(operation_name, latency)
+        return data
+
+    def _make_api_call(self, operation_name, operation_kwargs, operation_settings=OperationSettings.default):
+        if operation_name not in HEDGED_OPERATIONS:
+            return super()._make_api_call(operation_name, operation_kwargs, operation_settings)
+
+        hedge_delay = self.get_hedge_delay(operation_name)
+        timeout = self.get_adaptive_timeout(operation_name)
+        if hedge_delay is None and timeout is None:
+            # Latencies are collected before hedging and timeouts are used
+            return self._make_measured_api_call(operation_name, operation_kwargs, operation_settings)
+
+        def submit():
+            return submit_hedging_request(
+                self._make_timed_api_call, operation_name, operation_kwargs, operation_settings
+            )
+
+        future = submit()
+        if future is None:
+            # Thread pool is saturated, the request is sent without hedging
+            return self._make_measured_api_call(operation_name, operation_kwargs, operation_settings)
+
+        start = request_start = time.monotonic()
+        futures, retries = {future}, 0
+        try:
+            while True:
+                deadlines = []
+                if hedge_delay is not None:
+                    deadlines.append(start + hedge_delay)
+                if timeout is not None:
+                    deadlines.append(request_start + timeout)
+                wait_timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+
+                done, futures = wait(futures, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        data, latency = future.result()
+                        self.latency_tracker.add(operation_name, latency)
+                        return data
+                if done:
+                    if not futures:
+                        # All sent requests failed
+                        done.pop().result()
+                    continue
+
+                now, new_future = time.monotonic(), None
+                if hedge_delay is not None and now >= start + hedge_delay:
+                    hedge_delay = None
+                    new_future = submit()
+                elif timeout is not None and now >= request_start + timeout:
+                    if retries >= self._max_retry_attempts_exception:
+                        raise ReadTimeoutError(endpoint_url=self.host or '')
+                    retries += 1
+                    request_start = now
+                    new_future = submit()
+                    if new_future is None:
+                        # Request cannot be repeated with the saturated pool, the sent requests are awaited
+                        timeout = None
+                if new_future is not None:
+                    futures.add(new_future)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+@lru_cache(maxsize=None)
+def get_hedging_connection_class(connection_class):
+    return type('Hedging{}'.format(connection_class.__name__), (HedgingConnectionMixin, connection_class), {})
@@ -0,0 +1,86 @@
+import gzip
+import json
+import os
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pydjamodb.models import get_dynamodb_model_class
+from pydjamodb.utils import (
+    RateLimiter, ThroughputCounter, decode_raw_item, encode_raw_item, load_checkpoint, parallel_scan, store_checkpoint
+)
+
+
+class Command(BaseCommand):
+
+    help = 'Exports items of the DynamoDB model table to the gzipped JSON lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='DynamoDB model class name, full python path or table name')
+        parser.add_argument('path', help='Output gzipped JSON lines file')
+        parser.add_argument('--segments', type=int, default=4, help='Number of parallel scan segments')
+        parser.add_argument('--page-size', type=int, default=None, help='Number of items of one scan request')
+        parser.add_argument('--rate-limit', type=float, default=None, help='Maximal number of items per second')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file used to resume the export')
+
+    def handle(self, model, path, segments, page_size, rate_limit, checkpoint, **options):
+        try:
+            model_class = get_dynamodb_model_class(model)
+        except LookupError as ex:
+            raise CommandError(str(ex))
+
+        checkpoint_path = checkpoint
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint is None:
+            checkpoint = {
+                'total_segments': segments,
+                'offset': 0,
+                'count': 0,
+                'segments': {str(segment): {'last_evaluated_key': None, 'done': False} for segment in range(segments)}
+            }
+        elif checkpoint['offset'] and not os.path.exists(path):
+            raise CommandError('Output file "{}" of the checkpoint does not exist'.format(path))
+        else:
+            self.stdout.write('Resuming export from the checkpoint "{}"'.format(checkpoint_path))
+
+        counter = ThroughputCounter(checkpoint['count'])
+        lock = threading.Lock()
+
+        def write_page(segment, items, last_evaluated_key):
+            # Every page is written as a separate gzip member, therefore the file can be truncated to the last
+            # checkpoint and appended when the export is resumed
+            data = gzip.compress(''.join(json.dumps(encode_raw_item(item)) + '\n' for item in items).encode('utf-8'))
+            with lock:
+                output.write(data)
+                output.flush()
+                counter.add(len(items))
+                checkpoint['offset'] = output.tell()
+                checkpoint['count'] = counter.count
+                checkpoint['segments'][str(segment)] = {
+                    'last_evaluated_key': last_evaluated_key and encode_raw_item(last_evaluated_key),
+                    'done': not last_evaluated_key
+                }
+                store_checkpoint(checkpoint_path, checkpoint)
+                if options['verbosity'] > 1:
+                    self.stdout.write('Exported {}'.format(counter))
+
+        with open(path, 'r+b' if checkpoint['offset'] else 'wb') as output:
+            output.truncate(checkpoint['offset'])
+            output.seek(checkpoint['offset'])
+            parallel_scan(
+                model_class._get_connection(),
+                checkpoint['total_segments'],
+                write_page,
+                segments=[
+                    int(segment) for segment, segment_checkpoint in checkpoint['segments'].items()
+                    if not segment_checkpoint['done']
+                ],
+                segment_start_keys={
+                    int(segment): decode_raw_item(segment_checkpoint['last_evaluated_key'])
+                    for segment, segment_checkpoint in checkpoint['segments'].items()
+                    if segment_checkpoint['last_evaluated_key']
+                },
+                page_size=page_size,
+                rate_limiter=RateLimiter(rate_limit),
+            )
+        self.stdout.write('Exported {}'.format(counter))
@@ -0,0 +1,85 @@
+import gzip
+import json
+import threading
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pynamodb.constants import BATCH_WRITE_PAGE_LIMIT
+
+from pydjamodb.aggregates import get_model_aggregates, rebuild_items_aggregates
+from pydjamodb.models import get_dynamodb_model_class
+from pydjamodb.utils import (
+    RateLimiter, ThroughputCounter, batch_write_items, chunks, decode_raw_item, load_checkpoint, store_checkpoint
+)
+
+
+class Command(BaseCommand):
+
+    help = 'Imports items from the gzipped JSON lines file to the DynamoDB model table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='DynamoDB model class name, full python path or table name')
+        parser.add_argument('path', help='Input gzipped JSON lines file')
+        parser.add_argument('--workers', type=int, default=4, help='Number of parallel batch writes')
+        parser.add_argument('--rate-limit', type=float, default=None, help='Maximal number of items per second')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file used to resume the import')
+
+    def handle(self, model, path, workers, rate_limit, checkpoint, **options):
+        try:
+            model_class = get_dynamodb_model_class(model)
+        except LookupError as ex:
+            raise CommandError(str(ex))
+
+        checkpoint_path = checkpoint
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint is None:
+            checkpoint = {'count': 0}
+        else:
+            self.stdout.write('Resuming import from the checkpoint "{}"'.format(checkpoint_path))
+
+        connection = model_class._get_connection()
+        rate_limiter = RateLimiter(rate_limit)
+        counter = ThroughputCounter(checkpoint['count'])
+        lock = threading.Lock()
+        # Chunks are written in parallel, checkpoint contains only items of the continuous sequence of written chunks
+        completed_chunks = {}
+        next_chunk = [0]
+
+        def write_chunk(chunk_index, items):
+            rate_limiter.acquire(len(items))
+            batch_write_items(connection, put_items=items)
+            with lock:
+                counter.add(len(items))
+                completed_chunks[chunk_index] = len(items)
+                while next_chunk[0] in completed_chunks:
+                    checkpoint['count'] += completed_chunks.pop(next_chunk[0])
+                    next_chunk[0] += 1
+                store_checkpoint(checkpoint_path, checkpoint)
+                if options['verbosity'] > 1:
+                    self.stdout.write('Imported {}'.format(counter))
+
+        with gzip.open(path, 'rt', encoding='utf-8') as input_file, ThreadPoolExecutor(workers) as executor:
+            futures = set()
+            lines = islice(input_file, checkpoint['count'], None)
+            for chunk_index, lines_chunk in enumerate(chunks(lines, BATCH_WRITE_PAGE_LIMIT)):
+                # Only limited number of chunks is loaded in the memory
+                if len(futures) >= workers * 2:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                futures.add(executor.submit(
+                    write_chunk, chunk_index, [decode_raw_item(json.loads(line)) for line in lines_chunk]
+                ))
+            for future in futures:
+                future.result()
+        self.stdout.write('Imported {}'.format(counter))
+
+        if get_model_aggregates(model_class):
+            # Items are written without the model, aggregates of all hash keys of the file (including items
+            # imported before the resume) are rebuilt
+            with gzip.open(path, 'rt', encoding='utf-8') as input_file:
+                rebuild_items_aggregates(model_class, (decode_raw_item(json.loads(line)) for line in input_file))
+            self.stdout.write('Aggregates rebuilt')
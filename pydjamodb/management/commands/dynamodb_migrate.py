@@ -0,0 +1,51 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+
+    help = 'Runs the DynamoDB data migration stored in the "dynamodb_migrations" package of the application.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', help='Application label')
+        parser.add_argument('migration_name', help='Name of the migration module')
+        parser.add_argument('--segments', type=int, default=None, help='Number of parallel scan segments')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Number of items updated in one transaction (max 100)')
+        parser.add_argument('--page-size', type=int, default=None, help='Number of items of one scan request')
+        parser.add_argument('--capacity-budget', type=float, default=None,
+                            help='Maximal number of consumed capacity units per second')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file used to resume the migration')
+
+    def handle(self, app_label, migration_name, segments, batch_size, page_size, capacity_budget, checkpoint,
+               **options):
+        try:
+            app_config = apps.get_app_config(app_label)
+        except LookupError as ex:
+            raise CommandError(str(ex))
+
+        module_name = '{}.dynamodb_migrations.{}'.format(app_config.name, migration_name)
+        try:
+            module = import_module(module_name)
+        except ModuleNotFoundError as ex:
+            # Import errors inside the migration module are not hidden
+            if ex.name is None or not (module_name == ex.name or module_name.startswith(ex.name + '.')):
+                raise
+            raise CommandError('DynamoDB migration "{}" was not found'.format(module_name))
+
+        migration_class = getattr(module, 'Migration', None)
+        if migration_class is None:
+            raise CommandError('DynamoDB migration "{}" does not contain Migration class'.format(module_name))
+
+        migration = migration_class(
+            total_segments=segments, batch_size=batch_size, page_size=page_size, capacity_budget=capacity_budget
+        )
+
+        def print_progress(migration):
+            if options['verbosity'] > 1:
+                self.stdout.write('Migrated {}'.format(migration))
+
+        migration.run(checkpoint_path=checkpoint, callback=print_progress)
+        self.stdout.write('Migrated {}'.format(migration))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pydjamodb.models import get_dynamodb_model_class
+from pydjamodb.streams import DynamoDBStreamConsumer, DynamoDBStreamError
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Reads the DynamoDB stream of the model table and sends the dynamodb_items_changed signal for every page of '
+        'the stream records.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='DynamoDB model class name, full python path or table name')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file used to resume the consumer')
+        parser.add_argument('--batch-size', type=int, default=None, help='Maximal number of records of one page')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Number of seconds between reads of the shard without new records')
+        parser.add_argument('--latest', action='store_true', default=False,
+                            help='Shards open at the first start are read from the latest record instead of the oldest')
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Consumer stops when all shards are read to the last record')
+
+    def handle(self, model, checkpoint, batch_size, poll_interval, latest, once, **options):
+        try:
+            model_class = get_dynamodb_model_class(model)
+        except LookupError as ex:
+            raise CommandError(str(ex))
+
+        consumer = DynamoDBStreamConsumer(
+            model_class, checkpoint_path=checkpoint, batch_size=batch_size, poll_interval=poll_interval,
+            start_from_latest=latest
+        )
+        try:
+            consumer.run(once=once)
+        except DynamoDBStreamError as ex:
+            raise CommandError(str(ex))
+        except KeyboardInterrupt:
+            # Consumer has already stopped and awaited all shard readers
+            pass
+        self.stdout.write('Stream {}'.format(consumer))
@@ -0,0 +1,2 @@
+from .connection import MemoryConnection, get_memory_database  # noqa: F401
+from .database import MemoryDatabase, MemoryDatabaseError  # noqa: F401
@@ -0,0 +1,85 @@
+import threading
+
+from botocore.exceptions import WaiterError
+
+from pynamodb.connection import Connection
+from pynamodb.constants import TABLE_NAME
+from pynamodb.exceptions import VerboseClientError
+from pynamodb.settings import OperationSettings
+
+from .database import MemoryDatabase, MemoryDatabaseError
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_memory_database(name=None):
+    """
+    Returns the process in-memory database, connections with the same host share one database.
+    """
+    with _databases_lock:
+        if name not in _databases:
+            _databases[name] = MemoryDatabase()
+        return _databases[name]
+
+
+class MemoryWaiter:
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+
+    def wait(self, TableName, WaiterConfig=None):
+        # Tables of the in-memory database are created and removed immediately
+        if (TableName in self.database.tables) != (self.name == 'table_exists'):
+            raise WaiterError(self.name, 'Waiter encountered a terminal failure state', {})
+
+
+class MemoryClient:
+    """
+    Replacement of the botocore DynamoDB client, client methods are translated to the in-memory database
+    operations.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def get_waiter(self, name):
+        return MemoryWaiter(self._connection.database, name)
+
+    def __getattr__(self, name):
+        operation_name = ''.join(part.title() for part in name.split('_'))
+
+        def call_operation(**kwargs):
+            return self._connection._make_api_call(operation_name, kwargs)
+        return call_operation
+
+
+class MemoryConnection(Connection):
+    """
+    Pynamodb connection which performs operations in the process memory instead of the HTTP requests to DynamoDB.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.database = get_memory_database(self.host)
+
+    @property
+    def client(self):
+        return MemoryClient(self)
+
+    @property
+    def streams_client(self):
+        # Stream operations are performed by the same in-memory database
+        return MemoryClient(self)
+
+    def _make_api_call(self, operation_name, operation_kwargs, settings=OperationSettings.default):
+        try:
+            return self.database.execute(operation_name, operation_kwargs)
+        except MemoryDatabaseError as ex:
+            raise VerboseClientError(
+                dict({'Error': {'Code': ex.code, 'Message': ex.message}}, **ex.extra),
+                operation_name,
+                {'table_name': operation_kwargs.get(TABLE_NAME)}
+            )
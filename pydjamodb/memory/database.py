@@ -0,0 +1,872 @@
+import copy
+import math
+import threading
+import time
+import zlib
+
+from bisect import bisect_left, bisect_right
+
+from pynamodb.constants import (
+    ATTR_DEFINITIONS, ATTR_NAME, ATTRIBUTES, BILLING_MODE, CAPACITY_UNITS, CONSUMED_CAPACITY, COUNT,
+    DELETE_REQUEST, EXCLUSIVE_START_KEY, EXCLUSIVE_START_TABLE_NAME, EXPRESSION_ATTRIBUTE_NAMES,
+    EXPRESSION_ATTRIBUTE_VALUES, FILTER_EXPRESSION, GLOBAL_SECONDARY_INDEXES, INDEX_NAME, ITEM, ITEMS, KEY,
+    KEY_CONDITION_EXPRESSION, KEY_SCHEMA, KEY_TYPE, KEYS, LAST_EVALUATED_KEY, LIMIT,
+    LOCAL_SECONDARY_INDEXES, PROJECTION, PROJECTION_EXPRESSION, PROJECTION_TYPE, PROVISIONED_THROUGHPUT,
+    PUT_REQUEST, REQUEST_ITEMS, RESPONSES, RETURN_CONSUMED_CAPACITY, RETURN_VALUES, SCAN_INDEX_FORWARD,
+    SEGMENT, SELECT, TABLE_KEY, TABLE_NAME, TABLE_STATUS, TOTAL_SEGMENTS,
+    TRANSACT_CONDITION_CHECK, TRANSACT_DELETE, TRANSACT_GET, TRANSACT_ITEMS, TRANSACT_PUT, TRANSACT_UPDATE,
+    UNPROCESSED_ITEMS, UNPROCESSED_KEYS, UPDATE_EXPRESSION
+)
+from pynamodb.types import HASH, RANGE
+
+from .expressions import (
+    ExpressionContext, ExpressionError, copy_item, get_item_size, get_sort_value, normalize_item, parse_condition,
+    parse_projection, parse_update
+)
+from .streams import MEMORY_STREAM_SHARDS, STREAM_VIEW_TYPE, MemoryStream, parse_iterator
+
+
+CONDITION_EXPRESSION = 'ConditionExpression'
+NON_KEY_ATTRIBUTES = 'NonKeyAttributes'
+LAST_EVALUATED_TABLE_NAME = 'LastEvaluatedTableName'
+SCANNED_COUNT = 'ScannedCount'
+INDEX_STATUS = 'IndexStatus'
+ACTIVE = 'ACTIVE'
+STREAM_SPECIFICATION = 'StreamSpecification'
+
+# Maximal size of the one Query/Scan page
+MAX_PAGE_SIZE = 1024 * 1024
+
+
+class MemoryDatabaseError(Exception):
+    """
+    Error of the in-memory database operation, code is the DynamoDB error code.
+    """
+
+    def __init__(self, code, message, **extra):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.extra = extra
+
+
+def validation_error(message):
+    return MemoryDatabaseError('ValidationException', message)
+
+
+def _get_key_names(key_schema):
+    hash_key, range_key = None, None
+    for key in key_schema:
+        if key[KEY_TYPE] == HASH:
+            hash_key = key[ATTR_NAME]
+        elif key[KEY_TYPE] == RANGE:
+            range_key = key[ATTR_NAME]
+    return hash_key, range_key
+
+
+class MemoryPartition:
+    """
+    Items with the same hash key sorted by the entry key (range key value followed by the table key values
+    for the secondary indexes).
+    """
+
+    __slots__ = ('entry_keys', 'range_values', 'items')
+
+    def __init__(self):
+        self.entry_keys = []
+        self.range_values = []
+        self.items = {}
+
+    def insert(self, entry_key, item):
+        if entry_key not in self.items:
+            position = bisect_left(self.entry_keys, entry_key)
+            self.entry_keys.insert(position, entry_key)
+            self.range_values.insert(position, entry_key[0] if entry_key else None)
+        self.items[entry_key] = item
+
+    def remove(self, entry_key):
+        if entry_key in self.items:
+            position = bisect_left(self.entry_keys, entry_key)
+            del self.entry_keys[position]
+            del self.range_values[position]
+            del self.items[entry_key]
+
+
+class MemoryIndex:
+    """
+    Sorted container of the table items (or secondary index entries) partitioned by the hash key.
+    """
+
+    def __init__(self, name, key_schema, projection=None, table_index=None):
+        self.name = name
+        self.key_schema = key_schema
+        self.hash_key, self.range_key = _get_key_names(key_schema)
+        self.projection = projection or {PROJECTION_TYPE: 'ALL'}
+        self.table_index = table_index
+        self.partitions = {}
+        self._sorted_hash_values = None
+
+    def get_hash_value(self, item):
+        value = item.get(self.hash_key)
+        return None if value is None else get_sort_value(value)
+
+    def get_entry_key(self, item):
+        entry_key = ()
+        if self.range_key:
+            value = item.get(self.range_key)
+            if value is None:
+                return None
+            entry_key = (get_sort_value(value),)
+        if self.table_index:
+            entry_key += (self.table_index.get_hash_value(item),) + self.table_index.get_entry_key(item)
+        return entry_key
+
+    def get_key(self, item):
+        key_names = [self.hash_key, self.range_key]
+        if self.table_index:
+            key_names += [self.table_index.hash_key, self.table_index.range_key]
+        return {name: item[name] for name in key_names if name}
+
+    @property
+    def sorted_hash_values(self):
+        if self._sorted_hash_values is None:
+            self._sorted_hash_values = sorted(self.partitions)
+        return self._sorted_hash_values
+
+    def insert(self, item):
+        hash_value, entry_key = self.get_hash_value(item), self.get_entry_key(item)
+        if hash_value is None or entry_key is None:
+            # Sparse index, item without the index keys is not indexed
+            return
+        partition = self.partitions.get(hash_value)
+        if partition is None:
+            partition = self.partitions[hash_value] = MemoryPartition()
+            self._sorted_hash_values = None
+        partition.insert(entry_key, item)
+
+    def remove(self, item):
+        hash_value, entry_key = self.get_hash_value(item), self.get_entry_key(item)
+        partition = self.partitions.get(hash_value)
+        if partition is not None:
+            partition.remove(entry_key)
+            if not partition.items:
+                del self.partitions[hash_value]
+                self._sorted_hash_values = None
+
+    def project(self, item):
+        projection_type = self.projection[PROJECTION_TYPE]
+        if projection_type == 'ALL' or self.table_index is None:
+            return item
+        attribute_names = set(self.get_key(item))
+        if projection_type == 'INCLUDE':
+            attribute_names |= set(self.projection.get(NON_KEY_ATTRIBUTES, ()))
+        return {name: value for name, value in item.items() if name in attribute_names}
+
+    def iter_partition(self, partition, range_condition=None, forward=True, exclusive_start_entry_key=None):
+        start, end = 0, len(partition.entry_keys)
+        if range_condition:
+            operator, values = range_condition[0], [get_sort_value(value) for value in range_condition[1:]]
+            range_values = partition.range_values
+            if operator == '=':
+                start, end = bisect_left(range_values, values[0]), bisect_right(range_values, values[0])
+            elif operator == '<':
+                end = bisect_left(range_values, values[0])
+            elif operator == '<=':
+                end = bisect_right(range_values, values[0])
+            elif operator == '>':
+                start = bisect_right(range_values, values[0])
+            elif operator == '>=':
+                start = bisect_left(range_values, values[0])
+            elif operator == 'between':
+                start, end = bisect_left(range_values, values[0]), bisect_right(range_values, values[1])
+            elif operator == 'begins_with':
+                start = end = bisect_left(range_values, values[0])
+                while end < len(range_values) and range_values[end].startswith(values[0]):
+                    end += 1
+
+        if exclusive_start_entry_key is not None:
+            if forward:
+                start = max(start, bisect_right(partition.entry_keys, exclusive_start_entry_key))
+            else:
+                end = min(end, bisect_left(partition.entry_keys, exclusive_start_entry_key))
+
+        positions = range(start, end) if forward else range(end - 1, start - 1, -1)
+        for position in positions:
+            yield partition.items[partition.entry_keys[position]]
+
+    def query(self, hash_value, range_condition=None, forward=True, exclusive_start_key=None):
+        partition = self.partitions.get(get_sort_value(hash_value))
+        if partition is None:
+            return iter(())
+        return self.iter_partition(
+            partition, range_condition, forward,
+            self.get_entry_key(exclusive_start_key) if exclusive_start_key else None
+        )
+
+    def scan(self, segment=None, total_segments=None, exclusive_start_key=None):
+        hash_values = self.sorted_hash_values
+        start = 0
+        exclusive_start_entry_key = None
+        if exclusive_start_key:
+            start_hash_value = self.get_hash_value(exclusive_start_key)
+            start = bisect_left(hash_values, start_hash_value)
+            if start < len(hash_values) and hash_values[start] == start_hash_value:
+                exclusive_start_entry_key = self.get_entry_key(exclusive_start_key)
+        for hash_value in hash_values[start:]:
+            if total_segments and get_segment(hash_value, total_segments) != segment:
+                continue
+            partition = self.partitions.get(hash_value)
+            if partition is None:
+                continue
+            yield from self.iter_partition(partition, exclusive_start_entry_key=exclusive_start_entry_key)
+            exclusive_start_entry_key = None
+
+
+def get_segment(hash_value, total_segments):
+    return zlib.crc32(repr(hash_value).encode('utf-8')) % total_segments
+
+
+class MemoryTable:
+
+    def __init__(self, name, attribute_definitions, key_schema, global_secondary_indexes=None,
+                 local_secondary_indexes=None, billing_mode=None, provisioned_throughput=None, **extra):
+        self.name = name
+        self.attribute_definitions = attribute_definitions
+        self.key_schema = key_schema
+        self.billing_mode = billing_mode or 'PROVISIONED'
+        self.provisioned_throughput = provisioned_throughput
+        self.extra = extra
+        self.point_in_time_recovery = False
+        self.time_to_live_specification = None
+        self.creation_time = time.time()
+        self.index = MemoryIndex(None, key_schema)
+        self.stream = None
+        self.secondary_indexes = {}
+        self.global_secondary_index_names = []
+        for index in global_secondary_indexes or ():
+            self.add_secondary_index(index, is_global=True)
+        for index in local_secondary_indexes or ():
+            self.add_secondary_index(index)
+        self.size = 0
+
+    @property
+    def arn(self):
+        return 'arn:aws:dynamodb:memory:000000000000:table/{}'.format(self.name)
+
+    @property
+    def hash_key(self):
+        return self.index.hash_key
+
+    @property
+    def range_key(self):
+        return self.index.range_key
+
+    def add_secondary_index(self, index, is_global=False):
+        secondary_index = MemoryIndex(index['IndexName'], index[KEY_SCHEMA], index.get(PROJECTION), self.index)
+        for hash_value in self.index.sorted_hash_values:
+            for item in self.index.partitions[hash_value].items.values():
+                secondary_index.insert(item)
+        self.secondary_indexes[secondary_index.name] = secondary_index
+        if is_global:
+            self.global_secondary_index_names.append(secondary_index.name)
+
+    def remove_secondary_index(self, name):
+        del self.secondary_indexes[name]
+        self.global_secondary_index_names.remove(name)
+
+    def get_index(self, name=None):
+        if name is None:
+            return self.index
+        if name not in self.secondary_indexes:
+            raise validation_error('The table does not have the specified index: {}'.format(name))
+        return self.secondary_indexes[name]
+
+    def get_key(self, key):
+        key = normalize_item(key)
+        if set(key) != {name for name in (self.hash_key, self.range_key) if name}:
+            raise validation_error('The provided key element does not match the schema')
+        return key
+
+    def get_item_key(self, item):
+        for name in (self.hash_key, self.range_key):
+            if name and name not in item:
+                raise validation_error(
+                    'One or more parameter values were invalid: Missing the key {} in the item'.format(name)
+                )
+        return self.index.get_key(item)
+
+    def get_item(self, key):
+        key = self.get_key(key)
+        partition = self.index.partitions.get(self.index.get_hash_value(key))
+        return partition.items.get(self.index.get_entry_key(key)) if partition else None
+
+    def put_item(self, item):
+        old_item = self.delete_item(self.get_item_key(item))
+        self.index.insert(item)
+        for index in self.secondary_indexes.values():
+            index.insert(item)
+        self.size += get_item_size(item)
+        return old_item
+
+    def delete_item(self, key):
+        old_item = self.get_item(key)
+        if old_item is not None:
+            self.index.remove(old_item)
+            for index in self.secondary_indexes.values():
+                index.remove(old_item)
+            self.size -= get_item_size(old_item)
+        return old_item
+
+    @property
+    def item_count(self):
+        return sum(len(partition.items) for partition in self.index.partitions.values())
+
+    def describe(self):
+        description = {
+            TABLE_NAME: self.name,
+            'TableArn': self.arn,
+            TABLE_STATUS: ACTIVE,
+            ATTR_DEFINITIONS: self.attribute_definitions,
+            KEY_SCHEMA: self.key_schema,
+            'ItemCount': self.item_count,
+            'TableSizeBytes': self.size,
+            'CreationDateTime': self.creation_time,
+            'BillingModeSummary': {BILLING_MODE: self.billing_mode},
+        }
+        if self.provisioned_throughput:
+            description[PROVISIONED_THROUGHPUT] = self.provisioned_throughput
+        global_indexes = [
+            self.secondary_indexes[name] for name in self.global_secondary_index_names
+        ]
+        local_indexes = [
+            index for name, index in self.secondary_indexes.items() if name not in self.global_secondary_index_names
+        ]
+        if global_indexes:
+            description[GLOBAL_SECONDARY_INDEXES] = [
+                {'IndexName': index.name, KEY_SCHEMA: index.key_schema, PROJECTION: index.projection,
+                 INDEX_STATUS: ACTIVE}
+                for index in global_indexes
+            ]
+        if local_indexes:
+            description[LOCAL_SECONDARY_INDEXES] = [
+                {'IndexName': index.name, KEY_SCHEMA: index.key_schema, PROJECTION: index.projection}
+                for index in local_indexes
+            ]
+        description.update(self.extra)
+        if self.stream:
+            description['LatestStreamArn'] = self.stream.arn
+            description['LatestStreamLabel'] = self.stream.label
+        return description
+
+
+def _get_capacity(table_name, units, operation_kwargs):
+    if operation_kwargs.get(RETURN_CONSUMED_CAPACITY, 'NONE') == 'NONE':
+        return {}
+    return {CONSUMED_CAPACITY: {TABLE_NAME: table_name, CAPACITY_UNITS: units}}
+
+
+def _get_read_units(size, consistent_read=False):
+    return max(math.ceil(size / 4096), 1) * (1 if consistent_read else 0.5)
+
+
+def _get_write_units(*items):
+    return max(max((math.ceil(get_item_size(item) / 1024) for item in items if item), default=1), 1)
+
+
+class MemoryDatabase:
+    """
+    In-process implementation of DynamoDB API operations used by pynamodb. Every operation is performed under
+    the database lock, therefore the operations are atomic and isolated.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.streams = {}
+        self.lock = threading.RLock()
+
+    def execute(self, operation_name, operation_kwargs):
+        method = getattr(self, '_{}'.format(operation_name), None)
+        if method is None:
+            raise validation_error('Operation {} is not supported by the in-memory database'.format(operation_name))
+        with self.lock:
+            try:
+                return method(operation_kwargs)
+            except ExpressionError as ex:
+                raise validation_error(str(ex))
+
+    def get_table(self, table_name):
+        table = self.tables.get(table_name)
+        if table is None:
+            raise MemoryDatabaseError(
+                'ResourceNotFoundException', 'Requested resource not found: Table: {} not found'.format(table_name)
+            )
+        return table
+
+    def _get_context(self, operation_kwargs):
+        return ExpressionContext(
+            operation_kwargs.get(EXPRESSION_ATTRIBUTE_NAMES),
+            normalize_item(operation_kwargs.get(EXPRESSION_ATTRIBUTE_VALUES))
+        )
+
+    def _check_condition(self, operation_kwargs, item, context=None):
+        expression = operation_kwargs.get(CONDITION_EXPRESSION)
+        if expression:
+            context = context or self._get_context(operation_kwargs)
+            if not context.evaluate_condition(parse_condition(expression), item or {}):
+                raise MemoryDatabaseError('ConditionalCheckFailedException', 'The conditional request failed')
+
+    def _project(self, operation_kwargs, item, context=None):
+        expression = operation_kwargs.get(PROJECTION_EXPRESSION)
+        if not expression:
+            return copy_item(item)
+        context = context or self._get_context(operation_kwargs)
+        return copy_item(context.project(parse_projection(expression), item))
+
+    def _CreateTable(self, operation_kwargs):
+        table_name = operation_kwargs[TABLE_NAME]
+        if table_name in self.tables:
+            raise MemoryDatabaseError('ResourceInUseException', 'Table already exists: {}'.format(table_name))
+        extra = {
+            key: value for key, value in operation_kwargs.items()
+            if key in {STREAM_SPECIFICATION, 'SSESpecification'} and value
+        }
+        table = self.tables[table_name] = MemoryTable(
+            table_name,
+            operation_kwargs[ATTR_DEFINITIONS],
+            operation_kwargs[KEY_SCHEMA],
+            global_secondary_indexes=operation_kwargs.get(GLOBAL_SECONDARY_INDEXES),
+            local_secondary_indexes=operation_kwargs.get(LOCAL_SECONDARY_INDEXES),
+            billing_mode=operation_kwargs.get(BILLING_MODE),
+            provisioned_throughput=operation_kwargs.get(PROVISIONED_THROUGHPUT),
+            **extra
+        )
+        self._set_stream(table, operation_kwargs.get(STREAM_SPECIFICATION))
+        return {'TableDescription': table.describe()}
+
+    def _set_stream(self, table, stream_specification):
+        if not stream_specification:
+            return
+        if table.stream:
+            table.stream.enabled = False
+            table.stream = None
+        if stream_specification.get('StreamEnabled'):
+            table.stream = MemoryStream(table, stream_specification[STREAM_VIEW_TYPE])
+            self.streams[table.stream.arn] = table.stream
+            table.extra[STREAM_SPECIFICATION] = stream_specification
+        else:
+            table.extra.pop(STREAM_SPECIFICATION, None)
+
+    def _DeleteTable(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        del self.tables[table.name]
+        if table.stream:
+            # Records of the disabled stream can be read until all shards are processed
+            table.stream.enabled = False
+        return {'TableDescription': table.describe()}
+
+    def _DescribeTable(self, operation_kwargs):
+        return {TABLE_KEY: self.get_table(operation_kwargs[TABLE_NAME]).describe()}
+
+    def _ListTables(self, operation_kwargs):
+        table_names = sorted(self.tables)
+        start_table_name = operation_kwargs.get(EXCLUSIVE_START_TABLE_NAME)
+        if start_table_name:
+            table_names = table_names[bisect_right(table_names, start_table_name):]
+        limit = operation_kwargs.get(LIMIT) or 100
+        data = {'TableNames': table_names[:limit]}
+        if len(table_names) > limit:
+            data[LAST_EVALUATED_TABLE_NAME] = table_names[limit - 1]
+        return data
+
+    def _UpdateTable(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        if operation_kwargs.get(BILLING_MODE):
+            table.billing_mode = operation_kwargs[BILLING_MODE]
+        if operation_kwargs.get(PROVISIONED_THROUGHPUT):
+            table.provisioned_throughput = operation_kwargs[PROVISIONED_THROUGHPUT]
+        if operation_kwargs.get(ATTR_DEFINITIONS):
+            table.attribute_definitions = operation_kwargs[ATTR_DEFINITIONS]
+        for index_update in operation_kwargs.get('GlobalSecondaryIndexUpdates') or ():
+            if 'Create' in index_update:
+                table.add_secondary_index(index_update['Create'], is_global=True)
+            elif 'Delete' in index_update:
+                table.remove_secondary_index(index_update['Delete']['IndexName'])
+        self._set_stream(table, operation_kwargs.get(STREAM_SPECIFICATION))
+        return {'TableDescription': table.describe()}
+
+    def _UpdateTimeToLive(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        table.time_to_live_specification = operation_kwargs['TimeToLiveSpecification']
+        return {'TimeToLiveSpecification': operation_kwargs['TimeToLiveSpecification']}
+
+    def _DescribeTimeToLive(self, operation_kwargs):
+        specification = self.get_table(operation_kwargs[TABLE_NAME]).time_to_live_specification
+        if not specification or not specification['Enabled']:
+            return {'TimeToLiveDescription': {'TimeToLiveStatus': 'DISABLED'}}
+        return {
+            'TimeToLiveDescription': {'TimeToLiveStatus': 'ENABLED', 'AttributeName': specification['AttributeName']}
+        }
+
+    def _UpdateContinuousBackups(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        enabled = operation_kwargs['PointInTimeRecoverySpecification']['PointInTimeRecoveryEnabled']
+        table.point_in_time_recovery = enabled
+        return {
+            'ContinuousBackupsDescription': {
+                'ContinuousBackupsStatus': 'ENABLED',
+                'PointInTimeRecoveryDescription': {
+                    'PointInTimeRecoveryStatus': 'ENABLED' if enabled else 'DISABLED'
+                }
+            }
+        }
+
+    def _GetItem(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        item = table.get_item(operation_kwargs[KEY])
+        data = _get_capacity(
+            table.name, _get_read_units(get_item_size(item) if item else 0, operation_kwargs.get('ConsistentRead')),
+            operation_kwargs
+        )
+        if item is not None:
+            data[ITEM] = self._project(operation_kwargs, item)
+        return data
+
+    def _get_return_values(self, operation_kwargs, old_item, new_item=None, updated_attributes=None):
+        return_values = operation_kwargs.get(RETURN_VALUES, 'NONE')
+        if return_values == 'ALL_OLD':
+            item = old_item
+        elif return_values == 'ALL_NEW':
+            item = new_item
+        elif return_values == 'UPDATED_OLD':
+            item = old_item and {k: v for k, v in old_item.items() if k in updated_attributes}
+        elif return_values == 'UPDATED_NEW':
+            item = new_item and {k: v for k, v in new_item.items() if k in updated_attributes}
+        else:
+            item = None
+        return {ATTRIBUTES: copy_item(item)} if item else {}
+
+    def _put(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        item = normalize_item(operation_kwargs[ITEM])
+        old_item = table.get_item(table.get_item_key(item))
+        self._check_condition(operation_kwargs, old_item)
+        return table, old_item, item
+
+    def _PutItem(self, operation_kwargs):
+        table, old_item, item = self._put(operation_kwargs)
+        self.write_item(table, old_item, item)
+        data = _get_capacity(table.name, _get_write_units(old_item, item), operation_kwargs)
+        data.update(self._get_return_values(operation_kwargs, old_item))
+        return data
+
+    def _delete(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        old_item = table.get_item(operation_kwargs[KEY])
+        self._check_condition(operation_kwargs, old_item)
+        return table, old_item, None
+
+    def _DeleteItem(self, operation_kwargs):
+        table, old_item, _ = self._delete(operation_kwargs)
+        self.write_item(table, old_item, None)
+        data = _get_capacity(table.name, _get_write_units(old_item), operation_kwargs)
+        data.update(self._get_return_values(operation_kwargs, old_item))
+        return data
+
+    def _update(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        key = table.get_key(operation_kwargs[KEY])
+        old_item = table.get_item(key)
+        context = self._get_context(operation_kwargs)
+        self._check_condition(operation_kwargs, old_item, context)
+
+        item = copy_item(old_item) if old_item else copy_item(key)
+        updated_attributes = set()
+        if operation_kwargs.get(UPDATE_EXPRESSION):
+            updated_attributes = context.apply_update(parse_update(operation_kwargs[UPDATE_EXPRESSION]), item)
+        if updated_attributes & set(key):
+            raise validation_error('Cannot update attribute {}. This attribute is part of the key'.format(
+                ', '.join(updated_attributes & set(key))
+            ))
+        return table, old_item, item, updated_attributes
+
+    def _UpdateItem(self, operation_kwargs):
+        table, old_item, item, updated_attributes = self._update(operation_kwargs)
+        self.write_item(table, old_item, item)
+        data = _get_capacity(table.name, _get_write_units(old_item, item), operation_kwargs)
+        data.update(self._get_return_values(operation_kwargs, old_item, item, updated_attributes))
+        return data
+
+    def write_item(self, table, old_item, new_item):
+        """
+        Stores the new version of the item (None for the deleted item) and adds the stream record of the change.
+        """
+        if new_item is None:
+            if old_item is not None:
+                table.delete_item(table.index.get_key(old_item))
+        else:
+            table.put_item(new_item)
+
+        if table.stream and old_item != new_item:
+            item = new_item or old_item
+            table.stream.add_record(
+                get_segment(table.index.get_hash_value(item), MEMORY_STREAM_SHARDS), table.index.get_key(item),
+                old_item, new_item
+            )
+
+    def _BatchWriteItem(self, operation_kwargs):
+        consumed_capacity = []
+        for table_name, requests in operation_kwargs[REQUEST_ITEMS].items():
+            table = self.get_table(table_name)
+            units = 0
+            for request in requests:
+                if PUT_REQUEST in request:
+                    item = normalize_item(request[PUT_REQUEST][ITEM])
+                    old_item = table.get_item(table.get_item_key(item))
+                    self.write_item(table, old_item, item)
+                    units += _get_write_units(item)
+                elif DELETE_REQUEST in request:
+                    old_item = table.get_item(request[DELETE_REQUEST][KEY])
+                    self.write_item(table, old_item, None)
+                    units += _get_write_units(old_item)
+            consumed_capacity.append({TABLE_NAME: table_name, CAPACITY_UNITS: units})
+        data = {UNPROCESSED_ITEMS: {}}
+        if operation_kwargs.get(RETURN_CONSUMED_CAPACITY, 'NONE') != 'NONE':
+            data[CONSUMED_CAPACITY] = consumed_capacity
+        return data
+
+    def _BatchGetItem(self, operation_kwargs):
+        responses, consumed_capacity = {}, []
+        for table_name, table_kwargs in operation_kwargs[REQUEST_ITEMS].items():
+            table = self.get_table(table_name)
+            items = [table.get_item(key) for key in table_kwargs[KEYS]]
+            responses[table_name] = [self._project(table_kwargs, item) for item in items if item is not None]
+            consumed_capacity.append({
+                TABLE_NAME: table_name,
+                CAPACITY_UNITS: sum(
+                    _get_read_units(get_item_size(item) if item else 0, table_kwargs.get('ConsistentRead'))
+                    for item in items
+                )
+            })
+        data = {RESPONSES: responses, UNPROCESSED_KEYS: {}}
+        if operation_kwargs.get(RETURN_CONSUMED_CAPACITY, 'NONE') != 'NONE':
+            data[CONSUMED_CAPACITY] = consumed_capacity
+        return data
+
+    def _TransactWriteItems(self, operation_kwargs):
+        item_keys = set()
+        for transact_item in operation_kwargs[TRANSACT_ITEMS]:
+            (operation_type, operation), = transact_item.items()
+            table = self.get_table(operation[TABLE_NAME])
+            if operation_type == TRANSACT_PUT:
+                key = table.get_item_key(operation[ITEM])
+            else:
+                key = table.get_key(operation[KEY])
+            item_key = (table.name, table.index.get_hash_value(key), table.index.get_entry_key(key))
+            if item_key in item_keys:
+                raise validation_error('Transaction request cannot include multiple operations on one item')
+            item_keys.add(item_key)
+
+        operations, reasons, failed = [], [], False
+        for transact_item in operation_kwargs[TRANSACT_ITEMS]:
+            (operation_type, operation), = transact_item.items()
+            try:
+                if operation_type == TRANSACT_CONDITION_CHECK:
+                    table = self.get_table(operation[TABLE_NAME])
+                    self._check_condition(operation, table.get_item(operation[KEY]))
+                elif operation_type == TRANSACT_PUT:
+                    operations.append(self._put(operation))
+                elif operation_type == TRANSACT_DELETE:
+                    operations.append(self._delete(operation))
+                elif operation_type == TRANSACT_UPDATE:
+                    operations.append(self._update(operation)[:3])
+                reasons.append({'Code': 'None'})
+            except MemoryDatabaseError as ex:
+                if ex.code != 'ConditionalCheckFailedException':
+                    raise
+                failed = True
+                reasons.append({'Code': 'ConditionalCheckFailed', 'Message': ex.message})
+        if failed:
+            raise MemoryDatabaseError(
+                'TransactionCanceledException',
+                'Transaction cancelled, please refer cancellation reasons for specific reasons [{}]'.format(
+                    ', '.join(reason['Code'] for reason in reasons)
+                ),
+                CancellationReasons=reasons
+            )
+
+        units = {}
+        for table, old_item, item in operations:
+            self.write_item(table, old_item, item)
+            units[table.name] = units.get(table.name, 0) + 2 * _get_write_units(old_item, item)
+        data = {}
+        if operation_kwargs.get(RETURN_CONSUMED_CAPACITY, 'NONE') != 'NONE':
+            data[CONSUMED_CAPACITY] = [
+                {TABLE_NAME: table_name, CAPACITY_UNITS: table_units} for table_name, table_units in units.items()
+            ]
+        return data
+
+    def _TransactGetItems(self, operation_kwargs):
+        responses, units = [], {}
+        for transact_item in operation_kwargs[TRANSACT_ITEMS]:
+            operation = transact_item[TRANSACT_GET]
+            table = self.get_table(operation[TABLE_NAME])
+            item = table.get_item(operation[KEY])
+            units[table.name] = units.get(table.name, 0) + 2 * _get_read_units(
+                get_item_size(item) if item else 0, True
+            )
+            responses.append({ITEM: self._project(operation, item)} if item is not None else {})
+        data = {RESPONSES: responses}
+        if operation_kwargs.get(RETURN_CONSUMED_CAPACITY, 'NONE') != 'NONE':
+            data[CONSUMED_CAPACITY] = [
+                {TABLE_NAME: table_name, CAPACITY_UNITS: table_units} for table_name, table_units in units.items()
+            ]
+        return data
+
+    def _get_key_condition(self, index, context, expression):
+        conditions, stack = [], [parse_condition(expression)]
+        while stack:
+            condition = stack.pop()
+            if condition[0] == 'and':
+                stack.extend((condition[2], condition[1]))
+            else:
+                conditions.append(condition)
+
+        hash_value, range_condition = None, None
+        for condition in conditions:
+            if condition[0] == 'compare':
+                path, operator, values = condition[2], condition[1], (condition[3],)
+            elif condition[0] == 'between':
+                path, operator, values = condition[1], 'between', condition[2:]
+            elif condition[0] == 'function' and condition[1] == 'begins_with':
+                path, operator, values = condition[2][0], 'begins_with', condition[2][1:]
+            else:
+                raise validation_error('Invalid KeyConditionExpression: {}'.format(expression))
+            if path[0] != 'path' or any(value[0] != 'value' for value in values):
+                raise validation_error('Invalid KeyConditionExpression: {}'.format(expression))
+            attribute_name = context.resolve_path(path)
+            values = [context.get_value(value[1]) for value in values]
+            if attribute_name == (index.hash_key,) and operator == '=' and hash_value is None:
+                hash_value = values[0]
+            elif attribute_name == (index.range_key,) and range_condition is None:
+                range_condition = (operator,) + tuple(values)
+            else:
+                raise validation_error('Query key condition not supported')
+        if hash_value is None:
+            raise validation_error('Query condition missed key schema element: {}'.format(index.hash_key))
+        return hash_value, range_condition
+
+    def _read_items(self, table, index, items, operation_kwargs, context):
+        """
+        Evaluates the filter, projection and limit of Query and Scan operations on the iterator of items.
+        """
+        limit = operation_kwargs.get(LIMIT)
+        filter_condition = (
+            parse_condition(operation_kwargs[FILTER_EXPRESSION]) if operation_kwargs.get(FILTER_EXPRESSION) else None
+        )
+        projection = (
+            parse_projection(operation_kwargs[PROJECTION_EXPRESSION])
+            if operation_kwargs.get(PROJECTION_EXPRESSION) else None
+        )
+        is_count = operation_kwargs.get(SELECT) == COUNT
+
+        result_items, scanned_count, size, last_item = [], 0, 0, None
+        for item in items:
+            item = index.project(item)
+            scanned_count += 1
+            size += get_item_size(item)
+            if filter_condition is None or context.evaluate_condition(filter_condition, item):
+                if not is_count:
+                    result_items.append(copy_item(context.project(projection, item) if projection else item))
+                else:
+                    result_items.append(None)
+            if (limit and scanned_count >= limit) or size >= MAX_PAGE_SIZE:
+                last_item = item
+                break
+
+        data = {'Count': len(result_items), SCANNED_COUNT: scanned_count}
+        if not is_count:
+            data[ITEMS] = result_items
+        if last_item is not None:
+            data[LAST_EVALUATED_KEY] = copy_item(index.get_key(last_item))
+        data.update(_get_capacity(
+            table.name, _get_read_units(size, operation_kwargs.get('ConsistentRead')), operation_kwargs
+        ))
+        return data
+
+    def _Query(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        index = table.get_index(operation_kwargs.get(INDEX_NAME))
+        context = self._get_context(operation_kwargs)
+        hash_value, range_condition = self._get_key_condition(
+            index, context, operation_kwargs[KEY_CONDITION_EXPRESSION]
+        )
+        exclusive_start_key = operation_kwargs.get(EXCLUSIVE_START_KEY)
+        items = index.query(
+            hash_value,
+            range_condition,
+            forward=operation_kwargs.get(SCAN_INDEX_FORWARD, True),
+            exclusive_start_key=normalize_item(exclusive_start_key) if exclusive_start_key else None,
+        )
+        return self._read_items(table, index, items, operation_kwargs, context)
+
+    def _Scan(self, operation_kwargs):
+        table = self.get_table(operation_kwargs[TABLE_NAME])
+        index = table.get_index(operation_kwargs.get(INDEX_NAME))
+        context = self._get_context(operation_kwargs)
+        exclusive_start_key = operation_kwargs.get(EXCLUSIVE_START_KEY)
+        items = index.scan(
+            segment=operation_kwargs.get(SEGMENT),
+            total_segments=operation_kwargs.get(TOTAL_SEGMENTS),
+            exclusive_start_key=normalize_item(exclusive_start_key) if exclusive_start_key else None,
+        )
+        return self._read_items(table, index, items, operation_kwargs, context)
+
+    def get_stream(self, stream_arn):
+        stream = self.streams.get(stream_arn)
+        if stream is None:
+            raise MemoryDatabaseError(
+                'ResourceNotFoundException', 'Requested resource not found: Stream: {} not found'.format(stream_arn)
+            )
+        return stream
+
+    def _ListStreams(self, operation_kwargs):
+        streams = [
+            stream for stream in self.streams.values()
+            if not operation_kwargs.get(TABLE_NAME) or stream.table_name == operation_kwargs[TABLE_NAME]
+        ]
+        return {
+            'Streams': [
+                {'StreamArn': stream.arn, 'TableName': stream.table_name, 'StreamLabel': stream.label}
+                for stream in streams
+            ]
+        }
+
+    def _DescribeStream(self, operation_kwargs):
+        return {'StreamDescription': self.get_stream(operation_kwargs['StreamArn']).describe()}
+
+    def _GetShardIterator(self, operation_kwargs):
+        stream = self.get_stream(operation_kwargs['StreamArn'])
+        shard_index = stream.get_shard_index(operation_kwargs['ShardId'])
+        if shard_index is None:
+            raise MemoryDatabaseError(
+                'ResourceNotFoundException', 'Requested resource not found: Shard does not exist'
+            )
+        position = stream.get_position(
+            shard_index, operation_kwargs['ShardIteratorType'], operation_kwargs.get('SequenceNumber')
+        )
+        if position is None:
+            raise validation_error('Invalid ShardIteratorType: {}'.format(operation_kwargs['ShardIteratorType']))
+        return {'ShardIterator': stream.get_iterator(shard_index, position)}
+
+    def _GetRecords(self, operation_kwargs):
+        try:
+            stream_arn, shard_index, position = parse_iterator(operation_kwargs['ShardIterator'])
+        except ValueError:
+            raise validation_error('Invalid ShardIterator')
+        stream = self.get_stream(stream_arn)
+        records = stream.shards[shard_index][position:position + (operation_kwargs.get(LIMIT) or 1000)]
+        position += len(records)
+        data = {'Records': copy.deepcopy(records)}
+        if stream.enabled or position < len(stream.shards[shard_index]):
+            data['NextShardIterator'] = stream.get_iterator(shard_index, position)
+        return data
@@ -0,0 +1,600 @@
+import re
+
+from decimal import Decimal
+from functools import lru_cache
+
+from pynamodb.constants import (
+    BINARY, BINARY_SET, BOOLEAN, LIST, MAP, NULL, NUMBER, NUMBER_SET, STRING, STRING_SET
+)
+
+
+class ExpressionError(Exception):
+    pass
+
+
+TOKEN_RE = re.compile(r'\s*(?:(<>|<=|>=|[=<>(),.\[\]+-])|(#[\w-]+)|(:[\w-]+)|(\d+)|([A-Za-z_]\w*))')
+
+OPERATOR, NAME, VALUE, INDEX, IDENTIFIER = 'operator', 'name', 'value', 'index', 'identifier'
+TOKEN_KINDS = (OPERATOR, NAME, VALUE, INDEX, IDENTIFIER)
+
+COMPARATORS = {'=', '<>', '<', '<=', '>', '>='}
+CONDITION_FUNCTIONS = {'attribute_exists', 'attribute_not_exists', 'attribute_type', 'begins_with', 'contains'}
+SET_TYPES = {STRING_SET, NUMBER_SET, BINARY_SET}
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_RE.match(expression, position)
+        if not match:
+            raise ExpressionError('Invalid expression "{}" at position {}'.format(expression, position))
+        kind = match.lastindex - 1
+        tokens.append((TOKEN_KINDS[kind], match.group(match.lastindex)))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    """
+    Recursive descent parser of DynamoDB condition, key condition, projection and update expressions. Expressions
+    are parsed to the tree of tuples, attribute name and value placeholders are resolved in the evaluation.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None)
+
+    def is_keyword(self, keyword, offset=0):
+        kind, value = self.peek(offset)
+        return kind == IDENTIFIER and value.upper() == keyword
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ExpressionError('Unexpected end of expression "{}"'.format(self.expression))
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        token = self.next()
+        if token[1] != value and not (token[0] == IDENTIFIER and token[1].upper() == value):
+            raise ExpressionError('Expected "{}" in expression "{}"'.format(value, self.expression))
+        return token
+
+    def expect_end(self):
+        if self.position != len(self.tokens):
+            raise ExpressionError('Unexpected token "{}" in expression "{}"'.format(
+                self.peek()[1], self.expression
+            ))
+
+    def parse_path(self):
+        kind, value = self.next()
+        if kind not in {NAME, IDENTIFIER}:
+            raise ExpressionError('Invalid document path in expression "{}"'.format(self.expression))
+        segments = [(kind, value)]
+        while True:
+            if self.peek() == (OPERATOR, '.'):
+                self.next()
+                kind, value = self.next()
+                if kind not in {NAME, IDENTIFIER}:
+                    raise ExpressionError('Invalid document path in expression "{}"'.format(self.expression))
+                segments.append((kind, value))
+            elif self.peek() == (OPERATOR, '['):
+                self.next()
+                kind, value = self.next()
+                if kind != INDEX:
+                    raise ExpressionError('Invalid list index in expression "{}"'.format(self.expression))
+                segments.append((INDEX, int(value)))
+                self.expect(']')
+            else:
+                return ('path', tuple(segments))
+
+    def parse_operand(self):
+        kind, value = self.peek()
+        if kind == VALUE:
+            self.next()
+            return ('value', value)
+        elif kind == IDENTIFIER and value.lower() == 'size' and self.peek(1) == (OPERATOR, '('):
+            self.next()
+            self.expect('(')
+            path = self.parse_path()
+            self.expect(')')
+            return ('size', path)
+        else:
+            return self.parse_path()
+
+    def parse_condition(self):
+        condition = self.parse_and()
+        while self.is_keyword('OR'):
+            self.next()
+            condition = ('or', condition, self.parse_and())
+        return condition
+
+    def parse_and(self):
+        condition = self.parse_not()
+        while self.is_keyword('AND'):
+            self.next()
+            condition = ('and', condition, self.parse_not())
+        return condition
+
+    def parse_not(self):
+        if self.is_keyword('NOT'):
+            self.next()
+            return ('not', self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value = self.peek()
+        if (kind, value) == (OPERATOR, '('):
+            self.next()
+            condition = self.parse_condition()
+            self.expect(')')
+            return condition
+        elif kind == IDENTIFIER and value.lower() in CONDITION_FUNCTIONS and self.peek(1) == (OPERATOR, '('):
+            self.next()
+            self.expect('(')
+            args = [self.parse_operand()]
+            while self.peek() == (OPERATOR, ','):
+                self.next()
+                args.append(self.parse_operand())
+            self.expect(')')
+            return ('function', value.lower(), tuple(args))
+
+        operand = self.parse_operand()
+        kind, value = self.peek()
+        if kind == OPERATOR and value in COMPARATORS:
+            self.next()
+            return ('compare', value, operand, self.parse_operand())
+        elif self.is_keyword('BETWEEN'):
+            self.next()
+            lower = self.parse_operand()
+            self.expect('AND')
+            return ('between', operand, lower, self.parse_operand())
+        elif self.is_keyword('IN'):
+            self.next()
+            self.expect('(')
+            values = [self.parse_operand()]
+            while self.peek() == (OPERATOR, ','):
+                self.next()
+                values.append(self.parse_operand())
+            self.expect(')')
+            return ('in', operand, tuple(values))
+        raise ExpressionError('Invalid condition in expression "{}"'.format(self.expression))
+
+    def parse_set_value(self):
+        value = self.parse_set_operand()
+        kind, operator = self.peek()
+        if kind == OPERATOR and operator in {'+', '-'}:
+            self.next()
+            return (operator, value, self.parse_set_operand())
+        return value
+
+    def parse_set_operand(self):
+        kind, value = self.peek()
+        if kind == IDENTIFIER and value.lower() in {'if_not_exists', 'list_append'} and \
+                self.peek(1) == (OPERATOR, '('):
+            self.next()
+            self.expect('(')
+            first = self.parse_set_value()
+            self.expect(',')
+            second = self.parse_set_value()
+            self.expect(')')
+            return (value.lower(), first, second)
+        return self.parse_operand()
+
+    def parse_update(self):
+        actions = []
+        while self.peek()[0] is not None:
+            clause = self.next()[1].upper()
+            if clause not in {'SET', 'REMOVE', 'ADD', 'DELETE'}:
+                raise ExpressionError('Invalid update clause "{}" in expression "{}"'.format(
+                    clause, self.expression
+                ))
+            while True:
+                path = self.parse_path()
+                if clause == 'SET':
+                    self.expect('=')
+                    actions.append(('set', path, self.parse_set_value()))
+                elif clause == 'REMOVE':
+                    actions.append(('remove', path))
+                else:
+                    actions.append((clause.lower(), path, self.parse_operand()))
+                if self.peek() != (OPERATOR, ','):
+                    break
+                self.next()
+        return tuple(actions)
+
+    def parse_projection(self):
+        paths = [self.parse_path()]
+        while self.peek() == (OPERATOR, ','):
+            self.next()
+            paths.append(self.parse_path())
+        return tuple(paths)
+
+
+@lru_cache(maxsize=1024)
+def parse_condition(expression):
+    parser = Parser(expression)
+    condition = parser.parse_condition()
+    parser.expect_end()
+    return condition
+
+
+@lru_cache(maxsize=1024)
+def parse_update(expression):
+    parser = Parser(expression)
+    return parser.parse_update()
+
+
+@lru_cache(maxsize=1024)
+def parse_projection(expression):
+    parser = Parser(expression)
+    paths = parser.parse_projection()
+    parser.expect_end()
+    return paths
+
+
+def format_number(value):
+    return '{:f}'.format(value.normalize())
+
+
+def get_comparable_value(value):
+    """
+    Converts serialized DynamoDB value to the python value which can be compared with the equality operator.
+    """
+    (attr_type, attr_value), = value.items()
+    if attr_type == NUMBER:
+        return attr_type, Decimal(attr_value)
+    elif attr_type == NUMBER_SET:
+        return attr_type, frozenset(Decimal(v) for v in attr_value)
+    elif attr_type in {STRING_SET, BINARY_SET}:
+        return attr_type, frozenset(attr_value)
+    elif attr_type == MAP:
+        return attr_type, {k: get_comparable_value(v) for k, v in attr_value.items()}
+    elif attr_type == LIST:
+        return attr_type, [get_comparable_value(v) for v in attr_value]
+    else:
+        return attr_type, attr_value
+
+
+def get_sort_value(value):
+    """
+    Returns python value used to order scalar (string, number, binary) keys.
+    """
+    (attr_type, attr_value), = value.items()
+    return Decimal(attr_value) if attr_type == NUMBER else attr_value
+
+
+def get_attr_type(value):
+    return next(iter(value))
+
+
+class ExpressionContext:
+    """
+    Evaluates parsed expressions on the serialized item with the expression attribute names and values.
+    """
+
+    def __init__(self, names=None, values=None):
+        self.names = names or {}
+        self.values = values or {}
+
+    def resolve_segment(self, segment):
+        kind, value = segment
+        if kind == NAME:
+            if value not in self.names:
+                raise ExpressionError('Attribute name placeholder "{}" is not defined'.format(value))
+            return self.names[value]
+        return value
+
+    def resolve_path(self, path):
+        return tuple(self.resolve_segment(segment) for segment in path[1])
+
+    def get_value(self, placeholder):
+        if placeholder not in self.values:
+            raise ExpressionError('Attribute value placeholder "{}" is not defined'.format(placeholder))
+        return self.values[placeholder]
+
+    def evaluate_operand(self, operand, item):
+        kind = operand[0]
+        if kind == 'value':
+            return self.get_value(operand[1])
+        elif kind == 'path':
+            return get_path_value(item, self.resolve_path(operand))
+        elif kind == 'size':
+            value = self.evaluate_operand(operand[1], item)
+            if value is None:
+                return None
+            (attr_type, attr_value), = value.items()
+            if attr_type == STRING:
+                return {NUMBER: str(len(attr_value))}
+            elif attr_type in {BINARY, LIST, MAP} | SET_TYPES:
+                return {NUMBER: str(len(attr_value))}
+            raise ExpressionError('Invalid operand type for size function')
+        raise ExpressionError('Invalid operand')
+
+    def evaluate_condition(self, condition, item):
+        kind = condition[0]
+        if kind == 'and':
+            return self.evaluate_condition(condition[1], item) and self.evaluate_condition(condition[2], item)
+        elif kind == 'or':
+            return self.evaluate_condition(condition[1], item) or self.evaluate_condition(condition[2], item)
+        elif kind == 'not':
+            return not self.evaluate_condition(condition[1], item)
+        elif kind == 'compare':
+            return compare(
+                condition[1], self.evaluate_operand(condition[2], item), self.evaluate_operand(condition[3], item)
+            )
+        elif kind == 'between':
+            value = self.evaluate_operand(condition[1], item)
+            return (
+                compare('>=', value, self.evaluate_operand(condition[2], item))
+                and compare('<=', value, self.evaluate_operand(condition[3], item))
+            )
+        elif kind == 'in':
+            value = self.evaluate_operand(condition[1], item)
+            return any(compare('=', value, self.evaluate_operand(option, item)) for option in condition[2])
+        elif kind == 'function':
+            return self.evaluate_function(condition[1], [self.evaluate_operand(arg, item) for arg in condition[2]])
+        raise ExpressionError('Invalid condition')
+
+    def evaluate_function(self, name, args):
+        value = args[0]
+        if name == 'attribute_exists':
+            return value is not None
+        elif name == 'attribute_not_exists':
+            return value is None
+        elif value is None:
+            return False
+        elif name == 'attribute_type':
+            return get_attr_type(value) == args[1][STRING]
+        elif name == 'begins_with':
+            (attr_type, attr_value), = value.items()
+            prefix_type, prefix = next(iter(args[1].items()))
+            return attr_type == prefix_type and attr_type in {STRING, BINARY} and attr_value.startswith(prefix)
+        elif name == 'contains':
+            (attr_type, attr_value), = value.items()
+            operand_type, operand_value = next(iter(args[1].items()))
+            if attr_type in {STRING, BINARY}:
+                return attr_type == operand_type and operand_value in attr_value
+            elif attr_type in SET_TYPES:
+                return attr_type[0] == operand_type and get_comparable_value(args[1])[1] in {
+                    get_comparable_value({operand_type: v})[1] for v in attr_value
+                }
+            elif attr_type == LIST:
+                return any(compare('=', v, args[1]) for v in attr_value)
+            return False
+        raise ExpressionError('Unknown function "{}"'.format(name))
+
+    def evaluate_set_value(self, value, item):
+        kind = value[0]
+        if kind in {'+', '-'}:
+            first, second = self.evaluate_set_value(value[1], item), self.evaluate_set_value(value[2], item)
+            if first is None or second is None or get_attr_type(first) != NUMBER or get_attr_type(second) != NUMBER:
+                raise ExpressionError('An operand in the update expression has an incorrect data type')
+            result = Decimal(first[NUMBER]) + Decimal(second[NUMBER]) * (1 if kind == '+' else -1)
+            return {NUMBER: format_number(result)}
+        elif kind == 'if_not_exists':
+            existing_value = self.evaluate_operand(value[1], item)
+            return self.evaluate_set_value(value[2], item) if existing_value is None else existing_value
+        elif kind == 'list_append':
+            first, second = self.evaluate_set_value(value[1], item), self.evaluate_set_value(value[2], item)
+            if first is None or second is None or get_attr_type(first) != LIST or get_attr_type(second) != LIST:
+                raise ExpressionError('An operand in the update expression has an incorrect data type')
+            return {LIST: first[LIST] + second[LIST]}
+        value = self.evaluate_operand(value, item)
+        if value is None:
+            raise ExpressionError('The provided expression refers to an attribute that does not exist in the item')
+        return value
+
+    def apply_update(self, actions, item):
+        """
+        Applies parsed update actions to the item and returns set of updated top level attribute names.
+        """
+        # All operands are evaluated against the original item
+        original_item = copy_item(item)
+        updated_attributes = set()
+        for action in actions:
+            path = self.resolve_path(action[1])
+            updated_attributes.add(path[0])
+            if action[0] == 'set':
+                set_path_value(item, path, copy_value(self.evaluate_set_value(action[2], original_item)))
+            elif action[0] == 'remove':
+                remove_path_value(item, path)
+            elif action[0] == 'add':
+                value = self.evaluate_operand(action[2], original_item)
+                existing_value = get_path_value(item, path)
+                attr_type = get_attr_type(value)
+                if existing_value is None:
+                    set_path_value(item, path, copy_value(value))
+                elif attr_type != get_attr_type(existing_value):
+                    raise ExpressionError('An operand in the update expression has an incorrect data type')
+                elif attr_type == NUMBER:
+                    set_path_value(item, path, {
+                        NUMBER: format_number(Decimal(existing_value[NUMBER]) + Decimal(value[NUMBER]))
+                    })
+                elif attr_type in SET_TYPES:
+                    set_path_value(item, path, {
+                        attr_type: existing_value[attr_type] + [
+                            v for v in value[attr_type] if v not in existing_value[attr_type]
+                        ]
+                    })
+                else:
+                    raise ExpressionError('ADD action is supported only for numbers and sets')
+            elif action[0] == 'delete':
+                value = self.evaluate_operand(action[2], original_item)
+                existing_value = get_path_value(item, path)
+                attr_type = get_attr_type(value)
+                if attr_type not in SET_TYPES:
+                    raise ExpressionError('DELETE action is supported only for sets')
+                if existing_value is not None:
+                    values = [v for v in existing_value[attr_type] if v not in value[attr_type]]
+                    if values:
+                        set_path_value(item, path, {attr_type: values})
+                    else:
+                        remove_path_value(item, path)
+        return updated_attributes
+
+    def project(self, paths, item):
+        projected_item = {}
+        for path in paths:
+            path = self.resolve_path(path)
+            value = get_path_value(item, path)
+            if value is None:
+                continue
+            if len(path) == 1:
+                projected_item[path[0]] = value
+            else:
+                # Nested paths are projected to the maps (list indexes are projected to the compacted lists)
+                current = projected_item
+                for segment, next_segment in zip(path, path[1:]):
+                    if isinstance(current, list):
+                        current.append({LIST: []} if isinstance(next_segment, int) else {MAP: {}})
+                        current = current[-1][LIST if isinstance(next_segment, int) else MAP]
+                    else:
+                        current = current.setdefault(
+                            segment, {LIST: []} if isinstance(next_segment, int) else {MAP: {}}
+                        )[LIST if isinstance(next_segment, int) else MAP]
+                if isinstance(current, list):
+                    current.append(value)
+                else:
+                    current[path[-1]] = value
+        return projected_item
+
+
+def compare(operator, first, second):
+    if first is None or second is None:
+        return operator == '<>' and (first is not None or second is not None)
+    if operator == '=':
+        return get_comparable_value(first) == get_comparable_value(second)
+    elif operator == '<>':
+        return get_comparable_value(first) != get_comparable_value(second)
+
+    first_type, second_type = get_attr_type(first), get_attr_type(second)
+    if first_type != second_type or first_type not in {STRING, NUMBER, BINARY}:
+        return False
+    first, second = get_sort_value(first), get_sort_value(second)
+    if operator == '<':
+        return first < second
+    elif operator == '<=':
+        return first <= second
+    elif operator == '>':
+        return first > second
+    else:
+        return first >= second
+
+
+def get_path_value(item, path):
+    value = item.get(path[0])
+    for segment in path[1:]:
+        if value is None:
+            return None
+        if isinstance(segment, int):
+            value = value.get(LIST)
+            value = value[segment] if value is not None and segment < len(value) else None
+        else:
+            value = value.get(MAP)
+            value = value.get(segment) if value is not None else None
+    return value
+
+
+def _get_parent_value(item, path):
+    parent = get_path_value(item, path[:-1])
+    segment = path[-1]
+    if parent is None or (LIST if isinstance(segment, int) else MAP) not in parent:
+        raise ExpressionError('The document path provided in the update expression is invalid for update')
+    return parent[LIST if isinstance(segment, int) else MAP], segment
+
+
+def set_path_value(item, path, value):
+    if len(path) == 1:
+        item[path[0]] = value
+        return
+    parent, segment = _get_parent_value(item, path)
+    if isinstance(segment, int) and segment >= len(parent):
+        parent.append(value)
+    else:
+        parent[segment] = value
+
+
+def remove_path_value(item, path):
+    if len(path) == 1:
+        item.pop(path[0], None)
+        return
+    try:
+        parent, segment = _get_parent_value(item, path)
+    except ExpressionError:
+        return
+    if isinstance(segment, int):
+        if segment < len(parent):
+            del parent[segment]
+    else:
+        parent.pop(segment, None)
+
+
+def copy_value(value):
+    (attr_type, attr_value), = value.items()
+    if attr_type == MAP:
+        return {MAP: {k: copy_value(v) for k, v in attr_value.items()}}
+    elif attr_type == LIST:
+        return {LIST: [copy_value(v) for v in attr_value]}
+    elif attr_type in SET_TYPES:
+        return {attr_type: list(attr_value)}
+    return {attr_type: attr_value}
+
+
+def copy_item(item):
+    return {name: copy_value(value) for name, value in item.items()}
+
+
+def normalize_value(value):
+    """
+    Converts the request value to the stored form, binary values are stored as bytes the same way as DynamoDB
+    stores them after the base64 decoding.
+    """
+    (attr_type, attr_value), = value.items()
+    if attr_type == BINARY:
+        return {BINARY: attr_value.encode('utf-8') if isinstance(attr_value, str) else attr_value}
+    elif attr_type == BINARY_SET:
+        return {BINARY_SET: [v.encode('utf-8') if isinstance(v, str) else v for v in attr_value]}
+    elif attr_type in {STRING_SET, NUMBER_SET}:
+        return {attr_type: list(attr_value)}
+    elif attr_type == MAP:
+        return {MAP: {k: normalize_value(v) for k, v in attr_value.items()}}
+    elif attr_type == LIST:
+        return {LIST: [normalize_value(v) for v in attr_value]}
+    elif attr_type in {STRING, NUMBER, BOOLEAN, NULL}:
+        return {attr_type: attr_value}
+    raise ExpressionError('Unknown attribute type "{}"'.format(attr_type))
+
+
+def normalize_item(item):
+    return {name: normalize_value(value) for name, value in (item or {}).items()}
+
+
+def get_value_size(value):
+    (attr_type, attr_value), = value.items()
+    if attr_type == STRING:
+        return len(attr_value.encode('utf-8'))
+    elif attr_type == NUMBER:
+        return len(attr_value) // 2 + 1
+    elif attr_type == BINARY:
+        return len(attr_value)
+    elif attr_type in {BOOLEAN, NULL}:
+        return 1
+    elif attr_type in SET_TYPES:
+        return sum(get_value_size({attr_type[0]: v}) for v in attr_value)
+    elif attr_type == MAP:
+        return 3 + sum(len(k) + 1 + get_value_size(v) for k, v in attr_value.items())
+    else:
+        return 3 + sum(1 + get_value_size(v) for v in attr_value)
+
+
+def get_item_size(item):
+    return sum(len(name.encode('utf-8')) + get_value_size(value) for name, value in item.items())
@@ -0,0 +1,127 @@
+import itertools
+import time
+
+from datetime import datetime, timezone
+
+from .expressions import copy_item, get_item_size
+
+
+STREAM_VIEW_TYPE = 'StreamViewType'
+KEYS_ONLY = 'KEYS_ONLY'
+NEW_IMAGE = 'NEW_IMAGE'
+OLD_IMAGE = 'OLD_IMAGE'
+NEW_AND_OLD_IMAGES = 'NEW_AND_OLD_IMAGES'
+
+INSERT = 'INSERT'
+MODIFY = 'MODIFY'
+REMOVE = 'REMOVE'
+
+# Number of shards of the in-memory stream, records of the same item are always stored to the same shard
+MEMORY_STREAM_SHARDS = 2
+
+ITERATOR_SEPARATOR = '|'
+
+
+_stream_counter = itertools.count(1)
+
+
+class MemoryStream:
+    """
+    Stream of the in-memory table. Records are split to the fixed number of shards which are never closed until
+    the stream is disabled.
+    """
+
+    def __init__(self, table, view_type):
+        self.table_name = table.name
+        self.key_schema = table.key_schema
+        self.view_type = view_type
+        self.label = '{}.{:06d}'.format(
+            datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S'), next(_stream_counter)
+        )
+        self.arn = '{}/stream/{}'.format(table.arn, self.label)
+        self.enabled = True
+        self.shards = [[] for _ in range(MEMORY_STREAM_SHARDS)]
+        self._sequence_numbers = itertools.count(1)
+
+    def get_shard_id(self, shard_index):
+        return 'shardId-{:08d}'.format(shard_index)
+
+    def get_shard_index(self, shard_id):
+        for shard_index in range(len(self.shards)):
+            if self.get_shard_id(shard_index) == shard_id:
+                return shard_index
+        return None
+
+    def add_record(self, shard_index, keys, old_item, new_item):
+        if old_item is None:
+            event_name = INSERT
+        elif new_item is None:
+            event_name = REMOVE
+        else:
+            event_name = MODIFY
+
+        sequence_number = '{:021d}'.format(next(self._sequence_numbers))
+        stream_record = {
+            'ApproximateCreationDateTime': datetime.now(timezone.utc),
+            'Keys': copy_item(keys),
+            'SequenceNumber': sequence_number,
+            'SizeBytes': get_item_size(new_item or old_item),
+            STREAM_VIEW_TYPE: self.view_type,
+        }
+        if new_item is not None and self.view_type in {NEW_IMAGE, NEW_AND_OLD_IMAGES}:
+            stream_record['NewImage'] = copy_item(new_item)
+        if old_item is not None and self.view_type in {OLD_IMAGE, NEW_AND_OLD_IMAGES}:
+            stream_record['OldImage'] = copy_item(old_item)
+        self.shards[shard_index].append({
+            'eventID': '{}-{}'.format(self.label, sequence_number),
+            'eventName': event_name,
+            'eventVersion': '1.1',
+            'eventSource': 'aws:dynamodb',
+            'awsRegion': 'memory',
+            'dynamodb': stream_record,
+        })
+
+    def get_position(self, shard_index, iterator_type, sequence_number=None):
+        records = self.shards[shard_index]
+        if iterator_type == 'TRIM_HORIZON':
+            return 0
+        elif iterator_type == 'LATEST':
+            return len(records)
+        elif iterator_type in {'AT_SEQUENCE_NUMBER', 'AFTER_SEQUENCE_NUMBER'}:
+            for position, record in enumerate(records):
+                record_sequence_number = int(record['dynamodb']['SequenceNumber'])
+                if (record_sequence_number > int(sequence_number) or (
+                        iterator_type == 'AT_SEQUENCE_NUMBER' and record_sequence_number == int(sequence_number))):
+                    return position
+            return len(records)
+        return None
+
+    def get_iterator(self, shard_index, position):
+        return ITERATOR_SEPARATOR.join((self.arn, str(shard_index), str(position), str(time.time())))
+
+    def describe(self):
+        return {
+            'StreamArn': self.arn,
+            'StreamLabel': self.label,
+            'StreamStatus': 'ENABLED' if self.enabled else 'DISABLED',
+            STREAM_VIEW_TYPE: self.view_type,
+            'TableName': self.table_name,
+            'KeySchema': self.key_schema,
+            'Shards': [
+                {
+                    'ShardId': self.get_shard_id(shard_index),
+                    'SequenceNumberRange': dict(
+                        {'StartingSequenceNumber': records[0]['dynamodb']['SequenceNumber'] if records else '0'},
+                        **({} if self.enabled or not records else {
+                            'EndingSequenceNumber': records[-1]['dynamodb']['SequenceNumber']
+                        })
+                    )
+                }
+                for shard_index, records in enumerate(self.shards)
+            ]
+        }
+
+
+def parse_iterator(iterator):
+    arn, shard_index, position, _ = iterator.rsplit(ITERATOR_SEPARATOR, 3)
+    return arn, int(shard_index), int(position)
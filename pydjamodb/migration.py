@@ -0,0 +1,237 @@
+import math
+import threading
+
+from pynamodb.constants import ITEM
+from pynamodb.exceptions import TransactWriteError, UpdateError
+from pynamodb.expressions.operand import Path, Value
+
+from .aggregates import get_model_aggregates, update_aggregates
+from .memory.expressions import get_item_size
+from .transaction import MAX_TRANSACT_ITEMS, Transaction, TransactionError
+from .utils import (
+    RateLimiter, ThroughputCounter, chunks, decode_raw_item, encode_raw_item, get_consumed_capacity, load_checkpoint,
+    parallel_scan, store_checkpoint
+)
+
+
+CONDITIONAL_CHECK_FAILED = 'ConditionalCheckFailedException'
+
+
+class DynamoDBMigrationError(Exception):
+    pass
+
+
+class DynamoDBMigration:
+    """
+    Base class of DynamoDB data migrations. Items of the model table are scanned with the parallel scan, every
+    item is passed to the transform method and changed attributes are written back with conditional updates
+    (item is updated only if the changed attributes were not modified after the scan). Conflicting items are
+    read again and transformed up to max_conflict_retries times. Progress is stored per scan segment to the
+    checkpoint file, therefore the interrupted migration can be resumed.
+
+    Items are migrated at least once: the resumed migration scans the last unfinished page of every segment again,
+    therefore transform must be idempotent (e.g. migrated items are marked and skipped). Batches are always
+    written with one transaction (batch_size is limited to 100 items), if the transaction cannot be sent or it is
+    cancelled, nothing is written and items are updated one by one. Precomputed aggregates of the model are
+    updated with every written change.
+
+    Capacity budget limits capacity units consumed by the scan, reads and writes. Transactional writes consume twice
+    the write units of standard writes, cancelled transactions and failed conditional updates consume write units
+    too, but DynamoDB does not return them, therefore they are estimated from the item size.
+    """
+
+    model = None
+    total_segments = 4
+    batch_size = 25
+    page_size = None
+    capacity_budget = None
+    max_conflict_retries = 3
+
+    def __init__(self, total_segments=None, batch_size=None, page_size=None, capacity_budget=None):
+        if self.model is None:
+            raise DynamoDBMigrationError('Migration model is not set')
+        self.total_segments = total_segments or self.total_segments
+        self.batch_size = min(batch_size or self.batch_size, MAX_TRANSACT_ITEMS)
+        self.page_size = page_size or self.page_size
+        self.capacity_budget = capacity_budget or self.capacity_budget
+        self.counter = ThroughputCounter()
+        self.stats = {'updated': 0, 'skipped': 0, 'conflicts': 0}
+        self._capacity_limiter = RateLimiter(self.capacity_budget)
+        self._lock = threading.Lock()
+
+    def transform(self, instance):
+        """
+        Returns the changed model instance or None if the item should be skipped.
+        """
+        raise NotImplementedError
+
+    def _add_stat(self, name, count=1):
+        with self._lock:
+            self.stats[name] += count
+
+    def _get_update(self, raw_item):
+        original_instance = self.model.from_raw_data(raw_item)
+        original_item = original_instance.serialize()
+        instance = self.transform(self.model.from_raw_data(raw_item))
+        if instance is None:
+            return None
+
+        transformed_item = instance.serialize()
+        if instance._get_serialized_keys() != original_instance._get_serialized_keys():
+            raise DynamoDBMigrationError('Migration cannot change keys of the item')
+
+        actions = []
+        condition = Path(self.model._hash_key_attribute()).exists()
+        for attr in self.model.get_attributes().values():
+            original_value = original_item.get(attr.attr_name)
+            transformed_value = transformed_item.get(attr.attr_name)
+            if original_value == transformed_value:
+                continue
+            if transformed_value is None:
+                actions.append(Path(attr).remove())
+            else:
+                actions.append(Path(attr).set(Value(transformed_value)))
+            # Condition uses the scanned value, the stored value can differ from the serialized one
+            raw_value = raw_item.get(attr.attr_name)
+            if raw_value is None:
+                condition &= Path(attr).does_not_exist()
+            else:
+                condition &= Path(attr) == Value(raw_value)
+        return (instance, actions, condition) if actions else None
+
+    def _get_raw_item(self, instance):
+        hash_key, range_key = instance._get_hash_range_key_serialized_values()
+        data = self.model._get_connection().get_item(hash_key, range_key=range_key, consistent_read=True)
+        self._capacity_limiter.acquire(get_consumed_capacity(data))
+        return data.get(ITEM)
+
+    def _write_update(self, instance, actions, condition):
+        if not get_model_aggregates(self.model):
+            return instance.update(actions, condition=condition)
+        # Model.update is not allowed for models with aggregates, aggregates are updated with the known change
+        hash_key, range_key = instance._get_hash_range_key_serialized_values()
+        return self.model._get_connection().update_item(
+            hash_key, range_key=range_key, actions=actions, condition=condition
+        )
+
+    def _get_write_units(self, raw_item, instance):
+        item_size = max(get_item_size(raw_item), get_item_size(instance.serialize()))
+        return max(math.ceil(item_size / 1024), 1)
+
+    def _update_aggregates(self, raw_item, instance):
+        # Condition of the update guarantees changed attributes had the scanned values
+        if get_model_aggregates(self.model):
+            update_aggregates(self.model, raw_item, instance.serialize())
+
+    def _update_item(self, raw_item):
+        for attempt in range(self.max_conflict_retries + 1):
+            update = self._get_update(raw_item)
+            if update is None:
+                self._add_stat('skipped')
+                return
+            instance, actions, condition = update
+            try:
+                data = self._write_update(instance, actions, condition)
+                self._capacity_limiter.acquire(get_consumed_capacity(data))
+                self._update_aggregates(raw_item, instance)
+                self._add_stat('updated')
+                return
+            except UpdateError as ex:
+                if ex.cause_response_code != CONDITIONAL_CHECK_FAILED:
+                    raise
+                self._capacity_limiter.acquire(self._get_write_units(raw_item, instance))
+                if attempt == self.max_conflict_retries:
+                    raise
+                self._add_stat('conflicts')
+                raw_item = self._get_raw_item(instance)
+                if raw_item is None:
+                    # Item was removed after the scan
+                    self._add_stat('skipped')
+                    return
+
+    def _update_batch(self, raw_items):
+        transaction = Transaction()
+        updated_items, skipped_count = [], 0
+        for raw_item in raw_items:
+            update = self._get_update(raw_item)
+            if update is None:
+                skipped_count += 1
+            else:
+                transaction.update(update[0], update[1], condition=update[2])
+                updated_items.append((raw_item, update[0]))
+        self._add_stat('skipped', skipped_count)
+        if not updated_items:
+            return
+
+        try:
+            responses = transaction.commit()
+        except (TransactWriteError, TransactionError) as ex:
+            # The whole transaction is cancelled if one item was changed (or it is not sent if it exceeds transaction
+            # size limit), items are updated one by one
+            if isinstance(ex, TransactWriteError):
+                self._capacity_limiter.acquire(
+                    2 * sum(self._get_write_units(raw_item, instance) for raw_item, instance in updated_items)
+                )
+            for raw_item, _ in updated_items:
+                self._update_item(raw_item)
+        else:
+            self._capacity_limiter.acquire(sum(get_consumed_capacity(response) for response in responses))
+            for raw_item, instance in updated_items:
+                self._update_aggregates(raw_item, instance)
+            self._add_stat('updated', len(updated_items))
+
+    def migrate_page(self, items):
+        for raw_items in chunks(items, self.batch_size):
+            self._update_batch(raw_items)
+
+    def run(self, checkpoint_path=None, callback=None):
+        """
+        Runs the migration and returns its statistics. Callback is called with the migration after every
+        processed page.
+        """
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint is None:
+            checkpoint = {
+                'total_segments': self.total_segments,
+                'count': 0,
+                'stats': self.stats,
+                'segments': {
+                    str(segment): {'last_evaluated_key': None, 'done': False} for segment in range(self.total_segments)
+                }
+            }
+        self.counter = ThroughputCounter(checkpoint['count'])
+        self.stats = checkpoint['stats']
+
+        def process_page(segment, items, last_evaluated_key):
+            self.migrate_page(items)
+            with self._lock:
+                self.counter.add(len(items))
+                checkpoint['count'] = self.counter.count
+                checkpoint['segments'][str(segment)] = {
+                    'last_evaluated_key': last_evaluated_key and encode_raw_item(last_evaluated_key),
+                    'done': not last_evaluated_key
+                }
+                store_checkpoint(checkpoint_path, checkpoint)
+            if callback:
+                callback(self)
+
+        parallel_scan(
+            self.model._get_connection(),
+            checkpoint['total_segments'],
+            process_page,
+            segments=[
+                int(segment) for segment, segment_checkpoint in checkpoint['segments'].items()
+                if not segment_checkpoint['done']
+            ],
+            segment_start_keys={
+                int(segment): decode_raw_item(segment_checkpoint['last_evaluated_key'])
+                for segment, segment_checkpoint in checkpoint['segments'].items()
+                if segment_checkpoint['last_evaluated_key']
+            },
+            page_size=self.page_size,
+            capacity_limiter=self._capacity_limiter,
+        )
+        return self.stats
+
+    def __str__(self):
+        return '{}, updated {updated}, skipped {skipped}, conflicts {conflicts}'.format(self.counter, **self.stats)
@@ -1,14 +1,35 @@
 from django.conf import settings
 
+from pynamodb.constants import ALL_OLD, ATTRIBUTES
 from pynamodb.models import MetaModel, Model
-
-from .connection import TableConnection
+from pynamodb.settings import OperationSettings
+
+from .aggregates import (
+    DynamoDBAggregateError, get_aggregate_model_class, get_model_aggregates, update_aggregates,
+    validate_model_aggregates
+)
+from .attributes import LazyAttributeValues, is_lazy_deserialization_enabled
+from .buffer import get_current_write_buffer
 from .queryset import DynamoDBManager
+from .transaction import get_current_transaction
 
 
 dynamodb_model_classes = []
 
 
+def get_dynamodb_model_class(name):
+    """
+    Returns DynamoDB model class according to its name, full python path or table name.
+    """
+    for model_class in dynamodb_model_classes:
+        if name in {
+                model_class.__name__,
+                '{}.{}'.format(model_class.__module__, model_class.__name__),
+                model_class.Meta.table_name}:
+            return model_class
+    raise LookupError('DynamoDB model "{}" does not exist'.format(name))
+
+
 class DynamoMetaModel(MetaModel):
 
     def __init__(cls, name, bases, attrs):
@@ -33,11 +54,11 @@ class DynamoMetaModel(MetaModel):
 
         super().__init__(name, bases, attrs)
 
-        if meta and not hasattr(cls.Meta, 'billing_mode'):
-            meta.billing_mode = settings.PYDJAMODB_DATABASE.get('BILLING_MODE')
-
         if not abstract and not isproxy:
             dynamodb_model_classes.append(cls)
+            if get_model_aggregates(cls):
+                validate_model_aggregates(cls)
+                get_aggregate_model_class()
 
         for k, v in attrs.items():
             if isinstance(v, DynamoDBManager):
@@ -46,16 +67,122 @@ class DynamoMetaModel(MetaModel):
 
 class DynamoModel(Model, metaclass=DynamoMetaModel):
 
+    @classmethod
+    def _init_meta_settings(cls):
+        # Settings are read with the first table operation, not when the model class is defined
+        if not hasattr(cls.Meta, 'billing_mode'):
+            cls.Meta.billing_mode = settings.PYDJAMODB_DATABASE.get('BILLING_MODE')
+
     @classmethod
     def _get_connection(cls):
         if cls._connection is None:
+            from .connection import TableConnection
+
+            cls._init_meta_settings()
             cls._connection = TableConnection(cls.Meta.table_name)
         return cls._connection
 
+    @classmethod
+    def _get_schema(cls):
+        cls._init_meta_settings()
+        return super()._get_schema()
+
+    @classmethod
+    def _instantiate(cls, attribute_values):
+        if not getattr(cls.Meta, 'lazy_deserialization', False) and not is_lazy_deserialization_enabled():
+            return super()._instantiate(attribute_values)
+
+        stored_cls = cls._get_discriminator_class(attribute_values)
+        if stored_cls and not issubclass(stored_cls, cls):
+            raise ValueError('Cannot instantiate a {} from the returned class: {}'.format(
+                cls.__name__, stored_cls.__name__))
+        instance = (stored_cls or cls)(_user_instantiated=False)
+        instance.attribute_values = LazyAttributeValues(
+            instance.attribute_values, attribute_values, instance.get_attributes()
+        )
+        return instance
+
     @classmethod
     def delete_table(cls, wait=False):
         return cls._get_connection().delete_table(wait)
 
+    @classmethod
+    def batch_write(cls, auto_commit=True, settings=OperationSettings.default):
+        if get_model_aggregates(cls):
+            # BatchWriteItem does not return previous versions of the items, aggregates cannot be updated
+            raise DynamoDBAggregateError('Model with aggregates cannot be written in batch, use save instead')
+        return super().batch_write(auto_commit=auto_commit, settings=settings)
+
+    @classmethod
+    def _delete_item_with_aggregates(cls, hash_key, range_key=None, condition=None,
+                                     settings=OperationSettings.default):
+        """
+        Deletes the item with the serialized keys and updates precomputed aggregates with the removed item.
+        """
+        data = cls._get_connection().delete_item(
+            hash_key, range_key=range_key, condition=condition, return_values=ALL_OLD, settings=settings
+        )
+        update_aggregates(cls, data.get(ATTRIBUTES), None)
+        return data
+
+    def _get_write_buffer(self, condition):
+        # Conditional writes, versioned models and models with aggregates cannot be sent in the BatchWriteItem
+        # request
+        if condition is None and self._version_attribute_name is None and not get_model_aggregates(self.__class__):
+            return get_current_write_buffer(self.__class__)
+        return None
+
+    def _get_current_transaction(self):
+        transaction = get_current_transaction()
+        if transaction is not None and get_model_aggregates(self.__class__):
+            raise DynamoDBAggregateError('Model with aggregates cannot be changed in the transaction')
+        return transaction
+
+    def save(self, condition=None, settings=OperationSettings.default):
+        transaction = self._get_current_transaction()
+        if transaction is not None:
+            transaction.save(self, condition=condition)
+            return None
+        write_buffer = self._get_write_buffer(condition)
+        if write_buffer is not None:
+            write_buffer.save(self)
+            return None
+        if get_model_aggregates(self.__class__):
+            # Previous version of the item is returned to update aggregates with the difference
+            args, kwargs = self._get_save_args(condition=condition)
+            data = self._get_connection().put_item(*args, return_values=ALL_OLD, settings=settings, **kwargs)
+            self.update_local_version_attribute()
+            update_aggregates(self.__class__, data.get(ATTRIBUTES), self.serialize())
+            return data
+        return super().save(condition=condition, settings=settings)
+
+    def update(self, actions, condition=None, settings=OperationSettings.default):
+        if get_model_aggregates(self.__class__):
+            # UpdateItem returns either the previous or the new version of the item, aggregates require both
+            raise DynamoDBAggregateError('Model with aggregates cannot be updated, use save instead')
+        transaction = get_current_transaction()
+        if transaction is not None:
+            transaction.update(self, actions, condition=condition)
+            return None
+        return super().update(actions, condition=condition, settings=settings)
+
+    def delete(self, condition=None, settings=OperationSettings.default):
+        transaction = self._get_current_transaction()
+        if transaction is not None:
+            transaction.delete(self, condition=condition)
+            return None
+        write_buffer = self._get_write_buffer(condition)
+        if write_buffer is not None:
+            write_buffer.delete(self)
+            return None
+        if get_model_aggregates(self.__class__):
+            hash_key, range_key = self._get_hash_range_key_serialized_values()
+            version_condition = self._handle_version_attribute()
+            if version_condition is not None:
+                condition &= version_condition
+            return self._delete_item_with_aggregates(hash_key, range_key, condition=condition, settings=settings)
+        return super().delete(condition=condition, settings=settings)
+
     def __eq__(self, other):
         return repr(self) == repr(other)
 
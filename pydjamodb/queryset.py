@@ -1,5 +1,17 @@
 import inspect
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from pynamodb.constants import ALL, BATCH_WRITE_PAGE_LIMIT, ITEMS
+
+from .aggregates import Count, get_model_aggregates, get_precomputed_aggregates, store_recomputed_aggregates
+from .attributes import lazy_deserialization
+from .columnar import decode_columns
+from .utils import batch_get_items, batch_write_items, chunks
+
 
 KEYS_SEPARATOR = '||'
 
@@ -43,7 +55,9 @@ class DynamoDBQuerySet:
         self._index = None
         self._scan_index_forward = True
         self._filter = None
+        self._filter_lookup = None
         self._next_key = None
+        self._lazy = False
         self._init()
 
     def _clone(self):
@@ -58,6 +72,8 @@ class DynamoDBQuerySet:
         c._index = self._index
         c._scan_index_forward = self._scan_index_forward
         c._filter = self._filter
+        c._filter_lookup = self._filter_lookup
+        c._lazy = self._lazy
         if isinstance(self._execution, NoneExecution):
             c._execution = self._execution
             c._results = self._results
@@ -71,22 +87,53 @@ class DynamoDBQuerySet:
         self._execution = None
         self._results = None
 
-    def _process_execution(self):
+    def _get_execution(self, attributes_to_get=None):
         query = self._index.query if self._index else self._model.query
 
         if self._hash_key is None:
             raise DynamoDBQuerySetError('Hash key must be set')
 
-        self._execution = query(
+        return query(
             self._hash_key,
             self._filter,
             limit=self._limit,
             last_evaluated_key=self._last_evaluated_key,
-            scan_index_forward=self._scan_index_forward
+            scan_index_forward=self._scan_index_forward,
+            attributes_to_get=attributes_to_get
         )
-        self._results = list(self._execution)
+
+    def _process_execution(self):
+        self._execution = self._get_execution()
+        with lazy_deserialization() if self._lazy else nullcontext():
+            self._results = list(self._execution)
         self._next_key = self._execution.last_evaluated_key
 
+    def _iter_raw_pages(self, attributes_to_get=None):
+        if isinstance(self._execution, NoneExecution):
+            return
+
+        limit = self._limit
+        for page in self._get_execution(attributes_to_get).page_iter:
+            items = page.get(ITEMS, [])
+            if limit is not None:
+                items = items[:limit]
+                limit -= len(items)
+            if items:
+                yield items
+            if limit == 0:
+                break
+
+    def raw(self, columnar=False, use_numpy=False):
+        """
+        Iterates raw DynamoDB items without model instantiation. If columnar is set, one dict of decoded
+        columns (attribute name => list of values) is returned per each DynamoDB page.
+        """
+        for items in self._iter_raw_pages():
+            if columnar:
+                yield decode_columns(self._model, items, use_numpy=use_numpy)
+            else:
+                yield from items
+
     def _execute(self):
         if not self._execution:
             self._process_execution()
@@ -116,6 +163,11 @@ class DynamoDBQuerySet:
         obj._hash_key = hash_key
         return obj
 
+    def lazy(self):
+        obj = self._clone()
+        obj._lazy = True
+        return obj
+
     def none(self):
         obj = self._clone()
         obj._execution = NoneExecution()
@@ -186,6 +238,8 @@ class DynamoDBQuerySet:
             return field.startswith(value)
         elif operator == 'contains':
             return field.contains(value)
+        elif operator == 'prefix' and hasattr(field, 'prefix'):
+            return field.prefix(value)
         else:
             raise InvalidOperator('Invalid operator "{}"'.format(operator))
 
@@ -205,6 +259,7 @@ class DynamoDBQuerySet:
 
         obj._pre_filter(field, field_name, operator, value)
         obj._filter = obj._get_filter(field, operator, value)
+        obj._filter_lookup = (field, operator, value)
         if operator == 'between' and value[0] > value[1]:
             return self.none()
         return obj
@@ -227,20 +282,140 @@ class DynamoDBQuerySet:
         if self._last_evaluated_key or self._limit:
             self._execute()
             return len(self._results)
-        else:
-            query = self._index.count if self._index else self._model.count
+        # Count precomputed with the model aggregates is read with one GetItem request instead of the whole query
+        precomputed_count = self._get_precomputed_aggregates({'count': Count()})[0].get('count')
+        if precomputed_count is not None:
+            return precomputed_count
 
-            if self._hash_key is None:
-                raise DynamoDBQuerySetError('Hash key must be set')
-            return query(
-                self._hash_key,
-                self._filter,
-            )
+        query = self._index.count if self._index else self._model.count
 
-    def delete(self):
-        with self._model.batch_write() as batch:
-            for obj in self:
-                batch.delete(obj)
+        if self._hash_key is None:
+            raise DynamoDBQuerySetError('Hash key must be set')
+        return query(
+            self._hash_key,
+            self._filter,
+        )
+
+    def _get_aggregate_range_key_prefix(self):
+        """
+        Returns range key prefix values of the queryset or None if precomputed aggregates cannot be used (queryset
+        is filtered by other condition than the range key prefix, limited or uses an index).
+        """
+        if (self._execution is not None or self._hash_key is None or self._index or self._limit
+                or self._last_evaluated_key or not get_model_aggregates(self._model)):
+            return None
+        elif self._filter_lookup is None:
+            return ()
+
+        field, operator, value = self._filter_lookup
+        if operator == 'prefix' and field is self._model._range_key_attribute():
+            return tuple(value)
+        return None
+
+    def _get_precomputed_aggregates(self, aggregates):
+        range_key_prefix = self._get_aggregate_range_key_prefix()
+        if range_key_prefix is None:
+            return {}, {}
+        return get_precomputed_aggregates(
+            self._model, self._model._hash_key_attribute().serialize(self._hash_key), range_key_prefix, aggregates
+        )
+
+    def _is_projected_by_index(self, attr_names):
+        projection = self._index.Meta.projection
+        if projection.projection_type == ALL:
+            return True
+        projected_attr_names = {attr.attr_name for attr in self._index.Meta.attributes.values()} | set(
+            projection.non_key_attributes or ()
+        )
+        return attr_names <= projected_attr_names
+
+    def _compute_aggregates(self, aggregates):
+        values = {name: aggregate.empty_value for name, aggregate in aggregates.items()}
+        key_attr_names = {
+            attr.attr_name for attr in (self._model._hash_key_attribute(), self._model._range_key_attribute())
+            if attr is not None
+        }
+        aggregated_attr_names = {
+            aggregate.get_attribute(self._model).attr_name for aggregate in aggregates.values() if aggregate.attr_name
+        }
+        if self._index and not self._is_projected_by_index(aggregated_attr_names - key_attr_names):
+            # Aggregated attributes are not projected to the index, items are read from the table by the table keys
+            # which are always projected
+            pages = (
+                batch_get_items(self._model._get_connection(), items, consistent_read=False)
+                for items in self._iter_raw_pages(attributes_to_get=list(key_attr_names))
+            )
+        else:
+            pages = self._iter_raw_pages(attributes_to_get=list(key_attr_names | aggregated_attr_names))
+        for items in pages:
+            for item in items:
+                for name, aggregate in aggregates.items():
+                    values[name] = aggregate.combine(values[name], aggregate.get_item_value(self._model, item))
+        return values
+
+    def aggregate(self, *aggregates, **named_aggregates):
+        """
+        Returns dict of aggregate values (Count, Sum, Min, Max) of the queryset items. Positional aggregates are
+        named by the attribute and the function (e.g. number__sum). Aggregates precomputed with the model
+        Meta.aggregates are read with one GetItem request if the queryset is filtered only by the hash key or by
+        the range key prefix, other aggregates are computed from the queried items. If aggregated attributes are not
+        projected to the queryset index, items are read from the table.
+        """
+        named_aggregates = dict({aggregate.name: aggregate for aggregate in aggregates}, **named_aggregates)
+        values, stale_versions = self._get_precomputed_aggregates(named_aggregates)
+        computed_aggregates = {
+            name: aggregate for name, aggregate in named_aggregates.items() if name not in values
+        }
+        if computed_aggregates:
+            computed_values = self._compute_aggregates(computed_aggregates)
+            if stale_versions:
+                # Stale precomputed values are replaced with the computed ones
+                store_recomputed_aggregates(
+                    self._model, self._model._hash_key_attribute().serialize(self._hash_key),
+                    self._get_aggregate_range_key_prefix(), computed_aggregates, computed_values, stale_versions
+                )
+            values.update(computed_values)
+        return {name: values[name] for name in named_aggregates}
+
+    def delete(self, workers=None):
+        """
+        Deletes items of the queryset and returns their count. Only keys of the items are queried and delete
+        requests are sent concurrently while next pages are read.
+        """
+        workers = settings.PYDJAMODB_DATABASE.get('DELETE_WORKERS', 4) if workers is None else workers
+        connection = self._model._get_connection()
+        key_names = [
+            attr.attr_name for attr in (self._model._hash_key_attribute(), self._model._range_key_attribute())
+            if attr is not None
+        ]
+
+        deleted_count = 0
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = set()
+            for items in self._iter_raw_pages(attributes_to_get=key_names):
+                for key_chunk in chunks([{name: item[name] for name in key_names} for item in items],
+                                        BATCH_WRITE_PAGE_LIMIT):
+                    # Number of pending requests is limited, keys are not read faster than they are deleted
+                    if len(futures) >= workers * 2:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            deleted_count += future.result()
+                    futures.add(executor.submit(self._delete_keys, connection, key_chunk))
+            for future in futures:
+                deleted_count += future.result()
+        return deleted_count
+
+    def _delete_keys(self, connection, keys):
+        if get_model_aggregates(self._model):
+            # Items are deleted one by one because the removed items are required to update aggregates
+            for key in keys:
+                self._model._delete_item_with_aggregates(*(
+                    next(iter(key[attr.attr_name].values())) if attr is not None else None
+                    for attr in (self._model._hash_key_attribute(), self._model._range_key_attribute())
+                ))
+        else:
+            batch_write_items(connection, delete_items=keys)
+        return len(keys)
 
     def as_manager(cls):
         return DynamoDBManager.from_queryset(cls)()
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent by the DynamoDB stream consumer for every read page of the stream records. Sender is the model class and
+# changes argument contains list of pydjamodb.streams.ItemChange
+dynamodb_items_changed = Signal()
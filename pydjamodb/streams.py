@@ -0,0 +1,229 @@
+import threading
+
+from collections import namedtuple
+
+from django.db import close_old_connections, connections
+
+from botocore.exceptions import ClientError
+
+from .signals import dynamodb_items_changed
+from .utils import ThroughputCounter, load_checkpoint, store_checkpoint
+
+
+EXPIRED_ITERATOR_EXCEPTION = 'ExpiredIteratorException'
+TRIMMED_DATA_ACCESS_EXCEPTION = 'TrimmedDataAccessException'
+
+
+ItemChange = namedtuple('ItemChange', ('event_name', 'keys', 'old_item', 'new_item', 'sequence_number'))
+
+
+class DynamoDBStreamError(Exception):
+    pass
+
+
+class ShardReader(threading.Thread):
+
+    def __init__(self, consumer, shard_id):
+        super().__init__(name='pydjamodb-stream-{}'.format(shard_id), daemon=True)
+        self.consumer = consumer
+        self.shard_id = shard_id
+        self.exception = None
+
+    def run(self):
+        try:
+            self.consumer.read_shard(self.shard_id)
+        except Exception as ex:
+            self.exception = ex
+            # Other shards are stopped too, the checkpoint contains only processed records
+            self.consumer.stop()
+        finally:
+            # Database connections opened by signal receivers belong to the reader thread
+            connections.close_all()
+
+
+class DynamoDBStreamConsumer:
+    """
+    Reads all shards of the model table stream concurrently (every shard in its own thread) and sends the
+    dynamodb_items_changed signal with changes of every read page. Child shards are read after their parents.
+    Sequence number of the last processed record of every shard is stored to the checkpoint file, therefore the
+    consumer continues from the last processed record after restart. Database connections of the signal receivers
+    are handled as in the request cycle (close_old_connections is called after every page) and closed when the
+    shard reader finishes.
+    """
+
+    def __init__(self, model_class, checkpoint_path=None, batch_size=None, poll_interval=1.0,
+                 start_from_latest=False):
+        self.model_class = model_class
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size or 1000
+        self.poll_interval = poll_interval
+        self.start_from_latest = start_from_latest
+        self.counter = ThroughputCounter()
+        self.client = None
+        self.stream_arn = None
+        self.checkpoint = None
+        self._once = False
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _init_stream(self):
+        connection = self.model_class._get_connection()
+        self.stream_arn = connection.describe_table().get('LatestStreamArn')
+        if not self.stream_arn:
+            raise DynamoDBStreamError('Stream of the table "{}" is not enabled'.format(connection.table_name))
+        self.client = connection.get_streams_client()
+
+        self.checkpoint = load_checkpoint(self.checkpoint_path)
+        if self.checkpoint is None or self.checkpoint['stream_arn'] != self.stream_arn:
+            self.checkpoint = {'stream_arn': self.stream_arn, 'shards': {}}
+            if self.start_from_latest:
+                self._init_latest_shards()
+
+    def _init_latest_shards(self):
+        # Only shards open when the consumer is started for the first time are read from the latest record, closed
+        # shards are skipped and shards created later (e.g. children of the split shards) are read from the oldest one
+        latest_shard_ids = []
+        for shard in self._get_shards():
+            if 'EndingSequenceNumber' in shard.get('SequenceNumberRange', {}):
+                self.checkpoint['shards'][shard['ShardId']] = {'done': True}
+            else:
+                latest_shard_ids.append(shard['ShardId'])
+        self.checkpoint['latest_shard_ids'] = latest_shard_ids
+        store_checkpoint(self.checkpoint_path, self.checkpoint)
+
+    def _get_shards(self):
+        shards, exclusive_start_shard_id = [], None
+        while True:
+            kwargs = {'StreamArn': self.stream_arn}
+            if exclusive_start_shard_id:
+                kwargs['ExclusiveStartShardId'] = exclusive_start_shard_id
+            description = self.client.describe_stream(**kwargs)['StreamDescription']
+            shards += description.get('Shards', [])
+            exclusive_start_shard_id = description.get('LastEvaluatedShardId')
+            if not exclusive_start_shard_id:
+                return shards
+
+    def _get_shard_iterator(self, shard_id, trim_horizon=False):
+        sequence_number = self.checkpoint['shards'].get(shard_id, {}).get('sequence_number')
+        kwargs = {'StreamArn': self.stream_arn, 'ShardId': shard_id}
+        if sequence_number and not trim_horizon:
+            kwargs.update(ShardIteratorType='AFTER_SEQUENCE_NUMBER', SequenceNumber=sequence_number)
+        elif shard_id in self.checkpoint.get('latest_shard_ids', ()) and not trim_horizon:
+            kwargs['ShardIteratorType'] = 'LATEST'
+        else:
+            kwargs['ShardIteratorType'] = 'TRIM_HORIZON'
+        try:
+            return self.client.get_shard_iterator(**kwargs)['ShardIterator']
+        except ClientError as ex:
+            if ex.response['Error']['Code'] != TRIMMED_DATA_ACCESS_EXCEPTION or trim_horizon:
+                raise
+            # Records after the checkpoint are no longer available, the oldest record of the shard is used
+            return self._get_shard_iterator(shard_id, trim_horizon=True)
+
+    def _update_checkpoint(self, shard_id, **shard_checkpoint):
+        with self._lock:
+            self.checkpoint['shards'].setdefault(shard_id, {}).update(shard_checkpoint)
+            store_checkpoint(self.checkpoint_path, self.checkpoint)
+
+    def process_records(self, records):
+        changes = [
+            ItemChange(
+                record['eventName'],
+                record['dynamodb'].get('Keys'),
+                record['dynamodb'].get('OldImage'),
+                record['dynamodb'].get('NewImage'),
+                record['dynamodb']['SequenceNumber'],
+            )
+            for record in records
+        ]
+        close_old_connections()
+        try:
+            dynamodb_items_changed.send(sender=self.model_class, changes=changes)
+        finally:
+            close_old_connections()
+
+    def read_shard(self, shard_id):
+        shard_iterator = self._get_shard_iterator(shard_id)
+        while shard_iterator and not self._stop_event.is_set():
+            try:
+                data = self.client.get_records(ShardIterator=shard_iterator, Limit=self.batch_size)
+            except ClientError as ex:
+                if ex.response['Error']['Code'] != EXPIRED_ITERATOR_EXCEPTION:
+                    raise
+                shard_iterator = self._get_shard_iterator(shard_id)
+                continue
+
+            records = data.get('Records', [])
+            shard_iterator = data.get('NextShardIterator')
+            if records:
+                self.process_records(records)
+                self.counter.add(len(records))
+                self._update_checkpoint(shard_id, sequence_number=records[-1]['dynamodb']['SequenceNumber'])
+            if not shard_iterator:
+                # Shard is closed and all its records were processed
+                self._update_checkpoint(shard_id, done=True)
+            elif not records:
+                if self._once:
+                    break
+                self._stop_event.wait(self.poll_interval)
+
+    def run(self, once=False):
+        """
+        Reads the stream until the consumer is stopped. If once is set, consumer stops when all shards are read
+        to the last record.
+        """
+        self._once = once
+        self._init_stream()
+        finished_shard_ids = {
+            shard_id for shard_id, shard_checkpoint in self.checkpoint['shards'].items() if shard_checkpoint.get('done')
+        }
+        readers = {}
+        try:
+            self._read_shards(readers, finished_shard_ids, once)
+        except BaseException:
+            # Readers are stopped and awaited when the consumer is interrupted (e.g. with KeyboardInterrupt)
+            self.stop()
+            for reader in readers.values():
+                reader.join()
+            raise
+
+    def _read_shards(self, readers, finished_shard_ids, once):
+        while True:
+            shards = self._get_shards()
+            shard_ids = {shard['ShardId'] for shard in shards}
+            for shard in shards:
+                shard_id, parent_shard_id = shard['ShardId'], shard.get('ParentShardId')
+                if (shard_id in readers or shard_id in finished_shard_ids
+                        or (parent_shard_id in shard_ids and parent_shard_id not in finished_shard_ids)):
+                    continue
+                if self._stop_event.is_set():
+                    break
+                readers[shard_id] = ShardReader(self, shard_id)
+                readers[shard_id].start()
+
+            if not readers:
+                if once or self._stop_event.is_set():
+                    break
+                self._stop_event.wait(self.poll_interval)
+                continue
+
+            if once:
+                for reader in readers.values():
+                    reader.join()
+            else:
+                self._stop_event.wait(self.poll_interval)
+
+            for shard_id, reader in list(readers.items()):
+                if not reader.is_alive():
+                    del readers[shard_id]
+                    if reader.exception is not None:
+                        for other_reader in readers.values():
+                            other_reader.join()
+                        raise reader.exception
+                    finished_shard_ids.add(shard_id)
+
+    def __str__(self):
+        return 'consumed {}'.format(self.counter)
@@ -0,0 +1,76 @@
+import gzip
+import json
+
+from .aggregates import rebuild_items_aggregates
+from .buffer import buffered_writes
+from .models import dynamodb_model_classes, get_dynamodb_model_class
+from .utils import batch_write_items, decode_raw_item
+
+
+def load_dynamodb_fixture(model_class, path):
+    """
+    Loads raw items from the (gzipped) JSON lines file created with the dynamodb_export command to the model table.
+    Precomputed aggregates of the loaded hash keys are rebuilt.
+    """
+    with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as f:
+        items = [decode_raw_item(json.loads(line)) for line in f if line.strip()]
+    batch_write_items(model_class._get_connection(), put_items=items)
+    rebuild_items_aggregates(model_class, items)
+
+
+class DynamoDBFixturesTestCaseMixin:
+    """
+    Test case mixin which loads DynamoDB data once per test class. Data are loaded from dynamodb_fixtures
+    (dict of model name and path or list of paths of the exported JSON lines files) and with the
+    set_up_dynamodb_data class method. Writes of the method are buffered and sent with BatchWriteItem requests.
+    State of the loaded items is stored to the snapshot of the test table connection and only items changed
+    by the test are restored after it.
+    """
+
+    dynamodb_fixtures = {}
+
+    @classmethod
+    def set_up_dynamodb_data(cls):
+        pass
+
+    @classmethod
+    def _load_dynamodb_fixtures(cls):
+        for model_name, paths in cls.dynamodb_fixtures.items():
+            model_class = get_dynamodb_model_class(model_name)
+            for path in [paths] if isinstance(paths, str) else paths:
+                load_dynamodb_fixture(model_class, path)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            cls._load_dynamodb_fixtures()
+            with buffered_writes():
+                cls.set_up_dynamodb_data()
+            for model_class in dynamodb_model_classes:
+                model_class._get_connection().create_snapshot()
+        except Exception:
+            cls._clear_dynamodb_snapshot()
+            super().tearDownClass()
+            raise
+
+    @classmethod
+    def _clear_dynamodb_snapshot(cls):
+        for model_class in dynamodb_model_classes:
+            connection = model_class._get_connection()
+            connection.clear_snapshot()
+            connection.post_test_clean(model_class)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._clear_dynamodb_snapshot()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self._restore_dynamodb_snapshot)
+
+    def _restore_dynamodb_snapshot(self):
+        # Items are restored by the test runner autoclean too, the second restore is empty
+        for model_class in dynamodb_model_classes:
+            model_class._get_connection().post_test_clean(model_class)
@@ -1,11 +1,19 @@
 import os
 import sys
+import time
 
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.db import connections
 from django.test.runner import ParallelTestSuite, DiscoverRunner
 
-from .connection import TestTableConnection
+from pynamodb.constants import ACTIVE, TABLE_STATUS
+from pynamodb.exceptions import TableDoesNotExist, TableError
+
+from .connection import TableConnection, TestTableConnection
 from .models import dynamodb_model_classes
+from .utils import batch_write_items, parallel_scan
 
 try:
     from germanium.signals import set_up, tear_down
@@ -24,6 +32,10 @@ def init_pynamodb_test_prefix(prefix=None):
         model_class._connection = TestTableConnection(model_class._get_connection(), prefix)
 
 
+def get_test_connection(model_class, prefix=None):
+    return TestTableConnection(TableConnection(model_class.Meta.table_name), prefix)
+
+
 def remove_pynamodb_table(model_class):
     if model_class.exists():
         model_class.delete_table(wait=True)
@@ -34,6 +46,251 @@ def recreate_pynamodb_table(model_class):
     model_class.create_table(wait=True)
 
 
+# Error codes of table operations which can be successfully repeated later (too many concurrent table
+# operations or table is still being created/deleted)
+RETRYABLE_TABLE_ERROR_CODES = {'LimitExceededException', 'ResourceInUseException'}
+
+MIN_POLL_DELAY = 0.05
+MAX_POLL_DELAY = 2
+
+TRUNCATE_SEGMENTS = 4
+
+
+def _get_max_workers(count):
+    return max(min(count, settings.PYDJAMODB_DATABASE.get('TEST_TABLE_WORKERS', 32)), 1)
+
+
+def _get_create_table_kwargs(model_class):
+    kwargs = model_class._get_schema()
+    for name in ('read_capacity_units', 'write_capacity_units', 'billing_mode', 'tags'):
+        if getattr(model_class.Meta, name, None) is not None:
+            kwargs[name] = getattr(model_class.Meta, name)
+    if hasattr(model_class.Meta, 'stream_view_type'):
+        kwargs['stream_specification'] = {
+            'stream_enabled': True,
+            'stream_view_type': model_class.Meta.stream_view_type
+        }
+    return kwargs
+
+
+def _get_wait_timeout():
+    return settings.PYDJAMODB_DATABASE.get('TEST_TABLE_WAIT_TIMEOUT', 600)
+
+
+def _call_table_operation(operation, timeout=None):
+    timeout = _get_wait_timeout() if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    delay = MIN_POLL_DELAY
+    while True:
+        try:
+            return operation()
+        except TableError as ex:
+            if ex.cause_response_code not in RETRYABLE_TABLE_ERROR_CODES or time.monotonic() > deadline:
+                raise
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_POLL_DELAY)
+
+
+def _get_table_status(connection):
+    try:
+        return connection.describe_table().get(TABLE_STATUS)
+    except TableDoesNotExist:
+        return None
+
+
+def wait_for_tables(table_connections, status, timeout=None):
+    """
+    Waits until all tables have the required status (None for the removed table). Tables are polled
+    concurrently with the exponentially growing delay.
+    """
+    timeout = _get_wait_timeout() if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    delay = MIN_POLL_DELAY
+    pending_connections = list(table_connections)
+    with ThreadPoolExecutor(max_workers=_get_max_workers(len(pending_connections))) as executor:
+        while pending_connections:
+            statuses = list(executor.map(_get_table_status, pending_connections))
+            pending_connections = [
+                connection for connection, table_status in zip(pending_connections, statuses)
+                if table_status != status
+            ]
+            if pending_connections:
+                if time.monotonic() > deadline:
+                    raise TableError('Timeout while waiting for tables ({})'.format(
+                        ', '.join(connection.table_name for connection in pending_connections)
+                    ))
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_POLL_DELAY)
+
+
+def _delete_table(connection):
+    try:
+        _call_table_operation(lambda: connection.delete_table())
+    except TableError as ex:
+        if ex.cause_response_code != 'ResourceNotFoundException':
+            raise
+
+
+def remove_pynamodb_tables(model_connections):
+    """
+    Removes tables of the list of (model class, table connection) pairs concurrently.
+    """
+    table_connections = [connection for _, connection in model_connections]
+    with ThreadPoolExecutor(max_workers=_get_max_workers(len(table_connections))) as executor:
+        list(executor.map(_delete_table, table_connections))
+    wait_for_tables(table_connections, None)
+
+
+def _create_table(model_class, connection):
+    _call_table_operation(lambda: connection.create_table(**_get_create_table_kwargs(model_class)))
+
+
+def create_pynamodb_tables(model_connections):
+    """
+    Creates tables of the list of (model class, table connection) pairs concurrently.
+    """
+    with ThreadPoolExecutor(max_workers=_get_max_workers(len(model_connections))) as executor:
+        list(executor.map(lambda args: _create_table(*args), model_connections))
+    wait_for_tables([connection for _, connection in model_connections], ACTIVE)
+    for model_class, connection in model_connections:
+        ttl_attribute = model_class._ttl_attribute()
+        if ttl_attribute:
+            connection.update_time_to_live(ttl_attribute.attr_name)
+
+
+def recreate_pynamodb_tables(model_connections):
+    remove_pynamodb_tables(model_connections)
+    create_pynamodb_tables(model_connections)
+
+
+def _get_projection_signature(projection):
+    return projection['ProjectionType'], frozenset(projection.get('NonKeyAttributes', ()))
+
+
+def _get_schema_signature(attribute_definitions, key_schema, global_secondary_indexes, local_secondary_indexes,
+                          index_name_key, key_schema_key, projection_key):
+    return (
+        frozenset((attr['AttributeName'], attr['AttributeType']) for attr in attribute_definitions),
+        frozenset((key['AttributeName'], key['KeyType']) for key in key_schema),
+        *(
+            {
+                index[index_name_key]: (
+                    frozenset((key['AttributeName'], key['KeyType']) for key in index[key_schema_key]),
+                    _get_projection_signature(index[projection_key]),
+                )
+                for index in indexes or ()
+            }
+            for indexes in (global_secondary_indexes, local_secondary_indexes)
+        )
+    )
+
+
+def _get_model_stream_signature(model_class):
+    stream_specification = (
+        _get_create_table_kwargs(model_class).get('stream_specification')
+        or settings.PYDJAMODB_DATABASE.get('STREAM_SPECIFICATION')
+    )
+    if not stream_specification or not stream_specification.get('stream_enabled'):
+        return None
+    return stream_specification['stream_view_type']
+
+
+def _get_table_stream_signature(table_description):
+    stream_specification = table_description.get('StreamSpecification')
+    if not stream_specification or not stream_specification.get('StreamEnabled'):
+        return None
+    return stream_specification['StreamViewType']
+
+
+def _get_table_ttl_signature(table_description):
+    ttl_description = table_description.get('TimeToLiveDescription') or {}
+    if ttl_description.get('TimeToLiveStatus') not in {'ENABLED', 'ENABLING'}:
+        return None
+    return ttl_description['AttributeName']
+
+
+def is_pynamodb_table_schema_changed(model_class, table_description):
+    """
+    Compares key schema, attribute definitions, indexes, stream specification and TTL attribute of the existing
+    table with the model. TTL attribute is compared only if the description contains TimeToLiveDescription
+    (it is not part of the DescribeTable response).
+    """
+    schema = model_class._get_schema()
+    ttl_attribute = model_class._ttl_attribute()
+    return (
+        _get_schema_signature(
+            schema['attribute_definitions'],
+            schema['key_schema'],
+            schema['global_secondary_indexes'],
+            schema['local_secondary_indexes'],
+            'index_name', 'key_schema', 'projection'
+        ) != _get_schema_signature(
+            table_description.get('AttributeDefinitions', ()),
+            table_description.get('KeySchema', ()),
+            table_description.get('GlobalSecondaryIndexes'),
+            table_description.get('LocalSecondaryIndexes'),
+            'IndexName', 'KeySchema', 'Projection'
+        )
+        or _get_model_stream_signature(model_class) != _get_table_stream_signature(table_description)
+        or (
+            'TimeToLiveDescription' in table_description
+            and (ttl_attribute.attr_name if ttl_attribute else None) != _get_table_ttl_signature(table_description)
+        )
+    )
+
+
+def truncate_pynamodb_table(model_class, connection):
+    """
+    Removes all items of the table, only keys are read with the parallel scan.
+    """
+    key_names = [
+        attr.attr_name for attr in (model_class._hash_key_attribute(), model_class._range_key_attribute()) if attr
+    ]
+
+    def delete_items(segment, items, last_evaluated_key):
+        batch_write_items(connection, delete_items=[{name: item[name] for name in key_names} for item in items])
+
+    parallel_scan(connection, TRUNCATE_SEGMENTS, delete_items, attributes_to_get=key_names)
+
+
+def _get_table_description(connection):
+    try:
+        description = connection.describe_table()
+    except TableDoesNotExist:
+        return None
+    description['TimeToLiveDescription'] = connection.connection.client.describe_time_to_live(
+        TableName=connection.table_name
+    )['TimeToLiveDescription']
+    return description
+
+
+def setup_kept_pynamodb_tables(model_connections):
+    """
+    Reuses existing tables with the same schema as the model (tables are only truncated), tables with the changed
+    schema are recreated and missing tables are created. Returns lists of reused and created tables.
+    """
+    with ThreadPoolExecutor(max_workers=_get_max_workers(len(model_connections))) as executor:
+        descriptions = list(executor.map(_get_table_description, [connection for _, connection in model_connections]))
+
+    reused_model_connections, changed_model_connections, created_model_connections = [], [], []
+    for model_connection, description in zip(model_connections, descriptions):
+        if description is None:
+            created_model_connections.append(model_connection)
+        elif is_pynamodb_table_schema_changed(model_connection[0], description):
+            changed_model_connections.append(model_connection)
+        else:
+            reused_model_connections.append(model_connection)
+
+    remove_pynamodb_tables(changed_model_connections)
+    created_model_connections += changed_model_connections
+    create_pynamodb_tables(created_model_connections)
+
+    wait_for_tables([connection for _, connection in reused_model_connections], ACTIVE)
+    with ThreadPoolExecutor(max_workers=_get_max_workers(len(reused_model_connections))) as executor:
+        list(executor.map(lambda args: truncate_pynamodb_table(*args), reused_model_connections))
+    return reused_model_connections, created_model_connections
+
+
 _worker_id = 0
 
 
@@ -74,43 +331,42 @@ class DynamoDBTestSuiteMixin:
     def log(self, msg):
         sys.stderr.write(msg + os.linesep)
 
-    def _teardown_pynamodb_database(self, prefix=None):
-        init_pynamodb_test_prefix(prefix)
-        table_names = []
-        for model_class in dynamodb_model_classes:
-            table_names.append(model_class._connection.table_name)
-            remove_pynamodb_table(model_class)
-        self.log('Remove DynamoDB tables ({})...'.format(
-            ', '.join("'{}'".format(table_name) for table_name in table_names))
-        )
+    def _get_pynamodb_test_connections(self):
+        prefixes = [str(i + 1) for i in range(self.parallel)] if self.parallel > 1 else [None]
+        return [
+            (model_class, get_test_connection(model_class, prefix))
+            for prefix in prefixes for model_class in dynamodb_model_classes
+        ]
+
+    def _log_pynamodb_tables(self, msg, model_connections):
+        self.log('{} ({})...'.format(
+            msg, ', '.join("'{}'".format(connection.table_name) for _, connection in model_connections)
+        ))
 
     def teardown_databases(self, old_config, **kwargs):
         super().teardown_databases(old_config, **kwargs)
-        if self.parallel > 1:
-            for i in range(self.parallel):
-                self._teardown_pynamodb_database(str(i + 1))
+        model_connections = self._get_pynamodb_test_connections()
+        if self.keepdb:
+            self._log_pynamodb_tables('Preserve DynamoDB tables', model_connections)
         else:
-            self._teardown_pynamodb_database()
-
-    def _setup_pynamodb_database(self, prefix=None):
-        init_pynamodb_test_prefix(prefix)
-        set_dynamodb_test_autoclean()
-        table_names = []
-        for model_class in dynamodb_model_classes:
-            table_names.append(model_class._connection.table_name)
-            recreate_pynamodb_table(model_class)
-        self.log('Setup DynamoDB tables ({})...'.format(
-            ', '.join("'{}'".format(table_name) for table_name in table_names))
-        )
+            remove_pynamodb_tables(model_connections)
+            self._log_pynamodb_tables('Remove DynamoDB tables', model_connections)
 
     def setup_databases(self, **kwargs):
         databases = super().setup_databases(**kwargs)
 
-        if self.parallel > 1:
-            for i in range(self.parallel):
-                self._setup_pynamodb_database(str(i + 1))
+        model_connections = self._get_pynamodb_test_connections()
+        if self.keepdb:
+            reused_model_connections, created_model_connections = setup_kept_pynamodb_tables(model_connections)
+            if reused_model_connections:
+                self._log_pynamodb_tables('Reuse DynamoDB tables', reused_model_connections)
+            if created_model_connections:
+                self._log_pynamodb_tables('Setup DynamoDB tables', created_model_connections)
         else:
-            self._setup_pynamodb_database()
+            recreate_pynamodb_tables(model_connections)
+            self._log_pynamodb_tables('Setup DynamoDB tables', model_connections)
+        init_pynamodb_test_prefix()
+        set_dynamodb_test_autoclean()
         return databases
 
 
@@ -0,0 +1,197 @@
+import json
+import threading
+
+from collections import namedtuple
+from contextlib import contextmanager
+
+from pynamodb.constants import (
+    ITEM, RESPONSES, TABLE_NAME, TRANSACT_CONDITION_CHECK, TRANSACT_DELETE, TRANSACT_PUT, TRANSACT_UPDATE
+)
+
+
+# DynamoDB service limits of the single TransactWriteItems/TransactGetItems request
+MAX_TRANSACT_ITEMS = 100
+MAX_TRANSACT_SIZE = 4 * 1024 * 1024
+
+
+_local = threading.local()
+
+
+TransactOperation = namedtuple('TransactOperation', ('kind', 'model_class', 'key', 'operation_kwargs', 'instance'))
+
+
+class TransactionError(Exception):
+    pass
+
+
+def get_current_transaction():
+    return getattr(_local, 'transaction', None)
+
+
+def _get_operation_size(operation):
+    return len(json.dumps(operation.operation_kwargs, default=str))
+
+
+def split_operations(operations, max_items=MAX_TRANSACT_ITEMS, max_size=MAX_TRANSACT_SIZE):
+    """
+    Splits operations to the chunks which satisfy DynamoDB transaction limits. Chunk is closed if the maximal
+    number of items or the maximal request size is exceeded or if the item with the same key is already in
+    the chunk (DynamoDB does not allow more operations on the same item in one transaction).
+    """
+    chunk, chunk_keys, chunk_size = [], set(), 0
+    for operation in operations:
+        operation_size = _get_operation_size(operation)
+        if chunk and (
+                len(chunk) >= max_items or chunk_size + operation_size > max_size or operation.key in chunk_keys):
+            yield chunk
+            chunk, chunk_keys, chunk_size = [], set(), 0
+        chunk.append(operation)
+        chunk_keys.add(operation.key)
+        chunk_size += operation_size
+    if chunk:
+        yield chunk
+
+
+class Transaction:
+    """
+    Operations are written with one TransactWriteItems request. If split is set, operations which exceed DynamoDB
+    transaction limits are written with more requests, which are not atomic together (chunks written before
+    the failed one stay committed).
+    """
+
+    def __init__(self, split=False):
+        self._operations = []
+        self.split = split
+
+    def __len__(self):
+        return len(self._operations)
+
+    def _add_operation(self, kind, model_class, serialized_keys, operation_kwargs, instance=None):
+        self._operations.append(TransactOperation(
+            kind, model_class, (operation_kwargs[TABLE_NAME],) + tuple(serialized_keys), operation_kwargs, instance
+        ))
+
+    def condition_check(self, model_class, hash_key, range_key=None, condition=None):
+        if condition is None:
+            raise TypeError('`condition` cannot be None')
+        self._add_operation(
+            TRANSACT_CONDITION_CHECK,
+            model_class,
+            model_class._serialize_keys(hash_key, range_key),
+            model_class.get_operation_kwargs_from_class(hash_key, range_key=range_key, condition=condition)
+        )
+
+    def save(self, instance, condition=None):
+        self._add_operation(
+            TRANSACT_PUT,
+            instance.__class__,
+            instance._get_serialized_keys(),
+            instance.get_save_kwargs_from_instance(condition=condition),
+            instance
+        )
+
+    def update(self, instance, actions, condition=None):
+        self._add_operation(
+            TRANSACT_UPDATE,
+            instance.__class__,
+            instance._get_serialized_keys(),
+            instance.get_update_kwargs_from_instance(actions=actions, condition=condition),
+            instance
+        )
+
+    def delete(self, instance, condition=None):
+        self._add_operation(
+            TRANSACT_DELETE,
+            instance.__class__,
+            instance._get_serialized_keys(),
+            instance.get_delete_kwargs_from_instance(condition=condition)
+        )
+
+    def _commit_chunk(self, operations):
+        transact_items = {
+            TRANSACT_CONDITION_CHECK: [],
+            TRANSACT_DELETE: [],
+            TRANSACT_PUT: [],
+            TRANSACT_UPDATE: [],
+        }
+        for operation in operations:
+            transact_items[operation.kind].append(operation.operation_kwargs)
+
+        # Transaction can contain more tables, every model connection can be used to send the request
+        response = operations[0].model_class._get_connection().connection.transact_write_items(
+            condition_check_items=transact_items[TRANSACT_CONDITION_CHECK],
+            delete_items=transact_items[TRANSACT_DELETE],
+            put_items=transact_items[TRANSACT_PUT],
+            update_items=transact_items[TRANSACT_UPDATE],
+        )
+        for operation in operations:
+            if operation.kind in {TRANSACT_PUT, TRANSACT_UPDATE}:
+                operation.instance.update_local_version_attribute()
+        return response
+
+    def commit(self):
+        operations, self._operations = self._operations, []
+        chunks = list(split_operations(operations))
+        if len(chunks) > 1 and not self.split:
+            raise TransactionError(
+                'Transaction exceeds DynamoDB transaction limits (100 items, 4 MB or more operations on the same '
+                'item), splitting of the transaction must be allowed with atomic(split=True)'
+            )
+        return [self._commit_chunk(chunk) for chunk in chunks]
+
+    def savepoint(self):
+        return len(self._operations)
+
+    def rollback(self, savepoint=0):
+        del self._operations[savepoint:]
+
+
+@contextmanager
+def atomic(split=False):
+    """
+    Collects save, update and delete operations of DynamoDB models and flushes them with the TransactWriteItems
+    request when the outermost block is left. Nested blocks are joined to the outermost transaction, operations
+    of the nested block are discarded if the exception is raised inside it. Operations which exceed DynamoDB
+    transaction limits raise TransactionError, if split is set they are split into more requests which are not
+    atomic together.
+    """
+    transaction = get_current_transaction()
+    if transaction is not None:
+        savepoint = transaction.savepoint()
+        try:
+            yield transaction
+        except BaseException:
+            transaction.rollback(savepoint)
+            raise
+        return
+
+    transaction = Transaction(split=split)
+    _local.transaction = transaction
+    try:
+        yield transaction
+    except BaseException:
+        transaction.rollback()
+        raise
+    finally:
+        _local.transaction = None
+    transaction.commit()
+
+
+def transact_get(keys):
+    """
+    Returns model instances for the list of keys in format (model_class, hash_key) or
+    (model_class, hash_key, range_key). Instance is replaced with None if the item does not exist.
+    """
+    keys = list(keys)
+    results = []
+    for i in range(0, len(keys), MAX_TRANSACT_ITEMS):
+        chunk = keys[i:i + MAX_TRANSACT_ITEMS]
+        response = chunk[0][0]._get_connection().connection.transact_get_items(
+            get_items=[
+                model_class.get_operation_kwargs_from_class(*model_keys) for model_class, *model_keys in chunk
+            ]
+        )
+        for (model_class, *_), data in zip(chunk, response[RESPONSES]):
+            item_data = data.get(ITEM)
+            results.append(model_class.from_raw_data(item_data) if item_data else None)
+    return results
@@ -0,0 +1,222 @@
+import json
+import os
+import random
+import threading
+import time
+
+from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from pynamodb.constants import (
+    BATCH_GET_PAGE_LIMIT, BATCH_WRITE_PAGE_LIMIT, BINARY, BINARY_SET, CAPACITY_UNITS, CONSUMED_CAPACITY,
+    DELETE_REQUEST, ITEM, ITEMS, KEY, KEYS, LAST_EVALUATED_KEY, LIST, MAP, NUMBER_SET, PUT_REQUEST, RESPONSES,
+    STRING_SET, UNPROCESSED_ITEMS, UNPROCESSED_KEYS
+)
+from pynamodb.exceptions import GetError, PutError
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def batch_write_items(connection, put_items=None, delete_items=None):
+    """
+    Writes serialized items and deletes serialized keys with BatchWriteItem requests of the maximal allowed size.
+    Unprocessed items are resent with the exponential backoff.
+    """
+    requests = [(PUT_REQUEST, item) for item in put_items or ()] + [
+        (DELETE_REQUEST, key) for key in delete_items or ()
+    ]
+    for chunk in chunks(requests, BATCH_WRITE_PAGE_LIMIT):
+        retries = 0
+        while chunk:
+            data = connection.batch_write_item(
+                put_items=[item for request_type, item in chunk if request_type == PUT_REQUEST],
+                delete_items=[item for request_type, item in chunk if request_type == DELETE_REQUEST],
+            )
+            unprocessed_items = (data or {}).get(UNPROCESSED_ITEMS, {}).get(connection.table_name)
+            if not unprocessed_items:
+                break
+            if retries >= connection.connection._max_retry_attempts_exception:
+                raise PutError('Failed to batch write items: max_retry_attempts exceeded')
+            time.sleep(random.randint(0, connection.connection._base_backoff_ms * (2 ** retries)) / 1000)
+            retries += 1
+            chunk = [
+                (PUT_REQUEST, item[PUT_REQUEST][ITEM]) if PUT_REQUEST in item
+                else (DELETE_REQUEST, item[DELETE_REQUEST][KEY])
+                for item in unprocessed_items
+            ]
+
+
+def batch_get_items(connection, keys, consistent_read=True):
+    """
+    Returns raw items of the serialized keys read with BatchGetItem requests of the maximal allowed size.
+    Unprocessed keys are requested again with the exponential backoff.
+    """
+    items = []
+    for chunk in chunks(keys, BATCH_GET_PAGE_LIMIT):
+        retries = 0
+        while chunk:
+            data = connection.batch_get_item(chunk, consistent_read=consistent_read)
+            items += data.get(RESPONSES, {}).get(connection.table_name, [])
+            chunk = data.get(UNPROCESSED_KEYS, {}).get(connection.table_name, {}).get(KEYS)
+            if not chunk:
+                break
+            if retries >= connection.connection._max_retry_attempts_exception:
+                raise GetError('Failed to batch get items: max_retry_attempts exceeded')
+            time.sleep(random.randint(0, connection.connection._base_backoff_ms * (2 ** retries)) / 1000)
+            retries += 1
+    return items
+
+
+def get_consumed_capacity(data):
+    """
+    Returns sum of capacity units consumed by the request (transactions and batch requests return list of tables).
+    """
+    consumed_capacity = (data or {}).get(CONSUMED_CAPACITY) or {}
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    return sum(table_capacity.get(CAPACITY_UNITS, 0) for table_capacity in consumed_capacity)
+
+
+class RateLimiter:
+    """
+    Thread safe limiter of the number of units (items, requests) processed per second.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def acquire(self, units=1):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(self._next_time, now) + units / self.rate
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class ThroughputCounter:
+
+    def __init__(self, initial_count=0):
+        self.count = initial_count
+        self.start_time = time.monotonic()
+        self._initial_count = initial_count
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.count += count
+
+    @property
+    def duration(self):
+        return time.monotonic() - self.start_time
+
+    @property
+    def throughput(self):
+        return (self.count - self._initial_count) / max(self.duration, 1e-6)
+
+    def __str__(self):
+        return '{} items in {:.1f} s ({:.1f} items/s)'.format(self.count, self.duration, self.throughput)
+
+
+def parallel_scan(connection, total_segments, callback, segments=None, segment_start_keys=None, page_size=None,
+                  attributes_to_get=None, rate_limiter=None, capacity_limiter=None):
+    """
+    Scans the table with the parallel segmented scan, every segment is scanned in its own thread. Callback is
+    called with the segment number, raw items of the page and the last evaluated key (None for the last page).
+    Rate limiter limits number of scanned items, capacity limiter number of consumed capacity units.
+    """
+    segment_start_keys = segment_start_keys or {}
+
+    def scan_segment(segment):
+        exclusive_start_key = segment_start_keys.get(segment)
+        while True:
+            page = connection.scan(
+                segment=segment,
+                total_segments=total_segments,
+                exclusive_start_key=exclusive_start_key,
+                limit=page_size,
+                attributes_to_get=attributes_to_get,
+            )
+            items = page.get(ITEMS, [])
+            exclusive_start_key = page.get(LAST_EVALUATED_KEY)
+            if rate_limiter:
+                rate_limiter.acquire(len(items))
+            if capacity_limiter:
+                capacity_limiter.acquire(get_consumed_capacity(page))
+            callback(segment, items, exclusive_start_key)
+            if not exclusive_start_key:
+                break
+
+    segments = list(range(total_segments) if segments is None else segments)
+    if not segments:
+        return
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        for future in [executor.submit(scan_segment, segment) for segment in segments]:
+            future.result()
+
+
+def _encode_value(value):
+    if BINARY in value and isinstance(value[BINARY], bytes):
+        return {BINARY: b64encode(value[BINARY]).decode('ascii')}
+    elif BINARY_SET in value:
+        return {BINARY_SET: [b64encode(v).decode('ascii') for v in value[BINARY_SET]]}
+    elif STRING_SET in value or NUMBER_SET in value:
+        return {k: list(v) for k, v in value.items()}
+    elif MAP in value:
+        return {MAP: encode_raw_item(value[MAP])}
+    elif LIST in value:
+        return {LIST: [_encode_value(v) for v in value[LIST]]}
+    return value
+
+
+def _decode_value(value):
+    if BINARY in value:
+        return {BINARY: b64decode(value[BINARY])}
+    elif BINARY_SET in value:
+        return {BINARY_SET: [b64decode(v) for v in value[BINARY_SET]]}
+    elif MAP in value:
+        return {MAP: decode_raw_item(value[MAP])}
+    elif LIST in value:
+        return {LIST: [_decode_value(v) for v in value[LIST]]}
+    return value
+
+
+def encode_raw_item(item):
+    """
+    Returns JSON serializable copy of the raw DynamoDB item, binary values (including values nested in maps and
+    lists) are base64 encoded.
+    """
+    return {name: _encode_value(value) for name, value in item.items()}
+
+
+def decode_raw_item(item):
+    """
+    Reverse function to encode_raw_item.
+    """
+    return {name: _decode_value(value) for name, value in item.items()}
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def store_checkpoint(path, data):
+    if path:
+        tmp_path = '{}.tmp'.format(path)
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
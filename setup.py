@@ -29,5 +29,9 @@ setup(
     install_requires=[
         'django>=2.0, <4.0',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'zstd': ['zstandard'],
+    },
     zip_safe=False
 )
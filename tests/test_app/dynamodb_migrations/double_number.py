@@ -0,0 +1,16 @@
+from pydjamodb.migration import DynamoDBMigration
+
+from test_app.models import TestDynamoModel
+
+
+class Migration(DynamoDBMigration):
+
+    model = TestDynamoModel
+
+    def transform(self, instance):
+        # Doubled items are marked, therefore the migration can be applied more times (e.g. when it is resumed)
+        if instance.bool or instance.string == 'doubled':
+            return None
+        instance.number *= 2
+        instance.string = 'doubled'
+        return instance
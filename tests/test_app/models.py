@@ -1,5 +1,8 @@
+from pynamodb.constants import STREAM_NEW_AND_OLD_IMAGE
 from pynamodb.indexes import AllProjection, GlobalSecondaryIndex
 
+from pydjamodb.aggregates import Count, Max, Min, Sum
+from pydjamodb.attributes import CompressedJSONAttribute, StringJoinAttribute
 from pydjamodb.models import DynamoModel
 from pydjamodb.queryset import DynamoDBManager
 from pynamodb.attributes import (
@@ -23,9 +26,50 @@ class TestDynamoModel(DynamoModel):
     string = UnicodeAttribute(null=True)
     number = NumberAttribute()
     bool = BooleanAttribute()
+    data = CompressedJSONAttribute(null=True)
 
     string_number_index = StringNumberIndex()
     objects_string_number = DynamoDBManager(index=string_number_index)
 
     class Meta:
         table_name = 'pydjamodbtest'
+
+
+class TestStringJoinDynamoModel(DynamoModel):
+
+    id = UnicodeAttribute(hash_key=True)
+    key = StringJoinAttribute(
+        fields=(UnicodeAttribute(), NumberAttribute(), UnicodeAttribute()), escape_char='\\', range_key=True
+    )
+
+    class Meta:
+        table_name = 'pydjamodbstringjointest'
+
+
+class TestStreamDynamoModel(DynamoModel):
+
+    id = UnicodeAttribute(hash_key=True)
+    number = NumberAttribute()
+
+    class Meta:
+        table_name = 'pydjamodbstreamtest'
+        stream_view_type = STREAM_NEW_AND_OLD_IMAGE
+
+
+class TestAggregateDynamoModel(DynamoModel):
+
+    id = UnicodeAttribute(hash_key=True)
+    key = StringJoinAttribute(fields=(UnicodeAttribute(), NumberAttribute()), range_key=True)
+    number = NumberAttribute(null=True)
+
+    class Meta:
+        table_name = 'pydjamodbaggregatetest'
+        aggregates = (
+            Count(),
+            Count('number'),
+            Sum('number'),
+            Min('number'),
+            Max('number'),
+            Count(range_key_prefix=1),
+            Sum('number', range_key_prefix=1),
+        )
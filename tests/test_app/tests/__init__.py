@@ -1,17 +1,148 @@
+import gzip
+import json
+import os
 import random
+import time
+import unittest
 
 import string
+import subprocess
+import sys
+import tempfile
+import threading
 
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
 from django.utils.timezone import now
 
 from germanium.test_cases.default import GermaniumTestCase
 from germanium.tools import assert_equal, assert_raises, assert_true, assert_false
 
+from io import StringIO
+from unittest import mock
 from uuid import uuid4
 
-from test_app.models import TestDynamoModel
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
-from pydjamodb.queryset import DynamoDBQuerySetError, MultipleObjectsReturned, ObjectDoesNotExist
+from botocore.exceptions import ClientError
+
+from pynamodb.exceptions import GetError, PutError, TableError
+from pynamodb.indexes import KeysOnlyProjection
+
+from test_app.dynamodb_migrations.double_number import Migration as DoubleNumberMigration
+from test_app.models import (
+    StringNumberIndex, TestAggregateDynamoModel, TestDynamoModel, TestStreamDynamoModel, TestStringJoinDynamoModel
+)
+
+from pydjamodb.aggregates import Count, DynamoDBAggregateError, Max, Min, STALE_ATTRIBUTE, Sum, rebuild_aggregates
+from pydjamodb.attributes import CompressedValue, COMPRESSION_NONE, COMPRESSION_ZLIB
+from pydjamodb.buffer import (
+    WriteBuffer, WriteBufferFlushError, buffered_writes, flush_write_buffers, stop_write_buffers
+)
+from pydjamodb.connection import TableConnection
+from pydjamodb.hedging import get_hedging_connection_class
+from pydjamodb.memory import MemoryConnection, MemoryDatabase, MemoryDatabaseError
+from pydjamodb.migration import DynamoDBMigration
+from pydjamodb.queryset import DynamoDBQuerySet, DynamoDBQuerySetError, MultipleObjectsReturned, ObjectDoesNotExist
+from pydjamodb.signals import dynamodb_items_changed
+from pydjamodb.streams import DynamoDBStreamConsumer
+from pydjamodb.test_cases import DynamoDBFixturesTestCaseMixin, load_dynamodb_fixture
+from pydjamodb.test_runner import (
+    _call_table_operation, _get_table_description, create_pynamodb_tables, get_test_connection,
+    is_pynamodb_table_schema_changed, recreate_pynamodb_tables, remove_pynamodb_tables, setup_kept_pynamodb_tables
+)
+from pydjamodb.utils import (
+    batch_get_items, batch_write_items, decode_raw_item, encode_raw_item, load_checkpoint, store_checkpoint
+)
+from pydjamodb.transaction import TransactionError, atomic, transact_get
+
+
+class BlockingMemoryConnection(MemoryConnection):
+    """
+    Blocked GetItem requests wait until they are released, therefore they are slower than any hedging delay.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.blocked_get_items = 0
+        self.get_item_count = 0
+        self.released = threading.Event()
+        self._lock = threading.Lock()
+
+    def _make_api_call(self, operation_name, operation_kwargs, *args, **kwargs):
+        if operation_name == 'GetItem':
+            with self._lock:
+                self.get_item_count += 1
+                blocked = self.blocked_get_items > 0
+                if blocked:
+                    self.blocked_get_items -= 1
+            if blocked:
+                self.released.wait(10)
+        return super()._make_api_call(operation_name, operation_kwargs, *args, **kwargs)
+
+
+class SplitShardStreamsClient:
+    """
+    Streams client with one closed and one open shard, the open shard is split after its first iterator is created.
+    """
+
+    def __init__(self):
+        self.shards = {
+            'closed': {'records': [self._get_record(1)], 'closed': True},
+            'parent': {'records': [self._get_record(2)], 'closed': False},
+        }
+
+    def _get_record(self, sequence_number):
+        return {
+            'eventName': 'INSERT',
+            'dynamodb': {'Keys': {'id': {'S': str(sequence_number)}}, 'SequenceNumber': str(sequence_number)},
+        }
+
+    def describe_stream(self, StreamArn, **kwargs):
+        return {'StreamDescription': {'Shards': [
+            dict(
+                {'ShardId': shard_id, 'SequenceNumberRange': dict(
+                    {'StartingSequenceNumber': shard['records'][0]['dynamodb']['SequenceNumber']},
+                    **({'EndingSequenceNumber': shard['records'][-1]['dynamodb']['SequenceNumber']}
+                       if shard['closed'] else {})
+                )},
+                **({'ParentShardId': shard['parent']} if 'parent' in shard else {})
+            )
+            for shard_id, shard in self.shards.items()
+        ]}}
+
+    def get_shard_iterator(self, StreamArn, ShardId, ShardIteratorType, SequenceNumber=None):
+        records = self.shards[ShardId]['records']
+        if ShardIteratorType == 'TRIM_HORIZON':
+            position = 0
+        elif ShardIteratorType == 'LATEST':
+            position = len(records)
+        else:
+            position = next(
+                (i for i, record in enumerate(records) if record['dynamodb']['SequenceNumber'] == SequenceNumber), -1
+            ) + 1
+        if ShardId == 'parent' and 'child' not in self.shards:
+            # New record is written to the parent shard and it is split after the consumer starts reading it
+            records.append(self._get_record(3))
+            self.shards['parent']['closed'] = True
+            self.shards['child'] = {'records': [self._get_record(4)], 'closed': False, 'parent': 'parent'}
+        return {'ShardIterator': '{}|{}'.format(ShardId, position)}
+
+    def get_records(self, ShardIterator, Limit):
+        shard_id, position = ShardIterator.split('|')
+        shard = self.shards[shard_id]
+        records = shard['records'][int(position):int(position) + Limit]
+        position = int(position) + len(records)
+        return {
+            'Records': records,
+            'NextShardIterator': None if shard['closed'] and position == len(shard['records'])
+            else '{}|{}'.format(shard_id, position)
+        }
 
 
 class PyDjamoDBTestCase(GermaniumTestCase):
@@ -128,3 +259,915 @@ class PyDjamoDBTestCase(GermaniumTestCase):
         TestDynamoModel.objects.set_hash_key('test').delete()
         assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 0)
         assert_equal(TestDynamoModel.objects.set_hash_key('another test').count(), 5)
+
+    def test_queryset_delete_should_delete_keys_concurrently_and_return_count(self):
+        with buffered_writes():
+            instances = self.create_test_dynamo_model_instances(id='test', count=300)
+        qs = TestDynamoModel.objects.set_hash_key('test')
+        assert_equal(qs.filter(date__lt=instances[10].date).delete(workers=2), 10)
+        assert_equal(qs.set_limit(40).delete(workers=2), 40)
+        assert_equal(TestDynamoModel.objects_string_number.set_hash_key('test 299').delete(), 1)
+        assert_equal(list(qs), instances[50:299])
+        assert_equal(qs.delete(workers=2), 249)
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 0)
+        assert_equal(qs.none().delete(), 0)
+
+    def test_atomic_should_write_items_after_block_is_left(self):
+        instances = [self.create_test_dynamo_model(id='test')]
+        with atomic(split=True):
+            for i in range(150):
+                TestDynamoModel(id='test', date=now(), number=i, bool=True).save()
+            instances[0].delete()
+            assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 1)
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 150)
+
+    def test_atomic_should_discard_items_if_exception_is_raised(self):
+        with assert_raises(RuntimeError):
+            with atomic():
+                TestDynamoModel(id='test', date=now(), number=1, bool=True).save()
+                raise RuntimeError
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 0)
+
+    def test_atomic_should_split_operations_of_the_same_item(self):
+        instance = self.create_test_dynamo_model(id='test', number=1)
+        with atomic(split=True):
+            instance.update(actions=[TestDynamoModel.number.set(2)])
+            instance.update(actions=[TestDynamoModel.number.add(3)])
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').get().number, 5)
+
+    def test_atomic_should_not_split_operations_without_split(self):
+        instance = self.create_test_dynamo_model(id='test', number=1)
+        with assert_raises(TransactionError):
+            with atomic():
+                TestDynamoModel(id='test', date=now(), number=2, bool=True).save()
+                instance.update(actions=[TestDynamoModel.number.set(2)])
+                instance.update(actions=[TestDynamoModel.number.add(3)])
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 1)
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').get().number, 1)
+
+    def test_nested_atomic_should_discard_operations_of_failed_block(self):
+        with atomic():
+            TestDynamoModel(id='test', date=now(), number=1, bool=True).save()
+            try:
+                with atomic():
+                    TestDynamoModel(id='test', date=now(), number=2, bool=True).save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            TestDynamoModel(id='test', date=now(), number=3, bool=True).save()
+        assert_equal(sorted(instance.number for instance in TestDynamoModel.objects.set_hash_key('test')), [1, 3])
+
+    def test_transact_get_should_return_instances(self):
+        instances = self.create_test_dynamo_model_instances(id='test')
+        assert_equal(
+            transact_get([(TestDynamoModel, 'test', instance.date) for instance in instances] + [
+                (TestDynamoModel, 'another test', now())
+            ]),
+            instances + [None]
+        )
+
+    def test_buffered_writes_should_coalesce_and_flush_items_after_block_is_left(self):
+        instance = self.create_test_dynamo_model(id='test', number=1)
+        with buffered_writes(flush_size=100, flush_interval=60) as write_buffer:
+            for i in range(30):
+                TestDynamoModel(id='test', date=now(), number=i, bool=True).save()
+            instance.number = 2
+            instance.save()
+            instance.number = 3
+            instance.save()
+            assert_equal(len(write_buffer), 31)
+            assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 1)
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 31)
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').get(date=instance.date).number, 3)
+
+    def test_buffered_writes_should_flush_items_in_background_after_size_is_reached(self):
+        with buffered_writes(flush_size=5, flush_interval=60) as write_buffer:
+            for i in range(5):
+                TestDynamoModel(id='test', date=now(), number=i, bool=True).save()
+            for _ in range(50):
+                if not len(write_buffer):
+                    break
+                time.sleep(0.1)
+            assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 5)
+
+    def test_buffered_writes_should_write_other_models_and_retry_failed_model_writes(self):
+        def failing_batch_write_items(connection, **kwargs):
+            if connection is TestDynamoModel._get_connection():
+                raise PutError('Batch write failed')
+            return batch_write_items(connection, **kwargs)
+
+        with buffered_writes(flush_size=100, flush_interval=60) as write_buffer:
+            for i in range(5):
+                TestDynamoModel(id='test', date=now(), number=i, bool=True).save()
+                TestStringJoinDynamoModel(id='test', key=('a', i, 'b')).save()
+            with mock.patch('pydjamodb.buffer.batch_write_items', failing_batch_write_items):
+                with assert_raises(WriteBufferFlushError):
+                    write_buffer.flush()
+            assert_equal(TestStringJoinDynamoModel.objects.set_hash_key('test').count(), 5)
+            assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 0)
+            assert_equal(len(write_buffer), 5)
+            assert_equal(write_buffer.failed_operations, [])
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 5)
+
+    def test_buffered_writes_should_record_failed_writes_when_buffer_is_stopped(self):
+        with mock.patch('pydjamodb.buffer.batch_write_items', side_effect=PutError('Batch write failed')):
+            with assert_raises(WriteBufferFlushError):
+                with buffered_writes(flush_size=100, flush_interval=60) as write_buffer:
+                    TestDynamoModel(id='test', date=now(), number=1, bool=True).save()
+                    TestStringJoinDynamoModel(id='test', key=('a', 1, 'b')).save()
+        assert_equal(len(write_buffer), 0)
+        assert_equal(
+            sorted((model_class.__name__, len(put_items), len(delete_items))
+                   for model_class, put_items, delete_items in write_buffer.failed_operations),
+            [('TestDynamoModel', 1, 0), ('TestStringJoinDynamoModel', 1, 0)]
+        )
+
+    def test_flush_write_buffers_should_log_failed_writes_instead_of_raising(self):
+        write_buffer = WriteBuffer(flush_size=100, flush_interval=60, max_retries=0)
+        with mock.patch('pydjamodb.buffer._default_write_buffer', write_buffer), \
+                mock.patch('pydjamodb.buffer.batch_write_items', side_effect=PutError('Batch write failed')):
+            write_buffer.save(TestDynamoModel(id='test', date=now(), number=1, bool=True))
+            with self.assertLogs('pydjamodb.buffer', 'ERROR') as logs:
+                flush_write_buffers()
+            assert_equal(len(write_buffer.failed_operations), 1)
+            assert_true(any('TestDynamoModel were not written' in line for line in logs.output))
+
+            write_buffer.save(TestDynamoModel(id='test', date=now(), number=2, bool=True))
+            with self.assertLogs('pydjamodb.buffer', 'ERROR'):
+                stop_write_buffers()
+            assert_equal(len(write_buffer.failed_operations), 2)
+            assert_equal(len(write_buffer), 0)
+
+    def test_string_join_attribute_should_escape_separator(self):
+        attribute = TestStringJoinDynamoModel.key
+        assert_equal(attribute.serialize(('a||b', 1, 'c\\')), 'a\\|\\|b||1||c\\\\')
+        assert_equal(attribute.deserialize(attribute.serialize(('a||b', 1, 'c\\'))), ['a||b', 1, 'c\\'])
+        assert_equal(attribute.deserialize(attribute.serialize(('a|', 1, '|b'))), ['a|', 1, '|b'])
+        assert_equal(attribute.deserialize('a||1||b'), ['a', 1, 'b'])
+
+    def test_queryset_prefix_filter_should_return_items_with_key_prefix(self):
+        keys = [('a', 1, 'x'), ('a', 1, 'y'), ('a', 10, 'x'), ('a||1', 1, 'x'), ('ab', 1, 'x')]
+        for key in keys:
+            TestStringJoinDynamoModel(id='test', key=key).save()
+        qs = TestStringJoinDynamoModel.objects.set_hash_key('test')
+        assert_equal([instance.key for instance in qs.filter(key__prefix=('a',))], [
+            ['a', 10, 'x'], ['a', 1, 'x'], ['a', 1, 'y']
+        ])
+        assert_equal([instance.key for instance in qs.filter(key__prefix=('a', 1))], [['a', 1, 'x'], ['a', 1, 'y']])
+        assert_equal([instance.key for instance in qs.filter(key__prefix=('a', 1, 'y'))], [['a', 1, 'y']])
+        assert_equal([instance.key for instance in qs.filter(key__prefix=('a||1',))], [['a||1', 1, 'x']])
+        with assert_raises(ValueError):
+            TestStringJoinDynamoModel.key.prefix(('a', 1, 'y', 'z'))
+
+    def test_compressed_json_attribute_should_compress_large_values(self):
+        data = {'items': [{'id': i, 'name': 'item'} for i in range(100)]}
+        attribute = TestDynamoModel.data
+        assert_equal(attribute._compress(attribute._encode_value({'id': 1}))[0], COMPRESSION_NONE)
+        assert_equal(attribute._compress(attribute._encode_value(data))[0], COMPRESSION_ZLIB)
+        assert_true(len(attribute.serialize(data)) < len(attribute._encode_value(data)) / 5)
+
+        instance = self.create_test_dynamo_model(id='test', data=data)
+        loaded_instance = TestDynamoModel.objects.set_hash_key('test').get()
+        assert_true(isinstance(loaded_instance.attribute_values['data'], CompressedValue))
+        assert_equal(loaded_instance.data, data)
+        assert_equal(loaded_instance.attribute_values['data'], data)
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').get(date=instance.date).data, data)
+
+    def test_lazy_queryset_should_deserialize_attributes_on_first_access(self):
+        instances = self.create_test_dynamo_model_instances(id='test', data={'test': 1})
+        lazy_instances = list(TestDynamoModel.objects.set_hash_key('test').lazy())
+        assert_equal(lazy_instances, instances)
+        assert_equal(set(lazy_instances[0].attribute_values._raw_values), {'string', 'number', 'bool', 'data'})
+        assert_equal(lazy_instances[0].number, 0)
+        assert_equal(set(lazy_instances[0].attribute_values._raw_values), {'string', 'bool', 'data'})
+        assert_equal(
+            [(instance.string, instance.number, instance.bool, instance.data) for instance in lazy_instances],
+            [(instance.string, instance.number, instance.bool, instance.data) for instance in instances]
+        )
+        lazy_instances[1].number = 20
+        lazy_instances[1].save()
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').get(date=instances[1].date).number, 20)
+
+    def test_queryset_raw_should_return_raw_items(self):
+        instances = self.create_test_dynamo_model_instances(id='test')
+        qs = TestDynamoModel.objects.set_hash_key('test')
+        assert_equal(list(qs.raw()), [instance.serialize() for instance in instances])
+        assert_equal(list(qs.set_limit(3).raw()), [instance.serialize() for instance in instances[:3]])
+        assert_equal(list(qs.none().raw()), [])
+
+    def test_queryset_columnar_raw_should_return_decoded_columns(self):
+        instances = self.create_test_dynamo_model_instances(id='test', count=5)
+        instances += self.create_test_dynamo_model_instances(id='test', count=5, data={'test': 'x' * 1000})
+        columns = list(TestDynamoModel.objects.set_hash_key('test').raw(columnar=True))
+        assert_equal(len(columns), 1)
+        assert_equal(columns[0]['number'], [instance.number for instance in instances])
+        assert_equal(columns[0]['bool'], [instance.bool for instance in instances])
+        assert_equal(columns[0]['date'], [instance.date for instance in instances])
+        assert_equal(columns[0]['data'], [None] * 5 + [{'test': 'x' * 1000}] * 5)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_queryset_columnar_raw_should_return_numpy_number_columns(self):
+        self.create_test_dynamo_model_instances(id='test')
+        columns = next(TestDynamoModel.objects.set_hash_key('test').raw(columnar=True, use_numpy=True))
+        assert_equal(columns['number'].dtype, numpy.int64)
+        assert_equal(columns['number'].sum(), 45)
+
+        self.create_test_dynamo_model(id='test', number=2 ** 60 + 1)
+        columns = next(TestDynamoModel.objects.set_hash_key('test').raw(columnar=True, use_numpy=True))
+        assert_equal(columns['number'].max(), 2 ** 60 + 1)
+
+        self.create_test_dynamo_model(id='test', number=0.5)
+        columns = next(TestDynamoModel.objects.set_hash_key('test').raw(columnar=True, use_numpy=True))
+        assert_equal(columns['number'].dtype, numpy.float64)
+
+    def test_dynamodb_export_and_import_commands_should_copy_table_items(self):
+        instances = self.create_test_dynamo_model_instances(id='test', count=60, data={'test': 'data'})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'export.jsonl.gz')
+            checkpoint_path = os.path.join(tmp_dir, 'export.checkpoint')
+            call_command('dynamodb_export', 'TestDynamoModel', path, segments=3, page_size=7,
+                         checkpoint=checkpoint_path, stdout=StringIO())
+            export_size = os.path.getsize(path)
+            # Finished export is not repeated
+            call_command('dynamodb_export', 'TestDynamoModel', path, segments=3, page_size=7,
+                         checkpoint=checkpoint_path, stdout=StringIO())
+            assert_equal(os.path.getsize(path), export_size)
+
+            TestDynamoModel.objects.set_hash_key('test').delete()
+            assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 0)
+
+            call_command('dynamodb_import', 'pydjamodbtest', path, workers=2, stdout=StringIO())
+            assert_equal(list(TestDynamoModel.objects.set_hash_key('test')), instances)
+            assert_equal(
+                [instance.data for instance in TestDynamoModel.objects.set_hash_key('test')],
+                [{'test': 'data'}] * 60
+            )
+
+    def test_dynamodb_export_and_import_commands_should_resume_interrupted_run(self):
+        instances = self.create_test_dynamo_model_instances(id='test', count=60)
+
+        def interrupt_on_call(function, call_number):
+            calls = []
+
+            def interrupted_function(*args, **kwargs):
+                calls.append(None)
+                if len(calls) == call_number:
+                    raise RuntimeError('Interrupted')
+                return function(*args, **kwargs)
+            return interrupted_function
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'export.jsonl.gz')
+            checkpoint_path = os.path.join(tmp_dir, 'export.checkpoint')
+            # Third page is written to the file but the checkpoint is not stored
+            with mock.patch('pydjamodb.management.commands.dynamodb_export.store_checkpoint',
+                            interrupt_on_call(store_checkpoint, 3)):
+                with assert_raises(RuntimeError):
+                    call_command('dynamodb_export', 'TestDynamoModel', path, segments=1, page_size=7,
+                                 checkpoint=checkpoint_path, stdout=StringIO())
+            assert_equal(load_checkpoint(checkpoint_path)['count'], 14)
+            call_command('dynamodb_export', 'TestDynamoModel', path, segments=1, page_size=7,
+                         checkpoint=checkpoint_path, stdout=StringIO())
+            with gzip.open(path, 'rt') as f:
+                assert_equal(len(f.readlines()), 60)
+
+            TestDynamoModel.objects.set_hash_key('test').delete()
+            import_checkpoint_path = os.path.join(tmp_dir, 'import.checkpoint')
+            with mock.patch('pydjamodb.management.commands.dynamodb_import.batch_write_items',
+                            interrupt_on_call(batch_write_items, 2)):
+                with assert_raises(RuntimeError):
+                    call_command('dynamodb_import', 'TestDynamoModel', path, workers=1,
+                                 checkpoint=import_checkpoint_path, stdout=StringIO())
+            assert_equal(load_checkpoint(import_checkpoint_path)['count'], 25)
+            call_command('dynamodb_import', 'TestDynamoModel', path, workers=1, checkpoint=import_checkpoint_path,
+                         stdout=StringIO())
+            assert_equal(list(TestDynamoModel.objects.set_hash_key('test')), instances)
+
+    def test_encode_raw_item_should_encode_nested_binary_values(self):
+        item = {
+            'id': {'S': 'test'},
+            'data': {'M': {'value': {'B': b'\x00\x01'}, 'values': {'L': [{'B': b'\x02'}, {'BS': [b'\x03']}]}}},
+            'list': {'L': [{'M': {'value': {'B': b'\x04'}}}, {'N': '1'}]},
+        }
+        assert_equal(decode_raw_item(json.loads(json.dumps(encode_raw_item(item)))), item)
+
+    def test_dynamodb_migrate_command_should_update_transformed_items(self):
+        self.create_test_dynamo_model_instances(id='test', count=40)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = os.path.join(tmp_dir, 'migration.checkpoint')
+            call_command('dynamodb_migrate', 'test_app', 'double_number', segments=3, page_size=7, batch_size=5,
+                         checkpoint=checkpoint_path, stdout=StringIO())
+            # Finished migration is not repeated
+            call_command('dynamodb_migrate', 'test_app', 'double_number', segments=3, page_size=7, batch_size=5,
+                         checkpoint=checkpoint_path, stdout=StringIO())
+
+            # Migration started again from the beginning does not change migrated items
+            call_command('dynamodb_migrate', 'test_app', 'double_number', batch_size=500, stdout=StringIO())
+
+        instances = list(TestDynamoModel.objects.set_hash_key('test'))
+        assert_equal([instance.number for instance in instances], [i * 2 if i % 2 == 0 else i for i in range(40)])
+        assert_equal(
+            [instance.string for instance in instances],
+            ['doubled' if i % 2 == 0 else 'test {}'.format(i) for i in range(40)]
+        )
+
+    def test_dynamodb_migrate_command_should_not_hide_migration_import_errors(self):
+        with assert_raises(CommandError):
+            call_command('dynamodb_migrate', 'test_app', 'missing_migration', stdout=StringIO())
+        with mock.patch('pydjamodb.management.commands.dynamodb_migrate.import_module',
+                        side_effect=ModuleNotFoundError("No module named 'missing_library'", name='missing_library')):
+            with assert_raises(ModuleNotFoundError):
+                call_command('dynamodb_migrate', 'test_app', 'double_number', stdout=StringIO())
+
+    def test_dynamodb_migration_should_reread_changed_items(self):
+        instance = self.create_test_dynamo_model(id='test', number=5, bool=False)
+        raw_item = TestDynamoModel._get_connection().get_item(
+            *instance._get_hash_range_key_serialized_values()
+        )['Item']
+        instance.number = 7
+        instance.save()
+
+        migration = DoubleNumberMigration()
+        migration.migrate_page([raw_item])
+        assert_equal(TestDynamoModel.get('test', instance.date).number, 14)
+        assert_equal(migration.stats, {'updated': 1, 'skipped': 0, 'conflicts': 1})
+
+    def test_dynamodb_migration_should_count_capacity_of_failed_writes(self):
+        instance = self.create_test_dynamo_model(id='test', number=5, bool=False)
+        raw_item = TestDynamoModel._get_connection().get_item(
+            *instance._get_hash_range_key_serialized_values()
+        )['Item']
+        instance.number = 7
+        instance.save()
+
+        migration = DoubleNumberMigration()
+        with mock.patch.object(migration, '_capacity_limiter') as capacity_limiter:
+            migration.migrate_page([raw_item])
+        # Cancelled transaction consumes two write units, failed conditional update one write unit
+        assert_equal(capacity_limiter.acquire.call_args_list[:2], [mock.call(2), mock.call(1)])
+
+    def test_dynamodb_migration_should_compare_scanned_raw_values(self):
+        instance = self.create_test_dynamo_model(id='test', number=5, bool=False)
+        # Number is not serialized back to the same string by the model
+        raw_item = dict(instance.serialize(), number={'N': '5.00'})
+        connection = TestDynamoModel._get_connection()
+        connection.put_item(*instance._get_hash_range_key_serialized_values(), attributes=raw_item)
+
+        migration = DoubleNumberMigration()
+        _, _, condition = migration._get_update(raw_item)
+        values = {}
+        condition.serialize({}, values)
+        assert_true({'N': '5.00'} in values.values())
+
+        migration.migrate_page([raw_item])
+        assert_equal(TestDynamoModel.get('test', instance.date).number, 10)
+        assert_equal(migration.stats, {'updated': 1, 'skipped': 0, 'conflicts': 0})
+
+    def test_memory_database_should_query_index_and_apply_updates(self):
+        database = MemoryDatabase()
+        database.execute('CreateTable', {
+            'TableName': 'test',
+            'AttributeDefinitions': [
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'group', 'AttributeType': 'S'},
+                {'AttributeName': 'number', 'AttributeType': 'N'},
+            ],
+            'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            'GlobalSecondaryIndexes': [{
+                'IndexName': 'group_number',
+                'KeySchema': [
+                    {'AttributeName': 'group', 'KeyType': 'HASH'},
+                    {'AttributeName': 'number', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'KEYS_ONLY'},
+            }],
+        })
+        for i in range(10):
+            database.execute('PutItem', {
+                'TableName': 'test',
+                'Item': {'id': {'S': str(i)}, 'group': {'S': 'a' if i % 2 else 'b'}, 'number': {'N': str(i)}},
+            })
+        data = database.execute('Query', {
+            'TableName': 'test',
+            'IndexName': 'group_number',
+            'KeyConditionExpression': '#0 = :0 AND #1 BETWEEN :1 AND :2',
+            'ExpressionAttributeNames': {'#0': 'group', '#1': 'number'},
+            'ExpressionAttributeValues': {':0': {'S': 'a'}, ':1': {'N': '3'}, ':2': {'N': '7'}},
+            'ScanIndexForward': False,
+        })
+        assert_equal([item['id']['S'] for item in data['Items']], ['7', '5', '3'])
+
+        data = database.execute('UpdateItem', {
+            'TableName': 'test',
+            'Key': {'id': {'S': '1'}},
+            'UpdateExpression': 'SET #1 = #1 + :0, #2 = list_append(if_not_exists(#2, :1), :2) ADD #3 :3',
+            'ConditionExpression': 'attribute_exists (#0) AND #1 < :4',
+            'ExpressionAttributeNames': {'#0': 'id', '#1': 'number', '#2': 'list', '#3': 'set'},
+            'ExpressionAttributeValues': {
+                ':0': {'N': '1.5'}, ':1': {'L': []}, ':2': {'L': [{'S': 'x'}]}, ':3': {'SS': ['y']}, ':4': {'N': '2'}
+            },
+            'ReturnValues': 'ALL_NEW',
+        })
+        assert_equal(data['Attributes']['number'], {'N': '2.5'})
+        assert_equal(data['Attributes']['list'], {'L': [{'S': 'x'}]})
+        assert_equal(data['Attributes']['set'], {'SS': ['y']})
+
+        with assert_raises(MemoryDatabaseError):
+            database.execute('DeleteItem', {
+                'TableName': 'test',
+                'Key': {'id': {'S': '1'}},
+                'ConditionExpression': '#0 < :0',
+                'ExpressionAttributeNames': {'#0': 'number'},
+                'ExpressionAttributeValues': {':0': {'N': '2'}},
+            })
+
+    def test_memory_database_should_reject_transaction_with_multiple_operations_on_one_item(self):
+        database = MemoryDatabase()
+        database.execute('CreateTable', {
+            'TableName': 'test',
+            'AttributeDefinitions': [{'AttributeName': 'id', 'AttributeType': 'S'}],
+            'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        })
+        with assert_raises(MemoryDatabaseError) as context:
+            database.execute('TransactWriteItems', {
+                'TransactItems': [
+                    {'Put': {'TableName': 'test', 'Item': {'id': {'S': '1'}, 'number': {'N': '1'}}}},
+                    {'Put': {'TableName': 'test', 'Item': {'id': {'S': '2'}}}},
+                    {'Delete': {'TableName': 'test', 'Key': {'id': {'S': '1'}}}},
+                ],
+            })
+        assert_equal(context.exception.code, 'ValidationException')
+        assert_equal(database.execute('Scan', {'TableName': 'test'})['Items'], [])
+
+    def test_call_table_operation_should_stop_repeating_rejected_operation_after_timeout(self):
+        error = TableError(cause=ClientError({'Error': {'Code': 'LimitExceededException'}}, 'CreateTable'))
+        operation = mock.Mock(side_effect=[error, error, 'created'])
+        assert_equal(_call_table_operation(operation, timeout=10), 'created')
+
+        operation = mock.Mock(side_effect=error)
+        with assert_raises(TableError):
+            _call_table_operation(operation, timeout=0.2)
+        assert_true(operation.call_count > 1)
+
+    def test_recreate_and_remove_pynamodb_tables_should_process_tables_concurrently(self):
+        model_connections = [
+            (model_class, get_test_connection(model_class, prefix))
+            for prefix in ('extra1', 'extra2') for model_class in (TestDynamoModel, TestStringJoinDynamoModel)
+        ]
+        recreate_pynamodb_tables(model_connections)
+        assert_true(all(connection.exists_table() for _, connection in model_connections))
+        remove_pynamodb_tables(model_connections)
+        assert_false(any(connection.exists_table() for _, connection in model_connections))
+
+    def test_setup_kept_pynamodb_tables_should_truncate_tables_and_recreate_changed_tables(self):
+        kept_model_connection = (TestDynamoModel, get_test_connection(TestDynamoModel, 'kept'))
+        changed_model_connection = (TestDynamoModel, get_test_connection(TestDynamoModel, 'changed'))
+        missing_model_connection = (
+            TestStringJoinDynamoModel, get_test_connection(TestStringJoinDynamoModel, 'missing')
+        )
+        model_connections = [kept_model_connection, changed_model_connection, missing_model_connection]
+
+        create_pynamodb_tables([kept_model_connection, (TestStringJoinDynamoModel, changed_model_connection[1])])
+        batch_write_items(kept_model_connection[1], put_items=[
+            TestDynamoModel(id=str(i), date=now(), number=i, bool=True).serialize() for i in range(30)
+        ])
+        try:
+            assert_equal(
+                setup_kept_pynamodb_tables(model_connections),
+                ([kept_model_connection], [missing_model_connection, changed_model_connection])
+            )
+            assert_equal(kept_model_connection[1].scan()['Items'], [])
+            assert_false(
+                is_pynamodb_table_schema_changed(TestDynamoModel, changed_model_connection[1].describe_table())
+            )
+        finally:
+            remove_pynamodb_tables(model_connections)
+
+    def test_is_pynamodb_table_schema_changed_should_compare_stream_and_ttl(self):
+        model_connection = (TestStreamDynamoModel, get_test_connection(TestStreamDynamoModel, 'stream'))
+        create_pynamodb_tables([model_connection])
+        try:
+            description = _get_table_description(model_connection[1])
+            assert_false(is_pynamodb_table_schema_changed(TestStreamDynamoModel, description))
+
+            assert_true(is_pynamodb_table_schema_changed(
+                TestStreamDynamoModel,
+                dict(description, StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'KEYS_ONLY'})
+            ))
+            assert_true(is_pynamodb_table_schema_changed(
+                TestStreamDynamoModel, {k: v for k, v in description.items() if k != 'StreamSpecification'}
+            ))
+            assert_true(is_pynamodb_table_schema_changed(
+                TestStreamDynamoModel,
+                dict(description, TimeToLiveDescription={'TimeToLiveStatus': 'ENABLED', 'AttributeName': 'ttl'})
+            ))
+        finally:
+            remove_pynamodb_tables([model_connection])
+
+    def test_post_test_clean_should_remove_only_written_items(self):
+        self.create_test_dynamo_model_instances(id='test', count=30)
+        instance = TestDynamoModel(id='not tracked', date=now(), number=1, bool=True)
+        connection = TestDynamoModel._get_connection()
+        args, kwargs = instance._get_save_args()
+        connection._wrapped_connection.put_item(*args, **kwargs)
+        assert_equal(len(connection._written_keys), 30)
+
+        connection.post_test_clean(TestDynamoModel)
+        assert_equal(connection._written_keys, set())
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 0)
+        assert_equal(TestDynamoModel.objects.set_hash_key('not tracked').count(), 1)
+        instance.delete()
+
+    def test_model_definition_should_not_read_settings_or_import_optional_libraries(self):
+        code = '\n'.join((
+            'import sys',
+            'from django.conf import settings',
+            'from pynamodb.attributes import UnicodeAttribute',
+            'from pydjamodb.models import DynamoModel',
+            'class ImportTestDynamoModel(DynamoModel):',
+            '    id = UnicodeAttribute(hash_key=True)',
+            '    class Meta:',
+            '        table_name = "importtest"',
+            'assert not settings.configured',
+            'assert not {"numpy", "zstandard", "pydjamodb.connection"} & set(sys.modules), sorted(sys.modules)',
+        ))
+        env = {k: v for k, v in os.environ.items() if k != 'DJANGO_SETTINGS_MODULE'}
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, stderr=subprocess.PIPE)
+        output = result.stderr.decode()
+        assert_equal(result.returncode, 0, output)
+
+        # Import profile contains all modules imported by the model definition (even if they were removed later)
+        imported_modules = {
+            line.split('|')[-1].strip() for line in output.splitlines()
+            if line.startswith('import time:') and not line.endswith('imported package')
+        }
+        assert_true('pydjamodb.models' in imported_modules)
+        assert_false(
+            {module for module in imported_modules if module.split('.')[0] in {'numpy', 'zstandard'}}
+            | {'pydjamodb.connection'} & imported_modules
+        )
+
+    def test_hedged_reads_and_adaptive_timeouts_should_resend_slow_requests(self):
+        database_settings = dict(
+            settings.PYDJAMODB_DATABASE, HEDGED_READS=True, HEDGE_MIN_DELAY=0.02, ADAPTIVE_TIMEOUTS=True,
+            ADAPTIVE_TIMEOUT_MIN=0.1, LATENCY_MIN_SAMPLES=10
+        )
+        with override_settings(PYDJAMODB_DATABASE=database_settings):
+            connection = get_hedging_connection_class(BlockingMemoryConnection)(host='hedging', max_retry_attempts=1)
+        connection.create_table(
+            'hedging', attribute_definitions=[{'attribute_name': 'id', 'attribute_type': 'S'}],
+            key_schema=[{'attribute_name': 'id', 'key_type': 'HASH'}], billing_mode='PAY_PER_REQUEST'
+        )
+        try:
+            connection.put_item('hedging', 'test', attributes={'value': {'S': 'test'}})
+            for _ in range(10):
+                connection.get_item('hedging', 'test')
+
+            # The hedged request is sent if the response is slower than the latency percentile
+            connection.blocked_get_items, connection.get_item_count = 1, 0
+            assert_equal(connection.get_item('hedging', 'test')['Item']['value'], {'S': 'test'})
+            assert_true(connection.get_item_count >= 2)
+            # Only latency of the used response is recorded
+            assert_equal(connection.latency_tracker._counts['GetItem'], 11)
+
+            # Request is repeated after the adaptive timeout if the hedged request is slow too
+            connection.blocked_get_items, connection.get_item_count = 2, 0
+            assert_equal(connection.get_item('hedging', 'test')['Item']['value'], {'S': 'test'})
+            assert_true(connection.get_item_count >= 3)
+            assert_equal(connection.latency_tracker._counts['GetItem'], 12)
+
+            connection.blocked_get_items = 3
+            with assert_raises(GetError):
+                connection.get_item('hedging', 'test')
+
+            # Request is sent directly without hedging if the thread pool is saturated
+            with mock.patch('pydjamodb.hedging.submit_hedging_request', return_value=None):
+                assert_equal(connection.get_item('hedging', 'test')['Item']['value'], {'S': 'test'})
+        finally:
+            connection.released.set()
+            connection.delete_table('hedging')
+
+    def test_dynamodb_stream_consumer_command_should_send_changed_items(self):
+        prefix = str(uuid4())
+        instances = [TestStreamDynamoModel(id='{}-{}'.format(prefix, i), number=i) for i in range(10)]
+        for instance in instances:
+            instance.save()
+        instances[0].number = 100
+        instances[0].save()
+        instances[1].delete()
+
+        received_changes = []
+
+        def receiver(sender, changes, **kwargs):
+            received_changes.extend(change for change in changes if change.keys['id']['S'].startswith(prefix))
+
+        dynamodb_items_changed.connect(receiver, sender=TestStreamDynamoModel)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                checkpoint_path = os.path.join(tmp_dir, 'stream.checkpoint')
+                call_command('dynamodb_stream_consumer', 'TestStreamDynamoModel', checkpoint=checkpoint_path,
+                             once=True, stdout=StringIO())
+                assert_equal(
+                    sorted(change.event_name for change in received_changes), ['INSERT'] * 10 + ['MODIFY', 'REMOVE']
+                )
+                modify_change = next(change for change in received_changes if change.event_name == 'MODIFY')
+                assert_equal(modify_change.old_item['number'], {'N': '0'})
+                assert_equal(TestStreamDynamoModel.from_raw_data(modify_change.new_item).number, 100)
+
+                # Consumer continues from the checkpoint
+                del received_changes[:]
+                call_command('dynamodb_stream_consumer', 'TestStreamDynamoModel', checkpoint=checkpoint_path,
+                             once=True, stdout=StringIO())
+                assert_equal(received_changes, [])
+
+                instances[2].delete()
+                call_command('dynamodb_stream_consumer', 'TestStreamDynamoModel', checkpoint=checkpoint_path,
+                             once=True, stdout=StringIO())
+                assert_equal(
+                    [(change.event_name, change.keys) for change in received_changes],
+                    [('REMOVE', {'id': {'S': instances[2].id}})]
+                )
+        finally:
+            dynamodb_items_changed.disconnect(receiver, sender=TestStreamDynamoModel)
+
+    def test_dynamodb_stream_consumer_command_should_wait_for_shard_readers_when_interrupted(self):
+        TestStreamDynamoModel(id=str(uuid4()), number=1).save()
+        receiver_started = threading.Event()
+        finished_receivers = []
+
+        def receiver(sender, changes, **kwargs):
+            receiver_started.set()
+            time.sleep(0.2)
+            finished_receivers.append(threading.current_thread())
+
+        get_shards = DynamoDBStreamConsumer._get_shards
+
+        def interrupted_get_shards(consumer):
+            # Command is interrupted while the receiver is processing the page
+            if receiver_started.is_set():
+                raise KeyboardInterrupt
+            return get_shards(consumer)
+
+        dynamodb_items_changed.connect(receiver, sender=TestStreamDynamoModel)
+        try:
+            with mock.patch.object(DynamoDBStreamConsumer, '_get_shards', interrupted_get_shards), \
+                    mock.patch('pydjamodb.streams.close_old_connections') as close_old_connections:
+                call_command('dynamodb_stream_consumer', 'TestStreamDynamoModel', poll_interval=0.05,
+                             stdout=StringIO())
+            assert_true(finished_receivers)
+            assert_false(any(thread.is_alive() for thread in finished_receivers))
+            assert_true(close_old_connections.called)
+        finally:
+            dynamodb_items_changed.disconnect(receiver, sender=TestStreamDynamoModel)
+
+    def test_dynamodb_stream_consumer_should_read_only_initial_shards_from_latest_record(self):
+        received_sequence_numbers = []
+
+        def receiver(sender, changes, **kwargs):
+            received_sequence_numbers.extend(change.sequence_number for change in changes)
+
+        dynamodb_items_changed.connect(receiver, sender=TestStreamDynamoModel)
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir, \
+                    mock.patch('pydjamodb.connection.TableConnection.get_streams_client',
+                               return_value=SplitShardStreamsClient()):
+                checkpoint_path = os.path.join(tmp_dir, 'stream.checkpoint')
+                DynamoDBStreamConsumer(
+                    TestStreamDynamoModel, checkpoint_path=checkpoint_path, start_from_latest=True
+                ).run(once=True)
+                checkpoint = load_checkpoint(checkpoint_path)
+            # Closed shard is skipped, the initial shard is read from the latest record and its child from the oldest
+            assert_equal(received_sequence_numbers, ['3', '4'])
+            assert_equal(checkpoint['latest_shard_ids'], ['parent'])
+            assert_equal(checkpoint['shards'], {
+                'closed': {'done': True},
+                'parent': {'sequence_number': '3', 'done': True},
+                'child': {'sequence_number': '4'},
+            })
+        finally:
+            dynamodb_items_changed.disconnect(receiver, sender=TestStreamDynamoModel)
+
+    def test_model_aggregates_should_be_maintained_on_write_and_read_with_one_request(self):
+        hash_key = str(uuid4())
+        for category, offset in (('a', 0), ('b', 10)):
+            for i in range(5):
+                TestAggregateDynamoModel(id=hash_key, key=(category, i), number=offset + i).save()
+        TestAggregateDynamoModel(id=hash_key, key=('c', 0)).save()
+
+        queryset = TestAggregateDynamoModel.objects.set_hash_key(hash_key)
+        number_aggregates = (Count('number'), Sum('number'), Min('number'), Max('number'))
+
+        def precomputed():
+            # Items are not queried if aggregates are precomputed
+            return mock.patch.multiple(
+                TestAggregateDynamoModel, query=mock.Mock(side_effect=AssertionError),
+                count=mock.Mock(side_effect=AssertionError)
+            )
+
+        with precomputed():
+            assert_equal(queryset.count(), 11)
+            assert_equal(
+                queryset.aggregate(*number_aggregates),
+                {'number__count': 10, 'number__sum': 70, 'number__min': 0, 'number__max': 14}
+            )
+            assert_equal(queryset.filter(key__prefix=('a',)).aggregate(Count(), total=Sum('number')),
+                         {'count': 5, 'total': 10})
+            assert_equal(queryset.filter(key__prefix=('b',)).count(), 5)
+        # Items are queried if the aggregate item does not exist
+        assert_equal(TestAggregateDynamoModel.objects.set_hash_key(str(uuid4())).count(), 0)
+
+        # Aggregates which are not precomputed for the query are computed from the items
+        assert_equal(queryset.filter(key__startswith='a').aggregate(Count(), Max('number')),
+                     {'count': 5, 'number__max': 4})
+        assert_equal(queryset.set_limit(3).count(), 3)
+
+        # Minimum is recomputed after the item with the minimal value is changed
+        item = queryset.filter(key__prefix=('a', 0)).get()
+        item.number = 5
+        item.save()
+        assert_equal(queryset.aggregate(Min('number'), Sum('number')), {'number__min': 1, 'number__sum': 75})
+        with precomputed():
+            assert_equal(queryset.aggregate(Min('number')), {'number__min': 1})
+
+        assert_equal(queryset.filter(key__prefix=('b',)).delete(), 5)
+        assert_equal(queryset.aggregate(*number_aggregates),
+                     {'number__count': 5, 'number__sum': 15, 'number__min': 1, 'number__max': 5})
+        with precomputed():
+            assert_equal(queryset.count(), 6)
+            assert_equal(queryset.filter(key__prefix=('b',)).aggregate(Count(), Sum('number')),
+                         {'count': 0, 'number__sum': 0})
+
+        with assert_raises(DynamoDBAggregateError):
+            item.update(actions=[TestAggregateDynamoModel.number.set(1)])
+        with assert_raises(DynamoDBAggregateError):
+            with atomic():
+                item.save()
+        with assert_raises(DynamoDBAggregateError):
+            TestAggregateDynamoModel.batch_write()
+
+        # Items written without the model are added to aggregates with rebuild
+        batch_write_items(
+            TestAggregateDynamoModel._get_connection(),
+            put_items=[TestAggregateDynamoModel(id=hash_key, key=('d', 0), number=-1).serialize()]
+        )
+        rebuild_aggregates(TestAggregateDynamoModel, hash_key)
+        with precomputed():
+            assert_equal(queryset.count(), 7)
+            assert_equal(queryset.aggregate(*number_aggregates),
+                         {'number__count': 6, 'number__sum': 14, 'number__min': -1, 'number__max': 5})
+            assert_equal(queryset.filter(key__prefix=('d',)).count(), 1)
+        # Aggregate item of the group without items is removed by the rebuild, items are queried
+        assert_equal(queryset.filter(key__prefix=('b',)).count(), 0)
+
+    def test_model_aggregates_should_not_store_recomputed_value_changed_during_recomputation(self):
+        hash_key = str(uuid4())
+        instances = [TestAggregateDynamoModel(id=hash_key, key=('a', i), number=i) for i in range(5)]
+        for instance in instances:
+            instance.save()
+        queryset = TestAggregateDynamoModel.objects.set_hash_key(hash_key)
+        instances[0].number = 10
+        instances[0].save()
+
+        compute_aggregates = DynamoDBQuerySet._compute_aggregates
+
+        def compute_aggregates_with_concurrent_save(queryset, aggregates):
+            values = compute_aggregates(queryset, aggregates)
+            TestAggregateDynamoModel(id=hash_key, key=('b', 0), number=-5).save()
+            return values
+
+        with mock.patch.object(DynamoDBQuerySet, '_compute_aggregates', compute_aggregates_with_concurrent_save):
+            assert_equal(queryset.aggregate(Min('number')), {'number__min': 1})
+        # Outdated recomputed value was not stored
+        assert_equal(queryset.aggregate(Min('number')), {'number__min': -5})
+        with mock.patch.object(TestAggregateDynamoModel, 'query', side_effect=AssertionError):
+            assert_equal(queryset.aggregate(Min('number')), {'number__min': -5})
+
+    def test_model_aggregates_should_be_marked_stale_if_update_fails(self):
+        hash_key = str(uuid4())
+        for i in range(5):
+            TestAggregateDynamoModel(id=hash_key, key=('a', i), number=i).save()
+        queryset = TestAggregateDynamoModel.objects.set_hash_key(hash_key)
+
+        update_item = TableConnection.update_item
+
+        def failing_update_item(connection, *args, actions=None, **kwargs):
+            # Only the stale mark is written
+            if STALE_ATTRIBUTE not in str(actions):
+                raise RuntimeError('Aggregates update failed')
+            return update_item(connection, *args, actions=actions, **kwargs)
+
+        with mock.patch.object(TableConnection, 'update_item', failing_update_item), \
+                self.assertLogs('pydjamodb.aggregates'):
+            TestAggregateDynamoModel(id=hash_key, key=('a', 5), number=10).save()
+        # Stale aggregates are computed from the items
+        with mock.patch.object(TestAggregateDynamoModel, 'query', side_effect=AssertionError):
+            with assert_raises(AssertionError):
+                queryset.aggregate(Sum('number'))
+        assert_equal(queryset.aggregate(Count(), Sum('number'), Max('number')),
+                     {'count': 6, 'number__sum': 20, 'number__max': 10})
+
+        rebuild_aggregates(TestAggregateDynamoModel, hash_key)
+        with mock.patch.object(TestAggregateDynamoModel, 'query', side_effect=AssertionError):
+            assert_equal(queryset.aggregate(Count(), Sum('number'), Max('number')),
+                         {'count': 6, 'number__sum': 20, 'number__max': 10})
+
+    def test_queryset_aggregate_should_read_attributes_not_projected_to_index_from_table(self):
+        index_string = str(uuid4())
+        for i in range(5):
+            self.create_test_dynamo_model(id='test', string=index_string, number=i, data={'i': i} if i % 2 else None)
+        queryset = TestDynamoModel.objects_string_number.set_hash_key(index_string)
+
+        with mock.patch('pydjamodb.queryset.batch_get_items', wraps=batch_get_items) as patched_batch_get_items:
+            assert_equal(queryset.aggregate(Count('data'), Sum('number')), {'data__count': 2, 'number__sum': 10})
+            assert_false(patched_batch_get_items.called)
+            with mock.patch.object(StringNumberIndex.Meta, 'projection', KeysOnlyProjection()):
+                assert_equal(queryset.aggregate(Count('data'), Sum('number')), {'data__count': 2, 'number__sum': 10})
+            assert_true(patched_batch_get_items.called)
+
+    def test_model_aggregates_should_be_updated_by_migration_fixtures_and_import(self):
+        hash_key = str(uuid4())
+        for i in range(5):
+            TestAggregateDynamoModel(id=hash_key, key=('a', i), number=i).save()
+        queryset = TestAggregateDynamoModel.objects.set_hash_key(hash_key)
+
+        class AggregateMigration(DynamoDBMigration):
+
+            model = TestAggregateDynamoModel
+
+            def transform(self, instance):
+                if instance.id != hash_key or instance.number >= 100:
+                    return None
+                instance.number += 100
+                return instance
+
+        migration = AggregateMigration()
+        raw_items = TestAggregateDynamoModel._get_connection().query(hash_key)['Items']
+        migration.migrate_page(raw_items[:3])
+        # Batch of the conflicting items is updated item by item
+        migration.migrate_page(raw_items)
+
+        def assert_aggregates(expected_values):
+            with mock.patch.object(TestAggregateDynamoModel, 'query', side_effect=AssertionError):
+                assert_equal(queryset.aggregate(Count(), Sum('number'), Max('number')), expected_values)
+
+        assert_aggregates({'count': 5, 'number__sum': 510, 'number__max': 104})
+
+        items = [
+            TestAggregateDynamoModel(id=hash_key, key=('b', i), number=i).serialize() for i in range(3)
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'aggregates.jsonl.gz')
+            with gzip.open(path, 'wt') as f:
+                for item in items:
+                    f.write(json.dumps(encode_raw_item(item)) + '\n')
+            call_command('dynamodb_import', 'TestAggregateDynamoModel', path, stdout=StringIO())
+            assert_aggregates({'count': 8, 'number__sum': 513, 'number__max': 104})
+
+            load_dynamodb_fixture(TestAggregateDynamoModel, path)
+            assert_aggregates({'count': 8, 'number__sum': 513, 'number__max': 104})
+
+
+class PyDjamoDBFixturesTestCase(DynamoDBFixturesTestCaseMixin, GermaniumTestCase):
+
+    dynamodb_fixtures = {
+        'TestDynamoModel': os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), 'fixtures', 'test_dynamo_model.jsonl'
+        )
+    }
+
+    @classmethod
+    def set_up_dynamodb_data(cls):
+        cls.instances = [
+            TestDynamoModel(id='test', date=now(), string='test {}'.format(i), number=i, bool=True)
+            for i in range(30)
+        ]
+        for instance in cls.instances:
+            instance.save()
+
+    def assert_dynamodb_data_loaded(self):
+        assert_equal(list(TestDynamoModel.objects.set_hash_key('test')), self.instances)
+        assert_equal(
+            [instance.string for instance in TestDynamoModel.objects.set_hash_key('fixture')],
+            ['fixture {}'.format(i) for i in range(5)]
+        )
+
+    def change_dynamodb_data(self):
+        self.instances[0].refresh()
+        self.instances[0].number = 100
+        self.instances[0].save()
+        self.instances[1].delete()
+        TestDynamoModel.objects.set_hash_key('fixture').delete()
+        TestDynamoModel(id='test', date=now(), number=1, bool=True).save()
+
+    def test_fixtures_should_be_loaded_and_restored_after_test(self):
+        self.assert_dynamodb_data_loaded()
+        self.change_dynamodb_data()
+        assert_equal(TestDynamoModel.objects.set_hash_key('fixture').count(), 0)
+        assert_equal(TestDynamoModel.objects.set_hash_key('test').count(), 30)
+
+        TestDynamoModel._get_connection().post_test_clean(TestDynamoModel)
+        self.assert_dynamodb_data_loaded()
+
+    def test_fixtures_should_be_restored_after_previous_test(self):
+        self.assert_dynamodb_data_loaded()
+        self.change_dynamodb_data()
@@ -123,6 +123,8 @@ USE_TZ = True
 STATIC_URL = "/static/"
 
 PYDJAMODB_DATABASE = {
+    # Tests can be run with the in-memory backend (PYDJAMODB_BACKEND=pydjamodb.memory.MemoryConnection)
+    'BACKEND': os.environ.get('PYDJAMODB_BACKEND'),
     'HOST': 'http://localhost:8000',
     'AWS_ACCESS_KEY_ID': '_',
     'AWS_SECRET_ACCESS_KEY': '_',